@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the static dimension analysis on a loop of an .imks script.
+
+The same cell is run by the standalone shell with and without the analysis:
+with the analysis, the additions and comparisons of the loop are proven and
+executed without the unit checks.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import standalone_shell, bench, report
+
+cell = """
+v = 0[m/s]
+x = 0[m]
+dv = 0.1[m/s]
+dt = 1[s]
+vmax = 50[m/s]
+n = 0
+for i in range(10000):
+    v = v + dv
+    if v > vmax:
+        v -= vmax
+        n += 1
+    x += v * dt
+"""
+
+
+def main():
+    from imks.config import config
+    shell = standalone_shell()
+    results = {}
+    for analysis in (False, True):
+        config["dimension_analysis"] = analysis
+        shell.run_cell(cell)
+        results[analysis] = (shell.locals["x"].value, shell.locals["n"])
+        report("loop, analysis %s" % ("on" if analysis else "off"),
+               bench(lambda: shell.run_cell(cell), number=3, repeat=3))
+    assert results[False] == results[True]
+    config["dimension_analysis"] = False
+
+
+if __name__ == "__main__":
+    main()
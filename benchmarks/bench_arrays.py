@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of numpy ufuncs applied to arrays with units.
+
+Units are checked once per ufunc call by Value.__array_ufunc__, so the
+overhead with respect to plain arrays should be constant.
+"""
+
+from __future__ import absolute_import, division, print_function
+import numpy as np
+from .common import standalone_shell, bench, report
+
+
+def main():
+    from imks.units import Value
+    standalone_shell()
+    for size in (10, 1000, 1000000):
+        a = np.linspace(1.0, 2.0, size)
+        b = np.linspace(2.0, 3.0, size)
+        x = Value(a, "m")
+        y = Value(b, "km")
+        t = Value(b, "s")
+        out = Value(np.empty(size), "m")
+        print("arrays of %d elements" % size)
+        cases = [("add", lambda: np.add(a, b), lambda: np.add(x, y)),
+                 ("add, out=", lambda: np.add(a, b, out=out.value),
+                  lambda: np.add(x, y, out=out)),
+                 ("divide", lambda: np.divide(a, b), lambda: np.divide(x, t)),
+                 ("sqrt", lambda: np.sqrt(a), lambda: np.sqrt(x)),
+                 ("add.reduce", lambda: np.add.reduce(a), lambda: np.add.reduce(x)),
+                 ("maximum.accumulate", lambda: np.maximum.accumulate(a),
+                  lambda: np.maximum.accumulate(x))]
+        for name, plain, quantity in cases:
+            report("  %s (plain)" % name, bench(plain))
+            report("  %s (units)" % name, bench(quantity))
+
+
+if __name__ == "__main__":
+    main()
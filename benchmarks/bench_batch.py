@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the batch evaluator (python -m imks eval).
+
+A file of conversions is evaluated in the current process and by worker
+processes; the times include the creation of the sessions.
+"""
+
+from __future__ import absolute_import, division, print_function
+import io
+import os
+import tempfile
+import time
+from .common import report
+
+lines = 5000
+
+
+def run(path, jobs):
+    from imks.batch import evaluate_stream
+    t0 = time.time()
+    evaluate_stream([path], fmt="jsonl", jobs=jobs, output=io.StringIO())
+    return time.time() - t0
+
+
+def main():
+    fd, path = tempfile.mkstemp(suffix=".imks")
+    try:
+        with os.fdopen(fd, "w") as f:
+            for n in range(lines):
+                f.write("%d[km/h] @ [m/s]\n" % n)
+        for jobs in (1, 2, 4):
+            report("eval, %d lines, %d jobs (per line)" % (lines, jobs),
+                   run(path, jobs) / lines)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
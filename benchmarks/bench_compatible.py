@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of Value.find_compatible, used by %compatible and set_units.
+
+The dimension index is compared with the former search, which solves a
+least-squares problem for every combination of units.  Since the former
+search is combinatorial in the number of units, the comparison uses the
+first units of the table; the index is then timed on the full table, with
+scripts/Astro.imks loaded.
+"""
+
+from __future__ import absolute_import, division, print_function
+import itertools
+import numpy as np
+from .common import standalone_shell, bench, report
+
+
+def find_compatible_scan(value, d, level=1):
+    """Reference implementation: least squares on all combinations."""
+    from imks import units
+    ks = d.keys()
+    u0 = value.unit.vector()
+    for c in itertools.combinations(ks, level):
+        mat = np.zeros(shape=(len(units.baseunits), level))
+        for l, cu in enumerate(c):
+            mat[:, l] = d[cu].unit.vector()
+        x, residuals, rank, sv = np.linalg.lstsq(mat, u0, rcond=None)
+        if np.sum(residuals) < 1e-7 and min(map(abs, x)) > 1e-5:
+            yield sum((units.UnitTree.simple(u, units.exponent(e))
+                       for u, e in zip(c, x) if e != 0), units.UnitTree())
+
+
+def main():
+    from imks import units
+    from collections import OrderedDict as ODict
+    standalone_shell("Astro")
+    value = units.Value(1.0, "J/m^3")
+    full = units.units
+    subset = ODict([(k, v) for k, v in full.items()
+                    if isinstance(v, units.Quantity)][:40])
+    print("%d units, %d in the subset" % (len(full), len(subset)))
+    for level in range(1, 5):
+        new = list(value.find_compatible(units.DimensionIndex(subset), level))
+        old = list(find_compatible_scan(value, subset, level))
+        for tree in new:
+            assert tree.to_value().unit == value.unit, tree
+        # The former search also accepts rank-deficient combinations,
+        # for which lstsq returns no residuals, even if they do not match
+        wrong = len([tree for tree in old if tree.to_value().unit != value.unit])
+        print("level %d: %d results (former search: %d, of which %d wrong)"
+              % (level, len(new), len(old), wrong))
+        number = 1 if level > 2 else None
+        report("  index, subset",
+               bench(lambda: list(value.find_compatible(subset, level)),
+                     number=number, repeat=3))
+        report("  former search, subset",
+               bench(lambda: list(find_compatible_scan(value, subset, level)),
+                     number=number, repeat=1 if level > 2 else 3))
+        report("  index, all units",
+               bench(lambda: list(value.find_compatible(full, level)),
+                     number=number, repeat=3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of loops using quantity literals, with and without constant pool.
+
+Each run executes a cell with a loop; the number of calls to the unit
+parser (cached or not) is counted by wrapping units.unit_parser.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import standalone_shell, bench, report
+
+cell = """
+E = 0[J]
+m = 2[kg]
+for i in range(%d):
+    E += 0.5*m*(3[m/s])**2 + 2[kg]*9.81[m/s^2]*10[m]
+"""
+
+
+def main(n=1000):
+    from imks import units
+    from imks.config import config
+    shell = standalone_shell()
+    parser = units.unit_parser
+    calls = [0]
+
+    def counting_parser(unit):
+        calls[0] += 1
+        return parser(unit)
+
+    units.unit_parser = counting_parser
+    try:
+        for pool in (False, True):
+            config["constant_pool"] = pool
+            name = "constant pool" if pool else "no constant pool"
+            calls[0] = 0
+            shell.run_cell(cell % n)
+            print("%-40s %10d" % ("%s: parser calls (%d loops)" % (name, n),
+                                  calls[0]))
+            report("%s: time per loop" % name,
+                   bench(lambda: shell.run_cell(cell % n), repeat=3) / n)
+    finally:
+        units.unit_parser = parser
+        config["constant_pool"] = True
+
+
+if __name__ == "__main__":
+    main()
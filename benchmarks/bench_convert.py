@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of unit conversions on large arrays.
+
+A cached converter is compared with the conversion through a unit system,
+which parses the unit and builds a new Value at each call.
+"""
+
+from __future__ import absolute_import, division, print_function
+import numpy as np
+from .common import standalone_shell, bench, report
+
+
+def main():
+    from imks import units
+    standalone_shell()
+    x = units.Value(np.random.rand(1000000), "m/s")
+    buf = np.empty_like(x.value)
+    system = units.System("km/h")
+    c = units.converter("m/s", "km/h")
+    np.testing.assert_allclose(c(x.value, out=buf), (x | system).value / 1000 * 3600)
+    report("System, 1e6 values",
+           bench(lambda: (x | units.System("km/h")).show(), repeat=3))
+    report("converter, 1e6 values",
+           bench(lambda: units.converter("m/s", "km/h")(x.value, out=buf), repeat=3))
+    report("converter, scalar", bench(lambda: c(3.0)))
+    report("converter lookup", bench(lambda: units.converter("m/s", "km/h")))
+    xs = [units.Value(float(n), "m/s") | units.System("km/h") for n in range(10000)]
+    report("str, 10k values in [km/h]", bench(lambda: [str(v) for v in xs], repeat=3))
+    xs = [units.Value(float(n), "m/s") | units.System('"c"') for n in range(10000)]
+    report("str, 10k values in [\"c\"]", bench(lambda: [str(v) for v in xs], repeat=3))
+    t = units.Value(300.0, "K", absolute=0.0)
+    report("show, absolute temperature",
+           bench(lambda: (t | units.System("Celsius")).show()))
+
+
+if __name__ == "__main__":
+    main()
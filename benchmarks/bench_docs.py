@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the documentation of numbers and tuples.
+
+The former make_object_w_doc created a new class for each documented object;
+the documentation is now held by instances of units.doc_types, with one class
+per built-in type.  For both methods the benchmark documents many floats and
+tuples, and reports the number of new classes, the memory allocated, and the
+time per object.
+"""
+
+from __future__ import absolute_import, division, print_function
+import gc
+import tracemalloc
+from .common import bench, report
+
+
+def former_make_object_w_doc(value, doc="", source="", timestamp=None):
+    c = type(value.__class__.__name__ + "_w_doc",
+             (value.__class__,),
+             {"__doc__": doc, "__source__": source, "__timestamp__": timestamp,
+              "__reduce__": lambda s: (former_make_object_w_doc,
+                                       (value, doc, source, timestamp))})
+    return c(value)
+
+
+def document(method, n):
+    from imks.units import Doc
+    if method == "former":
+        return [former_make_object_w_doc(float(i), "Number %d" % i, str(i))
+                for i in range(n)] + \
+               [former_make_object_w_doc((i, i), "Pair %d" % i) for i in range(n)]
+    return [float(i) & Doc("Number %d" % i, str(i)) for i in range(n)] + \
+           [(i, i) & Doc("Pair %d" % i) for i in range(n)]
+
+
+def classes():
+    gc.collect()
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, type))
+
+
+def main(n=1000):
+    from imks import units
+    for method in ("former", "doc types"):
+        before = classes()
+        tracemalloc.start()
+        objects = document(method, n)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("%-40s %10d" % ("%s: new classes (%d objects)" % (method, 2 * n),
+                              classes() - before))
+        print("%-40s %10.1f kB" % ("%s: memory" % method, size / 1024.0))
+        report("%s: time per object" % method,
+               bench(lambda: document(method, 100), number=10) / 200)
+        del objects
+        units.documentation.prune()
+
+
+if __name__ == "__main__":
+    main()
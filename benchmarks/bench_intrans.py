@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the input transformers, compared with separate scans.
+
+The former command_transformer scanned each line with the date regex and
+then with each input transformer in turn; the transformers are now combined
+in a single regex.  Both are timed with the transformers of Startup.imks and
+with many more user transformers, on lines with and without matches.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import standalone_shell, bench, report
+
+lines = ["x = 12h 30m 25.2s + 1d 12h 30m", "d = 2020.1.1 + 3[day]",
+         "sqrt(3[m]^2 + 16m^2) @ [km]", "f = lambda t: 12[m] + 3cm*t"]
+
+
+def former_command_transformer(line):
+    from imks.config import config
+    from imks.transformers import re_date
+    if config.get("default_calendar", None):
+        replaces = []
+        for m in re_date.finditer(line):
+            datetime = [e.strip() for e in m.group(1).split(".")]
+            if m.group(3):
+                datetime.extend([e.strip() for e in m.group(3).split(":")])
+            replaces.insert(0, ("%s(%s)" % (config["default_calendar"],
+                                            ",".join(datetime)),
+                                m.start(), m.end()))
+        for what, start, end in replaces:
+            line = line[:start] + what + line[end:]
+    for r, t in config["intrans"].values():
+        replaces = []
+        for m in r.finditer(line):
+            args = m.groupdict()
+            reps = ['"%s": %s' % arg for arg in args.items()
+                    if arg[1] is not None]
+            replaces.insert(0, ("%s(**{%s})" % (t, ", ".join(reps)),
+                                m.start(), m.end()))
+        for what, start, end in replaces:
+            line = line[:start] + what + line[end:]
+    return line
+
+
+def main(n=30):
+    from imks.config import config
+    from imks.transformers import command_transformer
+    shell = standalone_shell()
+    config["default_calendar"] = "Gregorian"
+    try:
+        for count in ("Startup", "%d more" % n):
+            if count != "Startup":
+                for i in range(n):
+                    # Names cannot contain digits
+                    name = "".join("abcdefghij"[int(c)] for c in str(i))
+                    shell.push(u'%%newtransformer user%s="(?P<x>\\d+)q%d(?P<y>\\d+)":f' %
+                               (name, i))
+            report("%s transformers (per line)" % count,
+                   bench(lambda: [command_transformer(l) for l in lines]) /
+                   len(lines))
+            report("former, %s transformers (per line)" % count,
+                   bench(lambda: [former_command_transformer(l) for l in lines]) /
+                   len(lines))
+    finally:
+        config["default_calendar"] = None
+
+
+if __name__ == "__main__":
+    main()
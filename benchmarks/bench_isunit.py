@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of units.isunit, the unit lookup used by the input transformers.
+
+About 170 currency-like units are defined on top of the standard library,
+as done by currencies.saverates, and the trie-based lookup is compared
+with the sequential scan of the prefix dictionary used before.
+"""
+
+from __future__ import absolute_import, division, print_function
+import itertools
+import string
+from .common import standalone_shell, bench, report
+
+
+def isunit_scan(fullname, verbose=False):
+    """Reference implementation: scan all prefixes (former units.isunit)."""
+    from imks import units
+    match = units.isunit_re.match(fullname)
+    name = match.group(0) if match else fullname
+    if verbose:
+        unit_dict, prefix_dict = units.verbose_units, units.verbose_prefixes
+    else:
+        unit_dict, prefix_dict = units.units, units.prefixes
+    if name in unit_dict:
+        return "", unit_dict[name] if verbose else name
+    elif units.prefixonly and name in prefix_dict:
+        return prefix_dict[name] if verbose else name, ""
+    for k in [k for k in prefix_dict.keys() if k == name[:len(k)]]:
+        u = name[len(k):]
+        if u in unit_dict:
+            if verbose:
+                return prefix_dict[k], unit_dict[u]
+            return k, u
+    return False
+
+
+def main():
+    from imks import units
+    standalone_shell("Astro")
+    codes = ["".join(c) for c in
+             itertools.product("XYZ", string.ascii_uppercase, "ABCDEFG")][:170]
+    for code in codes:
+        units.newunit(code, units.Value(1.0, units.units["EUR"].unit),
+                      doc="%s currency" % code)
+    names = ["m", "km", "kpc", "Gyr", "mph", "kXAB", "MEUR", "foo", "bar",
+             "x", "nm", "GHz", "uJy", "zYZG", "keV"]
+    for name in names:
+        assert units.isunit(name) == isunit_scan(name), name
+    verbose_names = ["meters", "kilometers", "megaparsecs", "nanoseconds",
+                     "foo"]
+    for name in verbose_names:
+        assert units.isunit(name, verbose=True) == \
+            isunit_scan(name, verbose=True), name
+    print("%d prefixes, %d units" % (len(units.prefixes), len(units.units)))
+
+    def run(f, names, verbose=False):
+        for name in names:
+            f(name, verbose)
+
+    report("isunit (trie)",
+           bench(lambda: run(units.isunit, names)) / len(names))
+    report("isunit (scan)",
+           bench(lambda: run(isunit_scan, names)) / len(names))
+    report("isunit verbose (trie)",
+           bench(lambda: run(units.isunit, verbose_names, True)) / len(verbose_names))
+    report("isunit verbose (scan)",
+           bench(lambda: run(isunit_scan, verbose_names, True)) / len(verbose_names))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the unit parser, compared with the former PLY parser.
+
+The PLY parser (see ply_parser.py) requires the ply package, which is not a
+requirement of imks (pip install imks[benchmarks]): without it, the benchmark
+is skipped.  Parsing is timed without the parser cache; the import time of
+imks.units, which includes the construction of the parser, is compared with
+the time needed to build the PLY lexer and parser tables.
+"""
+
+from __future__ import absolute_import, division, print_function
+import subprocess
+import sys
+from .common import standalone_shell, bench, report
+
+standard = ["m", "km/h", "kg m/s^2", "m^1/2", "kpc/Gyr", "J/(kg K)", "m s-1",
+            "(m/s)^2", "W m^-2 Hz^-1", "km^(2/3) s^-1.5"]
+
+verbose = ["meter", "kilometers per hour", "meter per second squared",
+           "square kilometers per hour", "inverse second", "cubic meter",
+           "meter to the third", "meter to the 1/2", "kilogram meter per second"]
+
+import_time = """
+import time
+t0 = time.time()
+import imks.units
+t1 = time.time()
+%s
+print(t1 - t0, time.time() - t1)
+"""
+
+
+def run(parse, names):
+    for name in names:
+        parse(name)
+
+
+def timed_import(code=""):
+    out = subprocess.check_output([sys.executable, "-c", import_time % code])
+    return [float(x) for x in out.split()]
+
+
+def main():
+    from imks import units
+    try:
+        from . import ply_parser
+    except ImportError as e:
+        print("skipped: the PLY parser requires the ply package (%s)" % e)
+        return
+    standalone_shell()
+    for name in standard + verbose:
+        v1, t1 = units.parse_unit(name)
+        v2, t2 = ply_parser.parse(name)
+        assert (repr(v1), v1.unit, t1) == (repr(v2), v2.unit, t2), name
+    report("parse, standard (per unit)",
+           bench(lambda: run(units.parse_unit, standard)) / len(standard))
+    report("PLY parse, standard (per unit)",
+           bench(lambda: run(ply_parser.parse, standard)) / len(standard))
+    report("parse, verbose (per unit)",
+           bench(lambda: run(units.parse_unit, verbose)) / len(verbose))
+    report("PLY parse, verbose (per unit)",
+           bench(lambda: run(ply_parser.parse, verbose)) / len(verbose))
+    report("import imks.units", min(timed_import()[0] for _ in range(3)))
+    report("PLY lexer and parser construction",
+           min(timed_import("import benchmarks.ply_parser")[1] for _ in range(3)))
+
+
+if __name__ == "__main__":
+    main()
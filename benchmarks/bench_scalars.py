@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of scalar values against 0-d array values.
+
+Times a million elementary operations and measures the memory used by a
+million quantities, both for ScalarValue (the default for scalar literals)
+and for the ndarray-based Value.
+"""
+
+from __future__ import absolute_import, division, print_function
+import sys
+import time
+import tracemalloc
+import numpy as np
+from .common import standalone_shell, report
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+
+def run(make):
+    x, y, z = make(3.0, "m/s"), make(2.5, "km/h"), make(7.0, "s")
+    t0 = time.perf_counter()
+    for i in range(N // 4):
+        x * y
+        x / z
+        x + y
+        x < y
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    values = [make(float(i), "m/s") for i in range(N)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del values
+    return elapsed, memory
+
+
+def main():
+    from imks.units import Value
+    standalone_shell()
+    for name, make in [("ScalarValue", Value),
+                       ("Value (0-d array)", lambda v, u: Value(np.array(v), u))]:
+        elapsed, memory = run(make)
+        report("%s: %d operations" % (name, N), elapsed)
+        print("%-40s %10.1f MB" % ("%s: %d values" % (name, N), memory / 2.0**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the loading of imks scripts, with and without compiled cache.
+
+Each run starts a new standalone shell, without the registry snapshot, and
+loads Startup.imks and Astro.imks; the cached runs execute the code saved in
+~/.imks/cache instead of transforming and compiling the scripts.
+"""
+
+from __future__ import absolute_import, division, print_function
+import time
+from .common import standalone_shell, report
+
+
+def startup(cache):
+    from imks import units
+    from imks.config import config
+    config["startup_snapshot"] = False
+    config["script_cache"] = cache
+    units.reset()
+    t0 = time.time()
+    shell = standalone_shell("Astro")
+    return time.time() - t0, shell
+
+
+def main(repeat=5):
+    from imks import units
+    from imks.config import config
+    try:
+        cold = min(startup(False)[0] for _ in range(repeat))
+        units_cold = list(units.units)
+        startup(True)               # records the compiled scripts
+        warm = min(startup(True)[0] for _ in range(repeat))
+        assert list(units.units) == units_cold
+    finally:
+        config["startup_snapshot"] = config["script_cache"] = True
+    report("startup, Startup + Astro", cold)
+    report("startup, compiled cache", warm)
+
+
+if __name__ == "__main__":
+    main()
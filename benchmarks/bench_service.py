@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Load test of the conversion service (python -m imks serve).
+
+By default a service is started in this process, on a temporary Unix
+socket; to test a running service, pass the path of its socket:
+
+    python -m benchmarks.bench_service /tmp/imks.sock
+
+Requests are sent one at a time, pipelined in batches, and pipelined by
+several concurrent clients.
+"""
+
+from __future__ import absolute_import, division, print_function
+import sys
+import threading
+import time
+from .common import report
+
+requests = [("convert", {"value": 36, "unit": "km/h", "to": "m/s"}),
+            ("convert", {"value": [1.0] * 100, "unit": "mi", "to": "km"}),
+            ("evaluate", {"expression": "300[K] @ [Celsius]"}),
+            ("evaluate", {"expression": "sqrt(3[m]^2 + 16m^2) @ [km]"}),
+            ("compatible", {"expression": "[m/s]"})]
+
+
+def start_service():
+    """Start a service in a thread, returning the socket path and a stopper."""
+    import asyncio
+    import os
+    import tempfile
+    from imks.service import Service
+    service = Service()
+    path = os.path.join(tempfile.mkdtemp(), "imks.sock")
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start(path))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(service.stop(server), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        service.close()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    return path, stop
+
+
+def run_client(path, batches, depth):
+    from imks.service import Client
+    client = Client(path)
+    try:
+        for _ in range(batches):
+            responses = client.call_many(requests * (depth // len(requests)))
+            assert all("result" in r for r in responses)
+    finally:
+        client.close()
+
+
+def main(path=None, total=5000, depth=100, clients=4):
+    from imks.service import Client
+    stop = None
+    if path is None:
+        path, stop = start_service()
+    try:
+        client = Client(path)
+        t0 = time.time()
+        for n in range(total // 10):
+            method, params = requests[n % len(requests)]
+            client.call(method, **params)
+        report("one at a time (per request)", (time.time() - t0) / (total // 10))
+        client.close()
+        t0 = time.time()
+        run_client(path, total // depth, depth)
+        report("pipelined by %d (per request)" % depth,
+               (time.time() - t0) / total)
+        threads = [threading.Thread(target=run_client,
+                                    args=(path, total // depth // clients, depth))
+                   for _ in range(clients)]
+        t0 = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        report("%d clients, pipelined (per request)" % clients,
+               (time.time() - t0) / total)
+    finally:
+        if stop is not None:
+            stop()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
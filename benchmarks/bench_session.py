@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the evaluation of expressions by a headless Session.
+
+The expressions are evaluated one by one and in batches; both go through
+the transformation cache, so that repeated expressions are only executed.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import bench, report
+
+expressions = ["(3+/-0.1)[km/h] @ [m/s]", "1200s @ k", "300[K] @ [Celsius]",
+               "sqrt(3[m]^2 + 16m^2) @ [km]", "12h 30m @ hms", "x = 3[m]",
+               "x * 2"]
+
+
+def main():
+    from imks.session import Session
+    session = Session()
+    report("evaluate (per expression)",
+           bench(lambda: [session.evaluate(e) for e in expressions]) /
+           len(expressions))
+    report("evaluate_many (per expression)",
+           bench(lambda: session.evaluate_many(expressions)) / len(expressions))
+
+
+if __name__ == "__main__":
+    main()
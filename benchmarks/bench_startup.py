@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the startup, with and without the registry snapshot.
+
+Each run starts a new standalone shell; the cold startup loads Startup.imks
+line by line, while the warm one restores ~/.imks/registry.snapshot.
+"""
+
+from __future__ import absolute_import, division, print_function
+import os
+import time
+from .common import standalone_shell, report
+
+
+def startup(snapshot):
+    from imks import units
+    from imks.config import config
+    config["startup_snapshot"] = snapshot
+    units.reset()
+    t0 = time.time()
+    shell = standalone_shell()
+    return time.time() - t0, shell
+
+
+def main(repeat=5):
+    from imks import units, snapshot
+    path = snapshot.snapshot_path()
+    if os.path.exists(path):
+        os.remove(path)
+    cold = min(startup(False)[0] for _ in range(repeat))
+    units_cold = list(units.units)
+    startup(True)               # records the snapshot
+    warm = min(startup(True)[0] for _ in range(repeat))
+    assert list(units.units) == units_cold
+    report("startup, Startup.imks", cold)
+    report("startup, snapshot", warm)
+
+
+if __name__ == "__main__":
+    main()
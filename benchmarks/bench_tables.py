@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the ingestion of CSV files with units in the headers.
+
+The chunked reader and converter of imks.tables are compared with the
+construction of a Value for each field, converted with a cached converter.
+"""
+
+from __future__ import absolute_import, division, print_function
+import csv
+import io
+from .common import standalone_shell, bench, report
+
+rows = 100000
+
+
+def make_csv():
+    out = io.StringIO()
+    out.write(u"time,power[kW],temp[Celsius]\n")
+    for n in range(rows):
+        out.write(u"%d,%g,%g\n" % (n, n * 0.001, 20 + n % 10))
+    return out.getvalue()
+
+
+def row_by_row(data):
+    from imks import units
+    reader = csv.reader(io.StringIO(data))
+    next(reader)
+    power, temp = units.converter(None, "W"), units.converter(None, "K")
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for row in reader:
+        p = units.Value(float(row[1]), "kW")
+        t = units.Value(float(row[2]), "Celsius")
+        writer.writerow([row[0], power(p), temp(t)])
+    return out
+
+
+def main():
+    from imks import tables
+    standalone_shell()
+    data = make_csv()
+    targets = {"power": "W", "temp": "K"}
+    report("row by row, %d rows" % rows,
+           bench(lambda: row_by_row(data), repeat=3))
+    report("read_csv, %d rows" % rows,
+           bench(lambda: list(tables.read_csv(io.StringIO(data), 10000)), repeat=3))
+    report("convert_csv, %d rows" % rows,
+           bench(lambda: tables.convert_csv(io.StringIO(data), io.StringIO(),
+                                            targets, 10000), repeat=3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the input transformation, with and without the cache.
+
+The uncached times call the transformers directly; the cached ones go
+through transformers.transform and Shell.run_cell, as the magics and the
+standalone shell do.  Startup.imks, which cannot be run twice, is only
+compiled.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import standalone_shell, bench, report
+
+expressions = ["3[km/h] @ [m/s]", "sqrt(3[m]^2 + 16m^2)", "1e27[kg] @ ['c'|'G']",
+               "lambda : 12[m] + 3cm", "(G*c)^(1/3)", "~1e5K @ ['k'|eV]"]
+
+
+def main():
+    from imks import transformers
+    from imks.magics import find_imks_script
+    shell = standalone_shell()
+    n = len(expressions)
+    report("transform, uncached (per expression)",
+           bench(lambda: [transformers.transform_expression(e)
+                          for e in expressions]) / n)
+    report("transform, cached (per expression)",
+           bench(lambda: [transformers.transform(e) for e in expressions]) / n)
+    report("compile cell, uncached (per cell)",
+           bench(lambda: [shell.compile_cell(e) for e in expressions]) / n)
+    report("run_cell, cached (per cell)",
+           bench(lambda: [shell.run_cell(e) for e in expressions]) / n)
+    _, code = find_imks_script(shell, "Startup")
+    report("compile Startup.imks, uncached", bench(lambda: shell.compile_cell(code),
+                                                   repeat=3))
+    report("compile Startup.imks, cached",
+           bench(lambda: transformers.cached_transform("code", code.rstrip(),
+                                                       shell.compile_cell)))
+    info = transformers.transform_cache_info()
+    print("%-40s %10.1f %%" % ("transformation cache hit rate",
+                               100 * info["hit_rate"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the unit transformer, compared with the former one.
+
+The former token state machine untokenized the fragments of each quantity
+and shifted the following tokens, so that its cost grew faster than the
+length of long lines.  Both transformers are timed, without tokenization
+and without the transformation cache, on cells with many lines and on single
+lines with many quantities; their outputs are first checked to agree, up to
+whitespace.  Times are per line or per quantity.
+
+The former transformer is imks/transformers.py of the upstream baseline,
+former_revision, loaded with git show: outside a git checkout with that
+revision (for example, from a source distribution) the benchmark is skipped.
+"""
+
+from __future__ import absolute_import, division, print_function
+import os
+import subprocess
+import tokenize
+import types
+from io import StringIO
+from .common import standalone_shell, bench, report
+
+lines = [u"v = 3[km/h] @ [m/s]", u"d = sqrt(3[m]^2 + 16m^2)",
+         u"M = 1e27[kg] @ ['c'|'G']", u"f = lambda t: 12[m] + 3cm*t",
+         u"r = (G*c)^(1/3)", u"T = ~1e5K @ ['k'|eV]",
+         u"x = (1.2+/-0.1)[m] + 1.234(5)e3 mm",
+         u"y = [2[m]*i for i in range(3)]"]
+
+# The upstream baseline, with the token state machine
+former_revision = "f03fd96305c54a2651b0146e99d27e9a46f763b7"
+
+
+def transformed(transformer, code):
+    tokens = list(tokenize.generate_tokens(StringIO(code).readline))
+    return tokenize.untokenize(transformer(tokens))
+
+
+def former_transformers(revision=former_revision):
+    """Load imks/transformers.py at a git revision as a module of imks."""
+    path = "imks/transformers.py"
+    top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source = subprocess.check_output(["git", "show", "%s:%s" % (revision, path)],
+                                     cwd=top, stderr=subprocess.DEVNULL)
+    module = types.ModuleType("imks.former_transformers")
+    module.__package__ = "imks"
+    module.__file__ = "%s:%s" % (revision, path)
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+def main():
+    from imks import transformers
+    from imks.config import internals
+    try:
+        former = former_transformers()
+    except (OSError, subprocess.CalledProcessError) as e:
+        print("skipped: the former transformer requires a git checkout with "
+              "the revision %s (%s)" % (former_revision, e))
+        return
+    standalone_shell()
+    engine, internals["engine"] = internals["engine"], "ufloat"
+    try:
+        for line in lines:
+            new = transformed(transformers.unit_transformer, line)
+            old = transformed(former.unit_transformer, line)
+            assert "".join(new.split()) == "".join(old.split()), line
+        for n in (10, 100, 1000):
+            cell = u"\n".join(lines[i % len(lines)] for i in range(n)) + u"\n"
+            line = u"L = [%s]\n" % u", ".join(u"%d.5[m/s] + (1.2+/-0.1) km/h" % i
+                                             for i in range(n))
+            for name, code in (("%d lines" % n, cell),
+                               ("%d quantities in a line" % n, line)):
+                tokens = list(tokenize.generate_tokens(StringIO(code).readline))
+                for prefix, module in (("", transformers),
+                                       ("former, ", former)):
+                    report(prefix + name,
+                           bench(lambda: module.unit_transformer(list(tokens)),
+                                 number=max(1, 100 // n), repeat=3) / n)
+    finally:
+        internals["engine"] = engine
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of error propagation on arrays: uarray versus umath.
+
+The umath engine propagates the errors of an object array of ufloats element
+by element; the uarray engine applies a ufunc to the nominal values and a
+matrix operation to the sensitivities.  Both are timed on arrays with units
+of independent values, with a shared uncertain scale factor.
+"""
+
+from __future__ import absolute_import, division, print_function
+import numpy as np
+import uncertainties
+from uncertainties import unumpy
+from .common import standalone_shell, bench, report
+
+size = 100000
+
+
+def main():
+    from imks.units import Value
+    from imks.units_uarray import UArray, uarray
+    standalone_shell()
+    nominal = np.linspace(1.0, 2.0, size)
+    std_dev = np.full(size, 0.01)
+    engines = [("umath", unumpy.uarray, uncertainties.ufloat,
+                lambda x: Value(unumpy.sqrt(x.value), x.unit / 2),
+                lambda x: unumpy.std_devs(x.value)),
+               ("uarray", uarray, UArray.independent, np.sqrt,
+                lambda x: x.value.std_dev)]
+    print("arrays of %d elements" % size)
+    for name, new_array, new_scalar, sqrt, std_devs in engines:
+        x = Value(new_array(nominal, std_dev), "m")
+        t = Value(new_scalar(2.0, 0.1), "s")
+        cases = [("create", lambda: new_array(nominal, std_dev)),
+                 ("x * x", lambda: x * x),
+                 ("2 * x + x", lambda: 2 * x + x),
+                 ("sqrt(x) / t", lambda: sqrt(x) / t),
+                 ("x - x", lambda: x - x),
+                 ("std_devs(x / t)", lambda: std_devs(x / t))]
+        for case, f in cases:
+            report("  %s (%s)" % (case, name), bench(f, repeat=3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of scalar arithmetic with units.
+
+Measures elementary operations between scalar quantities and a few
+scalar-heavy expressions taken from scripts/Astro.imks.
+"""
+
+from __future__ import absolute_import, division, print_function
+from .common import standalone_shell, bench, report
+
+
+def main():
+    shell = standalone_shell("Astro")
+    ns = shell.locals
+    ns["_x"] = shell.run_cell("3.0[m/s]")
+    ns["_y"] = shell.run_cell("2.5[km h^-1]")
+    ns["_z"] = shell.run_cell("7.0[s]")
+    ns["_w"] = shell.run_cell("2.0[km]")
+    ns["_t"] = shell.run_cell("5800[K]")
+    ns["_l"] = shell.run_cell("500[nm]")
+    ns["_SI"] = shell.run_cell("System('SI')")
+    ns["_astro"] = shell.run_cell("System('astro')")
+    ns["_planck"] = shell.run_cell("System('planck')")
+    code = shell.run_cell
+    cases = [("x * y", "_x * _y"),
+             ("x / z", "_x / _z"),
+             ("x + y", "_x + _y"),
+             ("x ** 2", "_x ** 2"),
+             ("x < y", "_x < _y"),
+             ("x * z + w", "_x * _z + _w"),
+             ("rho_CMB (lazy)", "rho_CMB * 1"),
+             ("n_CMB (lazy)", "n_CMB * 1"),
+             ("Bnu(5800[K], 500[nm])", "Bnu(_t, _l)"),
+             ("dH (lazy)", "dH * 1"),
+             ("x @ [SI]", "_x | _SI"),
+             ("x @ [astro]", "_x | _astro"),
+             ("x @ [planck]", "_x | _planck"),
+             ("str(x @ [astro])", "str(_x | _astro)")]
+    for name, expr in cases:
+        compiled = compile(expr, "<bench>", "eval")
+        report(name, bench(lambda: eval(compiled, ns)))
+    report("Astro script (full load)",
+           bench(lambda: code("%load_imks Astro"), number=3, repeat=3))
+
+
+if __name__ == "__main__":
+    main()
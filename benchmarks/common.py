@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Helper functions shared by the iMKS benchmarks.
+
+The benchmarks are plain scripts: run them from the top directory of the
+repository, for example
+
+    python -m benchmarks.bench_units
+"""
+
+from __future__ import absolute_import, division, print_function
+import timeit
+
+
+def standalone_shell(*scripts):
+    """Start a standalone iMKS shell, loading Startup and then the scripts.
+
+    :param str scripts:  names of additional .imks scripts to load
+    :return Shell:       the initialized shell
+    """
+    from imks.shell import Shell
+    from imks.config import config
+    from imks import imks_standalone
+    config["banner"] = False
+    magic = imks_standalone.load_imks(Shell())
+    for script in scripts:
+        magic.load_imks(script)
+    return magic.shell
+
+
+def bench(stmt, number=None, repeat=5, **namespace):
+    """Time a statement, returning the best time per loop in seconds.
+
+    :param stmt:         statement to time, either a string or a callable
+    :param int number:   number of loops per run [automatic]
+    :param int repeat:   number of runs
+    :param namespace:    variables accessible to the statement
+    :rtype float:
+    """
+    timer = timeit.Timer(stmt, globals=namespace)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def report(name, seconds):
+    """Print a single benchmark line."""
+    if seconds < 1e-3:
+        print("%-40s %10.2f us" % (name, seconds * 1e6))
+    else:
+        print("%-40s %10.2f ms" % (name, seconds * 1e3))
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""The PLY unit parser used by imks before the hand-written one.
+
+It is kept only as a reference for the parser benchmark: it requires the
+ply package, which imks no longer uses.  The grammar and the actions are
+unchanged, but units are looked up in the current registry.
+"""
+
+from __future__ import absolute_import, division, print_function
+from fractions import Fraction
+import re
+from ply import lex, yacc
+from imks.spelling import cardinal_to_number, ordinal_to_number
+from imks.units import UnitParseError, UnitTree, get_registry, reserved, unit_regex
+
+tokens = (
+    'UNIT',
+    'NUMERAL',
+    'ORDINAL',
+    'FLOAT',
+    'NUMDIV',
+    'UNITDIV',
+    'POW',
+    'DOT',
+    'LPAREN',
+    'RPAREN',
+    'QUOTE'
+    ) + tuple(reserved.values())
+
+# Regular expression rules for simple tokens
+t_NUMDIV = r'/(?=[ \t]*\d)'
+t_UNITDIV = r'/(?=[ \t]*\D)'
+t_POW = r'\^'
+t_DOT = r'\.'
+t_LPAREN = r'\('
+t_RPAREN = r'\)'
+t_QUOTE = r"\'"
+
+
+# A unit, or also a keyword in verbose mode
+@lex.TOKEN(unit_regex)
+def t_UNIT(t):
+    if t.lexer.verbose:
+        if t.value in reserved:
+            t.type = reserved.get(t.value)
+        else:
+            try:
+                v = cardinal_to_number(t.value)
+                t.type = 'NUMBER'
+                t.value = v
+            except ValueError:
+                try:
+                    v = ordinal_to_number(t.value, fraction=True)
+                    t.type = 'ORDINAL'
+                    t.value = v
+                except ValueError:
+                    pass
+    return t
+
+
+def t_ORDINAL(t):
+    r"""(?P<number>[-+]?\d+)(?P<suffix>st|nd|rd|th)"""
+    if t.lexer.verbose:
+        try:
+            t.value = Fraction(int(t.lexer.lexmatch.group("number")), 1) * 1.0
+            return t
+        except ValueError:
+            raise UnitParseError(t.value, "number conversion failed", t.lineno)
+    else:
+        raise UnitParseError(t.value, "ordinals not allowed in this context", t.lineno)
+
+
+def t_FLOAT(t):
+    r"""[-+]?\d+\.\d+"""
+    try:
+        t.value = float(t.value)
+    except ValueError:
+        raise UnitParseError(t.value, "number conversion failed", t.lineno)
+    return t
+
+
+# A regular expression for numbers and ordinals
+def t_NUMERAL(t):
+    r"""([-+]?\d+)"""
+    try:
+        t.value = Fraction(int(t.value), 1) * 1.0
+    except ValueError:
+        raise UnitParseError(t.value, "number conversion failed", t.lineno)
+    return t
+
+
+# Define a rule so we can track line numbers
+def t_newline(t):
+    r"""\n+"""
+    t.lineno += len(t.value)
+
+
+# A string containing ignored characters (spaces and tabs)
+t_ignore = " *\t"
+
+
+# Error handling rule
+def t_error(t):
+    raise UnitParseError(t.value[0], "illegal character", t.lineno)
+
+
+# Build the lexer
+unitlex = lex.lex(reflags=re.UNICODE)
+unitlex.verbose = False
+
+
+######################################################################
+# Unit Parser
+
+def p_expression(p):
+    """expression : expression1
+                  | INVERSE expression1
+                  | expression UNITDIV expression1
+                  | expression PER expression1
+    """
+    if len(p) == 2:
+        p[0] = p[1]
+    elif len(p) == 3:
+        a = p[2][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        p[0] = (1 / a, -p[2][1])
+    else:
+        a = p[1][0]
+        b = p[3][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        if isinstance(b, tuple):
+            b = b[1]
+        p[0] = (a / b, p[1][1] - p[3][1])
+
+
+def p_expression1(p):
+    """expression1 : expression1 POW exponent
+                   | expression1 POW LPAREN exponent RPAREN
+                   | unit_exp
+                   | expression1 expression1
+                   | expression1 DOT expression1
+                   | unit
+    """
+    if len(p) == 2:
+        p[0] = p[1]
+    elif len(p) == 3:
+        a = p[1][0]
+        b = p[2][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        if isinstance(b, tuple):
+            b = b[1]
+        p[0] = (a * b, p[1][1] + p[2][1])
+        return
+    elif len(p) == 4 and p[2] == '.':
+        a = p[1][0]
+        b = p[3][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        if isinstance(b, tuple):
+            b = b[1]
+        p[0] = (a * b, p[1][1] + p[3][1])
+    elif len(p) == 4 and p[2] == '^':
+        a = p[1][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        p[0] = (a ** p[3], p[1][1] * p[3])
+    else:
+        a = p[1][0]
+        if isinstance(a, tuple):
+            a = a[1]
+        p[0] = (a ** p[4], p[1][1] * p[4])
+
+
+def p_expression1_verbose(p):
+    """expression1 : SQUARE expression1
+                   | expression1 SQUARED
+                   | CUBIC expression1
+                   | expression1 CUBED
+                   | expression1 TO THE verbose_exponent
+    """
+    if len(p) == 3:
+        if p[1] == 'square':
+            x = p[2]
+            n = 2
+        elif p[2] == 'squared':
+            x = p[1]
+            n = 2
+        elif p[1] == 'cubic':
+            x = p[2]
+            n = 3
+        else:   # must be p[2] == 'cubed'
+            x = p[1]
+            n = 3
+    else:
+        x = p[1]
+        n = p[4]
+    a = x[0]
+    if isinstance(a, tuple):
+        a = a[1]
+    p[0] = (a ** n, x[1] * n)
+
+
+def p_expression_group(p):
+    """expression1 : LPAREN expression RPAREN"""
+    p[0] = p[2]
+
+
+def p_exponent(p):
+    """exponent : NUMERAL NUMDIV NUMERAL
+                | NUMERAL
+                | FLOAT
+    """
+    if len(p) == 4:
+        # p[0] = Fraction(p[1], p[3])
+        p[0] = p[1] / p[3]
+    else:
+        p[0] = p[1]
+
+
+def p_verbose_exponent(p):
+    """verbose_exponent : ORDINAL
+                        | NUMERAL ORDINAL
+                        | NUMERAL NUMDIV NUMERAL
+                        | NUMERAL NUMDIV ORDINAL
+                        | NUMERAL OVER NUMERAL
+    """
+    if len(p) == 4:
+        # p[0] = Fraction(p[1], p[3])
+        p[0] = p[1] / p[3]
+    elif len(p) == 3:
+        # p[0] = Fraction(p[1], p[2])
+        p[0] = p[1] / p[2]
+    else:
+        p[0] = p[1]
+
+
+def p_unit_exp(p):
+    """unit_exp : unit NUMERAL
+                | unit FLOAT"""
+    a = p[1][0]
+    if isinstance(a, tuple):
+        a = a[1]
+    p[0] = (a ** p[2], p[1][1] * p[2])
+
+
+def p_unit(p):
+    """unit : UNIT
+            | QUOTE UNIT QUOTE
+    """
+    reg = get_registry()
+    if p[1] == "'":
+        variables = reg.user_ns
+        if p[2] in variables:
+            p[0] = (variables[p[2]], UnitTree.simple("'" + p[2] + "'"))
+        else:
+            raise UnitParseError(p[2], "unrecognized special unit")
+        return
+    ku = reg.isunit(p[1], p.parser.verbose)
+    if ku:
+        k, u = ku
+        if k:
+            k1 = reg.prefixes[k]
+        else:
+            k1 = 1
+        if u:
+            u1 = reg.units[u]
+        else:
+            u1 = 1
+        if p.parser.verbose:
+            new_name = p[1]
+        else:
+            new_name = k + u
+        p[0] = (k1 * u1, UnitTree.simple(new_name))
+    else:
+        raise UnitParseError(p[1], "unrecognized unit")
+
+
+def p_error(p):
+    # The parser and the lexer are reset at the start of each parse
+    raise UnitParseError(getattr(p, "value", ""), "syntax error")
+
+
+# Build the parser
+unityacc = yacc.yacc(write_tables=0, debug=0)
+unityacc.verbose = False
+
+
+def parse(unit):
+    """Parse a unit, first as a standard unit and then as a verbose one."""
+    try:
+        unitlex.verbose = unityacc.verbose = False
+        return unityacc.parse(unit, lexer=unitlex)
+    except UnitParseError:
+        unitlex.verbose = unityacc.verbose = True
+        return unityacc.parse(unit, lexer=unitlex)
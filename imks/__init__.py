@@ -1,4 +1,5 @@
 from ._version import __version__
+from .session import Session, evaluate
 try:
     # noinspection PyUnresolvedReferences
     # noinspection PyStatementEffect
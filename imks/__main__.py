@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Command line interface of imks.
+
+Usage:
+  python -m imks eval [options] [file ...]
+  python -m imks serve [options]
+
+See imks.batch for the evaluation of the expressions, and imks.service for
+the conversion service.
+"""
+
+from __future__ import absolute_import, division, print_function
+import argparse
+import sys
+
+
+def eval_command(args):
+    from .batch import evaluate_stream
+    scripts = tuple(s.strip() for s in args.scripts.split(",") if s.strip())
+    try:
+        count = evaluate_stream(args.files or ["-"], fmt=args.format,
+                                scripts=scripts, engine=args.engine,
+                                jobs=args.jobs, stop=args.stop)
+    except Exception as e:
+        print("imks eval: %s: %s" % (type(e).__name__, e), file=sys.stderr)
+        return 2
+    return 1 if count else 0
+
+
+def serve_command(args):
+    from .service import Service
+    offload = True if args.offload else None
+    service = Service(engine=args.engine, processes=args.processes,
+                      offload=offload)
+    service.serve(args.socket, args.host, args.port)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m imks",
+        description="An advanced physical quantity calculator")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    parser_eval = commands.add_parser(
+        "eval", help="evaluate expressions and statements",
+        description="Evaluate in order the expressions and the statements "
+                    "read from the files (or the standard input), writing "
+                    "their results.  The exit status is 1 if any evaluation "
+                    "failed, and 2 if the sessions could not be started.")
+    parser_eval.add_argument("files", nargs="*", metavar="file",
+                             help="the input files (- for the standard input)")
+    parser_eval.add_argument("-f", "--format", choices=("text", "jsonl"),
+                             default="text",
+                             help="the output format (default: text)")
+    parser_eval.add_argument("-e", "--engine", default="math",
+                             help="the math engine, e.g. umath for "
+                                  "uncertainties (default: math)")
+    parser_eval.add_argument("-s", "--scripts", default="Startup",
+                             help="comma-separated imks scripts to load "
+                                  "(default: Startup)")
+    parser_eval.add_argument("-j", "--jobs", type=int, default=1,
+                             help="number of worker processes; with more than "
+                                  "one, the lines must be independent")
+    parser_eval.add_argument("-x", "--stop", action="store_true",
+                             help="stop at the first error")
+    parser_eval.set_defaults(func=eval_command)
+    parser_serve = commands.add_parser(
+        "serve", help="run the conversion service",
+        description="Run a service answering the JSON requests of local "
+                    "clients, on a Unix socket accessible only to the current "
+                    "user or, with --host, on a TCP port.  The service "
+                    "evaluates arbitrary Python code: any user able to "
+                    "connect to a TCP port can run code with your privileges, "
+                    "so use --host only on single-user machines.")
+    parser_serve.add_argument("--socket", metavar="path",
+                              help="the path of the Unix socket "
+                                   "(default: ~/.imks/service.sock)")
+    parser_serve.add_argument("--host",
+                              help="listen on a TCP port of this host (e.g. "
+                                   "127.0.0.1) instead of the Unix socket; "
+                                   "unauthenticated, see above")
+    parser_serve.add_argument("--port", type=int, default=8765,
+                              help="the port, with --host (default: 8765)")
+    parser_serve.add_argument("-e", "--engine", default="math",
+                              help="the math engine (default: math)")
+    parser_serve.add_argument("-p", "--processes", type=int, default=0,
+                              help="number of worker processes for the "
+                                   "offloaded evaluations (default: 0)")
+    parser_serve.add_argument("--offload", action="store_true",
+                              help="offload all the evaluations to the "
+                                   "worker processes")
+    parser_serve.set_defaults(func=serve_command)
+    args = parser.parse_args(argv)
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("the number of jobs must be positive")
+    if getattr(args, "processes", 0) < 0:
+        parser.error("the number of processes cannot be negative")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""Static dimension inference for transformed iMKS code.
+
+The unit transformer rewrites every quantity literal into a call such as
+`Value(3.0, "m")`, and all additions, subtractions, and comparisons of values
+then check the units at run time.  This module analyzes the syntax tree of
+the transformed code before its execution: it infers the units of literals,
+of the variables of the user namespace, and of the expressions built from
+them, following the assignments (and the loops, until a fixed point is
+reached).
+
+Operations whose operands are proven to have the same units are replaced
+by calls to unchecked versions of the operators, and operations between
+incompatible units are reported before the code is executed.  The unchecked
+operators verify with a single identity test that their arguments are still
+the expected scalar values (the user namespace might have been changed in
+the meantime), and otherwise fall back to the standard operators.
+
+The analysis is enabled with `%imks -i on`.
+"""
+
+from __future__ import absolute_import, division, print_function
+import ast
+from . import units
+from .units import Quantity, ScalarValue, UnitCompatibilityError
+
+try:
+    # noinspection PyCompatibility
+    basestring
+except NameError:
+    # noinspection PyShadowingBuiltins
+    basestring = str
+
+
+#####################################################################
+# Unchecked operators
+
+def _scalar(value, unit):
+    """Build a relative ScalarValue bypassing the constructor checks."""
+    s = object.__new__(ScalarValue)
+    s.value = value
+    s.unit = unit
+    s.absolute = False
+    s.showunit = None
+    s.showprefix = None
+    return s
+
+
+def _proven(x, y):
+    """Check that x and y are relative scalar values with the same unit."""
+    return x.__class__ is ScalarValue and y.__class__ is ScalarValue and \
+        x.unit is y.unit and x.absolute is False and y.absolute is False
+
+
+def _relative(x, y):
+    """Check that x and y are relative scalar values."""
+    return x.__class__ is ScalarValue and y.__class__ is ScalarValue and \
+        x.absolute is False and y.absolute is False
+
+
+def unchecked_add(x, y):
+    if _proven(x, y):
+        return _scalar(x.value + y.value, x.unit)
+    return x + y
+
+
+def unchecked_sub(x, y):
+    if _proven(x, y):
+        return _scalar(x.value - y.value + 0.0, x.unit)
+    return x - y
+
+
+def unchecked_iadd(x, y):
+    if _proven(x, y):
+        return _scalar(x.value + y.value, x.unit)
+    x += y
+    return x
+
+
+def unchecked_isub(x, y):
+    if _proven(x, y):
+        return _scalar(x.value - y.value + 0.0, x.unit)
+    x -= y
+    return x
+
+
+def unchecked_mul(x, y):
+    if _relative(x, y):
+        return _scalar(x.value * y.value, x.unit + y.unit)
+    return x * y
+
+
+def unchecked_truediv(x, y):
+    if _relative(x, y):
+        return _scalar(x.value / y.value, x.unit - y.unit)
+    return x / y
+
+
+def unchecked_lt(x, y):
+    if _proven(x, y):
+        return x.value < y.value
+    return x < y
+
+
+def unchecked_le(x, y):
+    if _proven(x, y):
+        return x.value <= y.value
+    return x <= y
+
+
+def unchecked_gt(x, y):
+    if _proven(x, y):
+        return x.value > y.value
+    return x > y
+
+
+def unchecked_ge(x, y):
+    if _proven(x, y):
+        return x.value >= y.value
+    return x >= y
+
+
+def unchecked_eq(x, y):
+    if _proven(x, y):
+        return x.value == y.value
+    return x == y
+
+
+def unchecked_ne(x, y):
+    if _proven(x, y):
+        return x.value != y.value
+    return x != y
+
+
+# Names used in the transformed code for the unchecked operators
+unchecked_operators = {"__imks_add__": unchecked_add,
+                       "__imks_sub__": unchecked_sub,
+                       "__imks_iadd__": unchecked_iadd,
+                       "__imks_isub__": unchecked_isub,
+                       "__imks_mul__": unchecked_mul,
+                       "__imks_truediv__": unchecked_truediv,
+                       "__imks_lt__": unchecked_lt,
+                       "__imks_le__": unchecked_le,
+                       "__imks_gt__": unchecked_gt,
+                       "__imks_ge__": unchecked_ge,
+                       "__imks_eq__": unchecked_eq,
+                       "__imks_ne__": unchecked_ne}
+
+binary_operators = {ast.Add: "__imks_add__", ast.Sub: "__imks_sub__",
+                    ast.Mult: "__imks_mul__", ast.Div: "__imks_truediv__"}
+
+augmented_operators = {ast.Add: "__imks_iadd__", ast.Sub: "__imks_isub__"}
+
+compare_operators = {ast.Lt: "__imks_lt__", ast.LtE: "__imks_le__",
+                     ast.Gt: "__imks_gt__", ast.GtE: "__imks_ge__",
+                     ast.Eq: "__imks_eq__", ast.NotEq: "__imks_ne__"}
+
+
+#####################################################################
+# Inference
+
+# Type of plain numbers (int and float literals or variables): for all
+# other expressions the type is a Unit, for relative quantities, or None
+NUMBER = "number"
+
+# Statements binding a name
+definition_nodes = (ast.FunctionDef, ast.ClassDef)
+if hasattr(ast, "AsyncFunctionDef"):
+    definition_nodes += (ast.AsyncFunctionDef,)
+
+
+def constant(node):
+    """Return (True, value) if node is a number or string constant."""
+    if hasattr(ast, "Constant") and isinstance(node, ast.Constant):
+        return True, node.value
+    if isinstance(node, ast.Num):
+        return True, node.n
+    if isinstance(node, ast.Str):
+        return True, node.s
+    return False, None
+
+
+def assigned_names(node):
+    """Set of all the names bound or deleted anywhere inside node."""
+    names = set()
+    for n in ast.walk(node):
+        if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+            names.add(n.id)
+        elif isinstance(n, definition_nodes):
+            names.add(n.name)
+        elif isinstance(n, (ast.Import, ast.ImportFrom)):
+            for alias in n.names:
+                names.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(n, ast.Global) or \
+                (hasattr(ast, "Nonlocal") and isinstance(n, ast.Nonlocal)):
+            names.update(n.names)
+        elif isinstance(n, ast.ExceptHandler) and isinstance(n.name, basestring):
+            names.add(n.name)
+        elif isinstance(n, ast.arg if hasattr(ast, "arg") else ()):
+            names.add(n.arg)
+    return names
+
+
+def nonzero(node):
+    """Check if node is a literal with a nonzero value.
+
+    Numbers and quantity literals, such as `Value(3.0, "m")`, are recognized;
+    the numerical value can also be given to an engine function as a string,
+    as in `Value(ufloat("3.0"), "m")`.
+    """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        return nonzero(node.operand)
+    if isinstance(node, ast.Call):
+        if len(node.args) not in (1, 2) or node.keywords:
+            return False
+        node = node.args[0]
+        if isinstance(node, ast.Call):
+            if len(node.args) != 1 or node.keywords:
+                return False
+            node = node.args[0]
+    ok, value = constant(node)
+    if ok and isinstance(value, basestring):
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+    return ok and isinstance(value, (int, float)) and value != 0
+
+
+def value_type(value):
+    """Type of a value of the user namespace."""
+    if isinstance(value, Quantity):
+        return value.unit if value.absolute is False else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return NUMBER
+    return None
+
+
+def join(env1, env2):
+    """Types valid after either of two code paths."""
+    return dict((k, v) for k, v in env1.items() if env2.get(k) is v)
+
+
+def kill(env, names):
+    """Forget the types of names."""
+    for name in names:
+        env.pop(name, None)
+    return env
+
+
+class DimensionAnalyzer(object):
+    """Infer the units of a syntax tree, rewriting the proven operations.
+
+    The types of the variables are kept in an environment dictionary, which
+    maps names to units or to NUMBER.  When `emit` is false the tree is only
+    analyzed, without changes and without errors: this is used to find the
+    fixed point of loops.
+    """
+    def __init__(self, namespace=None):
+        self.namespace = namespace if namespace is not None else {}
+        self.tolerant = units.tolerant
+        self.emit = True
+        self.used = False
+        self.literals = True
+
+    def run(self, tree):
+        """Analyze a module or an expression tree, returning the new tree.
+
+        :param ast.AST tree:  tree produced by ast.parse
+        :raises UnitCompatibilityError:  if incompatible units are found
+        """
+        self.literals = self.namespace.get("Value", units.Value) is units.Value \
+            and "Value" not in assigned_names(tree)
+        env = {}
+        for n in ast.walk(tree):
+            if isinstance(n, ast.Name) and n.id in self.namespace:
+                t = value_type(self.namespace[n.id])
+                if t is not None:
+                    env[n.id] = t
+        if isinstance(tree, ast.Expression):
+            tree.body = self.expr(tree.body, env)[0]
+        else:
+            self.block(tree.body, env)
+        if self.used:
+            for name, f in unchecked_operators.items():
+                self.namespace.setdefault(name, f)
+        return ast.fix_missing_locations(tree)
+
+    def error(self, u1, u2, node):
+        if self.emit:
+            raise UnitCompatibilityError(u1, u2, "line %d" % node.lineno)
+
+    def call(self, name, args, node):
+        self.used = True
+        return ast.copy_location(ast.Call(func=ast.Name(id=name, ctx=ast.Load()),
+                                          args=args, keywords=[]), node)
+
+    # Statements
+
+    def block(self, body, env):
+        """Analyze a list of statements, updating env in place."""
+        for n, stmt in enumerate(body):
+            new = self.stmt(stmt, env)
+            if self.emit:
+                body[n] = new
+
+    def stmt(self, node, env):
+        method = getattr(self, "stmt_" + node.__class__.__name__, None)
+        if method:
+            return method(node, env)
+        # Generic statement: be conservative on all names bound inside
+        kill(env, assigned_names(node))
+        self.generic(node, env)
+        kill(env, assigned_names(node))
+        return node
+
+    def stmt_Expr(self, node, env):
+        node.value = self.replace(node.value, env)
+        return node
+
+    def stmt_Assign(self, node, env):
+        value, t = self.expr(node.value, env)
+        if self.emit:
+            node.value = value
+        for target in node.targets:
+            self.generic(target, env)
+        kill(env, assigned_names(node))
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and t is not None:
+            env[node.targets[0].id] = t
+        return node
+
+    def stmt_AugAssign(self, node, env):
+        value, t = self.expr(node.value, env)
+        if self.emit:
+            node.value = value
+        if not isinstance(node.target, ast.Name):
+            self.generic(node.target, env)
+            return node
+        name = node.target.id
+        result, fast = self.binop(node.op, env.get(name), t, node,
+                                  node.target, node.value)
+        kill(env, [name])
+        if result is not None:
+            env[name] = result
+        if fast and self.emit and node.op.__class__ in augmented_operators:
+            load = ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node.target)
+            call = self.call(augmented_operators[node.op.__class__], [load, value], node)
+            return ast.copy_location(ast.Assign(targets=[node.target], value=call), node)
+        return node
+
+    def stmt_If(self, node, env):
+        node.test = self.replace(node.test, env)
+        orelse = dict(env)
+        self.block(node.body, env)
+        self.block(node.orelse, orelse)
+        new = join(env, orelse)
+        env.clear()
+        env.update(new)
+        return node
+
+    def loop(self, node, env, body):
+        """Analyze a loop, whose body is analyzed by body(env)."""
+        head = dict(env)
+        if any(isinstance(n, (ast.Break, ast.Continue)) for n in ast.walk(node)):
+            kill(head, assigned_names(node))
+        emit, self.emit = self.emit, False
+        while True:
+            end = dict(head)
+            body(end)
+            new = join(head, end)
+            if len(new) == len(head):
+                break
+            head = new
+        self.emit = emit
+        body(dict(head))
+        env.clear()
+        env.update(head)
+        self.block(node.orelse, env)
+
+    def stmt_For(self, node, env):
+        node.iter = self.replace(node.iter, env)
+
+        def body(e):
+            kill(e, assigned_names(node.target))
+            self.block(node.body, e)
+        self.loop(node, env, body)
+        return node
+
+    stmt_AsyncFor = stmt_For
+
+    def stmt_While(self, node, env):
+        def body(e):
+            node.test = self.replace(node.test, e)
+            self.block(node.body, e)
+        self.loop(node, env, body)
+        return node
+
+    def stmt_FunctionDef(self, node, env):
+        # Decorators and defaults are evaluated now, the body when the function
+        # is called: at that time the global variables might have changed
+        self.generic_list(node.decorator_list, env)
+        self.generic(node.args, env)
+        if getattr(node, "returns", None) is not None:
+            self.generic(node.returns, env)
+        self.block(node.body, {})
+        kill(env, [node.name])
+        return node
+
+    stmt_AsyncFunctionDef = stmt_FunctionDef
+
+    def stmt_ClassDef(self, node, env):
+        for field in ("bases", "keywords", "decorator_list"):
+            self.generic_list(getattr(node, field, []), env)
+        self.block(node.body, dict(env))
+        kill(env, [node.name])
+        return node
+
+    # Expressions
+
+    def replace(self, node, env):
+        """Analyze an expression, returning the (possibly) new node."""
+        new = self.expr(node, env)[0]
+        return new if self.emit else node
+
+    def generic(self, node, env):
+        """Analyze all expressions inside node, whatever it is."""
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp,
+                             ast.DictComp, ast.GeneratorExp)):
+            # New scope: lambda bodies are evaluated later, comprehensions now
+            env = {} if isinstance(node, ast.Lambda) else \
+                kill(dict(env), assigned_names(node))
+        for field, old in ast.iter_fields(node):
+            if isinstance(old, ast.expr):
+                setattr(node, field, self.replace(old, env))
+            elif isinstance(old, ast.AST):
+                self.generic(old, env)
+            elif isinstance(old, list):
+                if old and isinstance(old[0], ast.stmt):
+                    self.block(old, kill(dict(env), assigned_names(node)))
+                    continue
+                self.generic_list(old, env)
+
+    def generic_list(self, items, env):
+        """Analyze a list of expressions or of other nodes."""
+        for n, item in enumerate(items):
+            if isinstance(item, ast.expr):
+                items[n] = self.replace(item, env)
+            elif isinstance(item, ast.AST):
+                self.generic(item, env)
+
+    def expr(self, node, env):
+        """Analyze an expression, returning the new node and its type."""
+        method = getattr(self, "expr_" + node.__class__.__name__, None)
+        if method:
+            return method(node, env)
+        ok, value = constant(node)
+        if ok:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return node, NUMBER
+            return node, None
+        self.generic(node, env)
+        return node, None
+
+    def expr_Name(self, node, env):
+        if isinstance(node.ctx, ast.Load):
+            return node, env.get(node.id)
+        return node, None
+
+    def expr_Call(self, node, env):
+        self.generic(node, env)
+        if self.literals and isinstance(node.func, ast.Name) and \
+                node.func.id == "Value" and len(node.args) == 2 and \
+                not node.keywords:
+            ok, u = constant(node.args[1])
+            if ok and isinstance(u, basestring) and not units.has_quotes(u):
+                try:
+                    v = units.unit_parser(u)[0]
+                except Exception:
+                    return node, None
+                if isinstance(v, Quantity) and v.absolute is False:
+                    return node, v.unit
+        return node, None
+
+    def expr_UnaryOp(self, node, env):
+        node.operand, t = self.expr(node.operand, env)
+        if isinstance(node.op, (ast.UAdd, ast.USub)):
+            return node, t
+        return node, None
+
+    def binop(self, op, t1, t2, node, left=None, right=None):
+        """Type of a binary operation, and whether it is proven.
+
+        In tolerant mode, incompatible units are reported only if both
+        operands (the left and right nodes) are nonzero literals.
+
+        :return tuple:  the result type and True if the operands are two
+                        quantities (with the same unit, for sums)
+        """
+        if t1 is None or t2 is None:
+            return None, False
+        if t1 is NUMBER and t2 is NUMBER:
+            return NUMBER, False
+        if isinstance(op, (ast.Add, ast.Sub)):
+            u1 = units.dimensionless if t1 is NUMBER else t1
+            u2 = units.dimensionless if t2 is NUMBER else t2
+            if u1 is not u2:
+                if not self.tolerant or (nonzero(left) and nonzero(right)):
+                    # Same order as in the error raised by check_units
+                    if t1 is NUMBER:
+                        u1, u2 = u2, u1
+                    self.error(u1, u2, node)
+                return None, False
+            return u1, t1 is not NUMBER and t2 is not NUMBER
+        if isinstance(op, ast.Mult):
+            if t1 is NUMBER:
+                return t2, False
+            if t2 is NUMBER:
+                return t1, False
+            return t1 + t2, True
+        if isinstance(op, ast.Div):
+            if t1 is NUMBER:
+                return -t2, False
+            if t2 is NUMBER:
+                return t1, False
+            return t1 - t2, True
+        return None, False
+
+    def expr_BinOp(self, node, env):
+        node.left, t1 = self.expr(node.left, env)
+        node.right, t2 = self.expr(node.right, env)
+        if isinstance(node.op, ast.Pow):
+            ok, e = constant(node.right)
+            if t1 is not None and t1 is not NUMBER and ok and \
+                    isinstance(e, (int, float)) and not isinstance(e, bool):
+                return node, t1 * e
+            return node, NUMBER if t1 is NUMBER and t2 is NUMBER else None
+        t, fast = self.binop(node.op, t1, t2, node, node.left, node.right)
+        if fast and self.emit and node.op.__class__ in binary_operators:
+            return self.call(binary_operators[node.op.__class__],
+                             [node.left, node.right], node), t
+        return node, t
+
+    def expr_Compare(self, node, env):
+        node.left, t = self.expr(node.left, env)
+        types = [t]
+        for n, comparator in enumerate(node.comparators):
+            node.comparators[n], t = self.expr(comparator, env)
+            types.append(t)
+        operands = [node.left] + node.comparators
+        for n, op in enumerate(node.ops):
+            if op.__class__ in compare_operators:
+                self.binop(ast.Sub(), types[n], types[n + 1], node,
+                           operands[n], operands[n + 1])
+        if len(node.ops) == 1 and node.ops[0].__class__ in compare_operators and \
+                types[0] is not None and types[0] is types[1] and \
+                types[0] is not NUMBER and self.emit:
+            return self.call(compare_operators[node.ops[0].__class__],
+                             [node.left, node.comparators[0]], node), None
+        return node, None
+
+
+def analyze(tree, namespace=None):
+    """Infer the units of the code in tree, rewriting the proven operations.
+
+    The unchecked operators used by the new tree are added to namespace.
+
+    :param ast.AST tree:      syntax tree of the transformed code (a module
+                              or an expression)
+    :param dict namespace:    user namespace used to execute the code
+    :return ast.AST:          the new syntax tree
+    :raises UnitCompatibilityError:  if incompatible units are found
+    """
+    return DimensionAnalyzer(namespace).run(tree)
+
+
+class ShellTransformer(ast.NodeTransformer):
+    """AST transformer performing the dimension analysis in IPython."""
+    def __init__(self, shell):
+        super(ShellTransformer, self).__init__()
+        self.shell = shell
+
+    def visit(self, node):
+        from .config import config
+        if not config["enabled"] or not config["dimension_analysis"]:
+            return node
+        try:
+            return analyze(node, self.shell.user_ns)
+        except UnitCompatibilityError as e:
+            from IPython.core.error import InputRejected
+            raise InputRejected(str(e))
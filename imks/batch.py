@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Non-interactive evaluation of streams of imks expressions.
+
+This module implements the command ``python -m imks eval``: the input
+(standard input or files) is split into cells, each a single expression or
+statement in the imks syntax (see `split_cells`), that are evaluated in order
+in one Session; the results are written as they are produced, either as text
+or as JSON lines carrying the value, the unit, and the uncertainty:
+
+> echo "(3+/-0.1)[km/h] @ [m/s]" | python -m imks eval -e umath -f jsonl
+
+With --jobs N the cells are evaluated by N worker processes, each with its own
+session: they must therefore be independent from each other, and definitions
+shared by all cells should be loaded as scripts (--scripts).  The cells are
+sent to the workers in blocks, so that the input is never read in full, and
+the results are still written in the input order.
+
+The output printed by a cell is captured: it precedes the result in the text
+format, and it is stored in the "output" field of the record in the jsonl
+format, so that the records remain valid JSON lines.
+"""
+
+from __future__ import absolute_import, division, print_function
+import io
+import json
+import sys
+import tokenize
+from contextlib import redirect_stdout
+
+# Keywords that continue a compound statement at the same indentation, and
+# that start one
+continuation_keywords = ("else", "elif", "except", "finally")
+compound_keywords = ("if", "for", "while", "try", "with", "def", "class",
+                     "async")
+
+# Cells sent at once to a worker, and blocks of chunks read from the input
+chunk_size = 64
+chunks_per_job = 4
+
+
+def is_complete(source):
+    """Check if source ends with a complete logical line.
+
+    The test is done on the tokens of the imks source: it only fails for
+    unbalanced brackets, line continuations, unterminated triple quoted
+    strings, and decorators without their definition.
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    except tokenize.TokenError as e:
+        return not e.args[0].startswith("EOF")
+    except (SyntaxError, ValueError):
+        return True
+    last = [t for t in tokens
+            if t.type not in (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT,
+                              tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER)]
+    line = last[-1].line if last else ""
+    return not line.lstrip().startswith("@")
+
+
+def split_cells(lines):
+    """Group lines into cells to be evaluated one at a time.
+
+    A cell is made of a line followed by its indented lines (so that compound
+    statements are kept together), by the lines that continue the statement
+    (because of open brackets or backslashes), and by the clauses (e.g.,
+    else or except) of compound statements.  Empty lines and comments are
+    skipped.  Simple statements and expressions on a single line are returned
+    as soon as they are read.
+
+    :param lines:  an iterable of lines
+    :return:       a generator of tuples (number of the first line, cell)
+    """
+    cell = []
+    start = 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if cell:
+            if not stripped or line[0] in " \t" or \
+                    stripped.split(None, 1)[0].rstrip(":") in \
+                    continuation_keywords or \
+                    not is_complete("\n".join(cell) + "\n"):
+                cell.append(line)
+                continue
+            yield start, "\n".join(cell).rstrip()
+            cell = []
+        if stripped and not stripped.startswith("#"):
+            if stripped[-1] != ":" and \
+                    stripped.split(None, 1)[0].rstrip(":") not in \
+                    compound_keywords and is_complete(line + "\n"):
+                yield number, stripped
+            else:
+                cell = [line]
+                start = number
+    if cell:
+        yield start, "\n".join(cell).rstrip()
+
+
+def format_result(result, fmt, filename=None, line=None):
+    """Format a result for the output.
+
+    :param Result result:  the result
+    :param str fmt:        "text" or "jsonl"
+    :param str filename:   the name of the input
+    :param int line:       the number of the first line of the cell
+    :return str:           the output line (without newline), or None if
+                           there is nothing to write
+    """
+    if fmt == "jsonl":
+        if result.error is None and result.value is None and not result.output:
+            return None
+        record = result.as_dict()
+        record["file"] = filename
+        record["line"] = line
+        return json.dumps(record, ensure_ascii=False, sort_keys=True)
+    if result.error is None and result.text:
+        return result.output + result.text
+    return result.output.rstrip("\n") or None
+
+
+# The session of a worker process, created by init_worker
+worker_session = None
+
+
+def init_worker(scripts, engine):
+    """Create the session of a worker process."""
+    global worker_session
+    from .session import Session
+    with redirect_stdout(sys.stderr):
+        worker_session = Session(scripts=scripts, engine=engine)
+
+
+def evaluate_cell(session, cell):
+    """Evaluate a cell, returning the error and the printed output in the result."""
+    from .session import Result
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            result = session.evaluate(cell)
+    except Exception as e:
+        result = Result(cell, error="%s: %s" % (type(e).__name__, e))
+    result.output = output.getvalue()
+    return result
+
+
+def work(job):
+    """Evaluate and format a cell in a worker process."""
+    fmt, filename, line, cell = job
+    result = evaluate_cell(worker_session, cell)
+    return format_result(result, fmt, filename, line), result.error
+
+
+def read_jobs(inputs, fmt):
+    """Generate the jobs (format, file name, line, cell) of the inputs."""
+    for filename in inputs:
+        if filename == "-":
+            for line, cell in split_cells(sys.stdin):
+                yield fmt, "<stdin>", line, cell
+        else:
+            with io.open(filename, "rt", encoding="utf-8") as f:
+                for line, cell in split_cells(f):
+                    yield fmt, filename, line, cell
+
+
+def run_serial(jobs, scripts, engine):
+    """Evaluate the jobs in order in a single session."""
+    from .session import Session
+    # The output of the scripts would be mixed with the results
+    with redirect_stdout(sys.stderr):
+        session = Session(scripts=scripts, engine=engine)
+    for fmt, filename, line, cell in jobs:
+        result = evaluate_cell(session, cell)
+        yield format_result(result, fmt, filename, line), result.error, \
+            filename, line
+
+
+def run_parallel(jobs, scripts, engine, processes):
+    """Evaluate the jobs in a pool of worker processes, in blocks.
+
+    :raises RuntimeError:  if the sessions of the workers cannot be created
+    """
+    import itertools
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    pool = ProcessPoolExecutor(processes, initializer=init_worker,
+                               initargs=(scripts, engine))
+    try:
+        jobs = iter(jobs)
+        while True:
+            block = list(itertools.islice(jobs,
+                                          processes * chunk_size * chunks_per_job))
+            if not block:
+                break
+            results = pool.map(work, block, chunksize=chunk_size)
+            try:
+                for (_, filename, line, _), (output, error) in \
+                        zip(block, results):
+                    yield output, error, filename, line
+            except BrokenProcessPool:
+                raise RuntimeError("the worker processes could not start "
+                                   "their sessions")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def evaluate_stream(inputs=("-",), fmt="text", scripts=("Startup",),
+                    engine="math", jobs=1, stop=False, output=None,
+                    errors=None):
+    """Evaluate the cells of the inputs and write their results.
+
+    :param inputs:       names of the input files ("-" for the standard input)
+    :param str fmt:      the output format, "text" or "jsonl"
+    :param scripts:      names of the imks scripts loaded by each session
+    :param str engine:   name of the math engine
+    :param int jobs:     number of worker processes (1 to evaluate the cells
+                         in the current process)
+    :param bool stop:    stop at the first error
+    :param output:       the output stream (by default, the standard output)
+    :param errors:       the stream for the error messages (by default, the
+                         standard error)
+    :return int:         the number of errors
+    """
+    output = output or sys.stdout
+    errors = errors or sys.stderr
+    source = read_jobs(inputs, fmt)
+    if jobs > 1:
+        results = run_parallel(source, scripts, engine, jobs)
+    else:
+        results = run_serial(source, scripts, engine)
+    count = 0
+    try:
+        for text, error, filename, line in results:
+            if text is not None:
+                output.write(text + "\n")
+            if error is not None:
+                count += 1
+                errors.write("%s:%d: %s\n" % (filename, line, error))
+                if stop:
+                    break
+    finally:
+        results.close()
+    return count
@@ -8,8 +8,9 @@ from collections import OrderedDict as ODict
 from math import floor
 from unidecode import unidecode
 from . import pycalcal as pcc
-from .units import Value, units
+from .units import Value, get_registry
 from . import geolocation
+from . import transformers
 
 try:
     # noinspection PyCompatibility
@@ -18,6 +19,13 @@ except ImportError:
     # noinspection PyCompatibility
     from __builtin__ import unicode as text
 
+try:
+    # noinspection PyUnboundLocalVariable
+    long
+except NameError:
+    # noinspection PyShadowingBuiltins
+    long = int
+
 
 def caldoc(c):
     import re
@@ -371,7 +379,7 @@ class CalDate(Value):
             delta = y.value
             datetime = self.datetime or not isinstance(delta, (int, long))
         else:
-            delta = y.value / units['day'].value
+            delta = y.value / get_registry().units['day'].value
             datetime = self.datetime or delta != floor(delta)
         if y.absolute:
             raise ValueError("Cannot add two absolute values")
@@ -384,7 +392,7 @@ class CalDate(Value):
                 delta = y.value
                 datetime = self.datetime or not isinstance(delta, (int, long))
             else:
-                delta = y.value / units['day'].value
+                delta = y.value / get_registry().units['day'].value
                 datetime = self.datetime or delta != floor(delta)
             absolute = not y.absolute
         elif isinstance(y, CalDate):
@@ -537,6 +545,11 @@ class CalDate(Value):
             return self.kday_nearest(k)
 
 
+# Dates are never changed in place: their literals can be hoisted out of loops
+if CalDate not in transformers.constant_types:
+    transformers.constant_types.append(CalDate)
+
+
 # JD Dates
 
 class JDDate(CalDate):
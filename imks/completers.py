@@ -42,10 +42,10 @@ class ImksCompleter(object):
 
     def get_prefixes(self, text):
         return filter(lambda x: x.startswith(text) and self.is_ascii(x),
-                      units.prefixes.keys())
+                      units.get_registry().prefixes.keys())
 
     def get_units(self, text):
-        us = units.units.keys()
+        us = units.get_registry().units.keys()
         if config["complete_currencies"] is False or \
                 (config["complete_currencies"] is not True and text.lower() == text):
             us = set(us) - set(currencies.currencydict.keys())
@@ -54,15 +54,15 @@ class ImksCompleter(object):
 
     def get_systems(self, text):
         return filter(lambda x: x.startswith(text) and self.is_ascii(x),
-                      units.systems.keys())
+                      units.get_registry().systems.keys())
 
     def get_prefunits(self, text):
-        us = units.units.keys()
+        us = units.get_registry().units.keys()
         if config["complete_currencies"] is False or \
                 (config["complete_currencies"] is not True and text.lower() == text):
             us = set(us) - set(currencies.currencydict.keys())
         ps = list(filter(lambda x: (x.startswith(text) or text.startswith(x)) and
-                         self.is_ascii(x), units.prefixes.keys()))
+                         self.is_ascii(x), units.get_registry().prefixes.keys()))
         length = len(text)
         # Note that below we do not explicitely add us, since the null prefix
         # is a valid prefix and is already in the list ps.  We do instead add
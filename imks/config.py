@@ -4,11 +4,15 @@ from . import units
 
 config = {"banner": True,
           "enabled": True,
+          "startup_snapshot": True,
+          "script_cache": True,
           "auto_brackets": True,
           "standard_exponent": True,
           "engine": "",
           "sort_units": units.sortunits,
           "unit_tolerant": units.tolerant,
+          "dimension_analysis": False,
+          "constant_pool": True,
           "unit_verbose": units.verbose,
           "prefix_only": units.prefixonly,
           "show_errors": units.showerrors,
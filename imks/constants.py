@@ -21,7 +21,7 @@ class Constants(dict):
     def __getitem__(self, key):
         from .config import internals
         x = dict.__getitem__(self, key)
-        if type(x) is units.Value:
+        if isinstance(x, units.Value):
             return x
         engine_func = getattr(internals["engine_module"], internals["engine"])
         try:
@@ -35,10 +35,10 @@ class Constants(dict):
                 doc += "(%s +/- %s) [%s]" % (x[0], x[1], x[2])
             else:
                 doc += "%s [%s] (exact)" % (x[0], x[2])
-            v.__doc__ = doc
+            v = v & units.Doc(doc)
         except ValueError as s:
             v = units.Value(float("NaN"))
-            v.__doc__ = "Error parsing NIST data: " + str(s)
+            v = v & units.Doc("Error parsing NIST data: " + str(s))
         dict.__setitem__(self, key, v)
         return v
 
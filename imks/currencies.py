@@ -8,7 +8,6 @@ except ImportError:
 
 from . import units
 
-basecurrency = None
 currencydict = {}
 currencytime = None
 
@@ -94,34 +93,36 @@ def getrates(app_id="", offline=False, grace=3, historical=None,
             return None
 
 
-def saverates(app_id="", *args, **kw):
+def saverates(app_id="", registry=None, *args, **kw):
     import time
-    global basecurrency, currencydict, currencytime
-    currency_unit = units.units[basecurrency].unit
+    global currencydict, currencytime
+    reg = registry if registry is not None else units.get_registry()
+    basecurrency = reg.basecurrency
+    currency_unit = reg.units[basecurrency].unit
     rates = getrates(app_id=app_id, *args, **kw)
     timestamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(currencytime))
     if rates:
         for k, v in rates.items():
             if v:
                 c = Currency(rates[basecurrency], currency_unit) \
-                    / units.Value(v)
-                c.__doc__ = currencydict[k]
-                c.__timestamp__ = timestamp
-                c.__source__ = "openexchangerates.org"
-                units.units[k] = c
+                    / units.Value(v) & \
+                    units.Doc(currencydict[k], "openexchangerates.org",
+                              timestamp=timestamp)
+                reg.units[k] = c
                 if k in units.currency_symbols:
-                    units.units[units.currency_symbols[k]] = c
+                    reg.units[units.currency_symbols[k]] = c
                     currencydict[units.currency_symbols[k]] = currencydict[k]
+        reg.bump_generation()
 
 
 def currencies(app_id="", grace=3, historical=None, background=False):
     import threading
-    global basecurrency, currencydict
+    reg = units.get_registry()
     # Check that the ID has been set
     if len(app_id) < 5:
         raise ValueError("Currencies are not available without a valid openexchangerates_id")
     # Check if a currency is a base currency
-    if not basecurrency or basecurrency not in units.baseunits:
+    if not reg.basecurrency or reg.basecurrency not in reg.baseunits:
         raise ValueError("Base currency not defined")
     if historical:
         saverates(app_id=app_id, offline=False,
@@ -132,14 +133,15 @@ def currencies(app_id="", grace=3, historical=None, background=False):
                   grace=grace, strict=(grace == 0))
         # Finally, update all units online using a new thread if requested to do so
         if background:
+            # The thread does not inherit the registry of the current one
             thread = threading.Thread(target=saverates,
-                                      kwargs={'grace': grace})
+                                      kwargs={'app_id': app_id, 'registry': reg,
+                                              'grace': grace})
             thread.setDaemon(True)              # so we can always quit w/o waiting
             thread.start()
 
 
 def reset():
-    global basecurrency, currencydict, currencytime
-    basecurrency = None
+    global currencydict, currencytime
     currencydict = {}
     currencytime = None
@@ -317,7 +317,9 @@ magic commands:
   Define a new input transformer: the regular expression regex is applied to
   each input line, and if a match is found the <transformer> function is
   called together with all named matching groups which must return the
-  transformed input.
+  transformed input.  All transformers are applied in a single scan of the
+  line: if several of them match at the same position, the one defined first
+  is used.
 
 %newformat <name>=<transformer>
   Define a new output format.  When <name> is entered (alone) in a unit
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Math engines as a layer of the user namespace.
+
+The functions of an engine are built once by its module (see, for example,
+units_math.exports) and cached.  The namespaces created by imks (those of
+the standalone shell and of the sessions) do not hold them: their
+__builtins__ is a layer with the Python builtins and the functions of the
+active engine, so that the names are resolved only when used, and the
+variables of the user take precedence over them.  Changing the engine
+refills the layer in place, with two dictionary updates: the functions
+defined in the namespace, which share the layer, see the new engine.
+
+Other namespaces (such as IPython's) receive a copy of the functions of the
+engine; when the engine changes, only the names that still refer to them
+are removed.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+try:
+    import builtins
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import __builtin__ as builtins
+
+# Name of the entry of a layer holding the module of its engine
+engine_key = "__engine__"
+
+
+def new_layer():
+    """Return a new layer without engine, to be used as __builtins__."""
+    layer = dict(vars(builtins))
+    layer[engine_key] = None
+    return layer
+
+
+def get_layer(namespace):
+    """Return the layer of a namespace, or None if it has no layer."""
+    layer = namespace.get("__builtins__")
+    if isinstance(layer, dict) and engine_key in layer:
+        return layer
+    return None
+
+
+def functions(namespace):
+    """Return the names defined by the engine of a namespace layer.
+
+    :return dict:  the names and their values, not including those hidden by
+                   the variables of the namespace (empty if the namespace has
+                   no layer)
+    """
+    layer = get_layer(namespace)
+    if layer is None or layer[engine_key] is None:
+        return {}
+    return dict((k, v) for k, v in layer[engine_key].exports().items()
+                if k not in namespace)
+
+
+def lookup(namespace, name):
+    """Return a name of the namespace, possibly defined by its engine.
+
+    :raises KeyError:  if the name is not defined
+    """
+    try:
+        return namespace[name]
+    except KeyError:
+        layer = get_layer(namespace)
+        if layer is None:
+            raise
+        return layer[name]
+
+
+def switch(namespace, old, new):
+    """Replace the engine of a namespace.
+
+    :param dict namespace:  the namespace
+    :param old:             the module of the current engine, or None (not
+                            used if the namespace has a layer, which knows it)
+    :param new:             the module of the new engine
+    """
+    layer = get_layer(namespace)
+    if layer is None:
+        if old is not None:
+            old.unload(namespace)
+        new.load(namespace)
+        return
+    exports = new.exports()
+    old = layer[engine_key]
+    if old is not None and old is not new and hasattr(old, "deactivate"):
+        old.deactivate()
+    if hasattr(new, "activate"):
+        new.activate()
+    layer.clear()
+    layer.update(vars(builtins))
+    layer.update(exports)
+    layer[engine_key] = new
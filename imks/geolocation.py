@@ -69,12 +69,15 @@ def set_geolocation(address=None, latitude=None, longitude=None, elevation=None,
         except ValueError:
             elevation = units.Value(0, "m")
     # Set the variables
-    latitude = units.Value(loc["latitude"], "deg") | units.System("deg")
-    latitude.__doc__ = "Latitude of the current geographic position, in degrees"
-    longitude = units.Value(loc["longitude"], "deg") | units.System("deg")
-    longitude.__doc__ = "Longitude of the current geographic position, in degrees"
-    timezone.__doc__ = "Timezone (in seconds) of the current geographic position"
-    elevation.__doc__ = "Elevation above see level of the current geographic position"
+    latitude = units.Value(loc["latitude"], "deg") | units.System("deg") & \
+        units.Doc("Latitude of the current geographic position, in degrees")
+    longitude = units.Value(loc["longitude"], "deg") | units.System("deg") & \
+        units.Doc("Longitude of the current geographic position, in degrees")
+    if timezone is not None:
+        timezone = timezone & \
+            units.Doc("Timezone (in seconds) of the current geographic position")
+    elevation = elevation & \
+        units.Doc("Elevation above see level of the current geographic position")
     geolocation = {"address": loc["address"] or address or "",
                    "latitude": latitude,
                    "longitude": longitude,
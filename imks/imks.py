@@ -5,13 +5,16 @@ from IPython.core.inputtransformer import (StatelessInputTransformer,
                                            TokenInputTransformer)
 from ._version import __version__, __date__
 from . import units
-from .transformers import command_transformer, unit_transformer
+from .transformers import (command_transformer, unit_transformer,
+                           cached_unit_transformer, ShellConstantPool)
+from .analysis import ShellTransformer
 from .completers import *
 
 
 def load_ipython_extension(ip):
     from .magics import ImksMagic, change_engine
     from .config import config
+    from . import snapshot
 
     # make sure we have a ~/.imks directory
     import os.path
@@ -25,10 +28,12 @@ def load_ipython_extension(ip):
     
     # set up simplified quantity input
     input_command_transformer = StatelessInputTransformer.wrap(command_transformer)
-    input_unit_transformer = TokenInputTransformer.wrap(unit_transformer)
+    input_unit_transformer = TokenInputTransformer.wrap(cached_unit_transformer)
     for s in (ip.input_splitter, ip.input_transformer_manager): 
         s.logical_line_transforms.insert(0, input_command_transformer()) 
         s.python_line_transforms.extend([input_unit_transformer()])
+    ip.ast_transformers.append(ShellTransformer(ip))
+    ip.ast_transformers.append(ShellConstantPool(ip))
 
     # load symbols
     units.load_variables(ip.user_ns)
@@ -75,7 +80,7 @@ def load_ipython_extension(ip):
             ip.parent.exec_lines = []
 
     # load Startup
-    ip.run_line_magic("load_imks", "Startup")
+    snapshot.load_startup(ip, lambda: ip.run_line_magic("load_imks", "Startup"))
 
     # avoid jedi in case of a recent IPython version
     try:
@@ -1420,11 +1420,7 @@ class imks_magic(Magics):
         tokens = tokenize.generate_tokens(StringIO(value.strip()).readline)
         evalue = self.shell.ev(tokenize.untokenize(
             unit_transformer([t for t in tokens])))
-        evalue = evalue & units.Doc(doc, value)
-        try:
-            evalue.__source__ = value.strip()
-        except AttributeError:
-            pass
+        evalue = evalue & units.Doc(doc, value.strip())
         for name in names:
             self.shell.user_ns[name.strip()] = evalue
         return
@@ -1647,12 +1643,12 @@ class imks_magic(Magics):
         u0 = dict([(k, w) for k, w in units.units.iteritems()
                    if k in units.baseunits])
         u1 = dict([(k, w) for k, w in units.units.iteritems()
-                   if k not in units.baseunits and k not in currencies.basecurrency \
+                   if k not in units.baseunits and k not in units.basecurrency \
                    and k not in currencies.currencydict])
         c0 = dict([(k, w) for k, w in units.units.iteritems()
-                   if k in currencies.basecurrency])
+                   if k in units.basecurrency])
         c1 = dict([(k, w) for k, w in units.units.iteritems()
-                    if k not in currencies.basecurrency and \
+                    if k not in units.basecurrency and \
                        k in currencies.currencydict])
         namespaces = []
         if 's' in opts:
@@ -1685,7 +1681,7 @@ class imks_magic(Magics):
             shown = False
             for n, d in namespaces:
                 f = [k for k,v in d.iteritems() \
-                     if unicode(getattr(v, "__doc__", "")).upper().find(name) >= 0]
+                     if unicode(units.getdoc(v) or "").upper().find(name) >= 0]
                 if f:
                     if not shown: print(name)
                     print("%s: %s" % (n, ", ".join(f)))
@@ -1723,13 +1719,14 @@ class imks_magic(Magics):
                     fields.extend([(spaces + "Type", obj.__class__.__name__),
                                    (spaces + "String Form", str(obj)),
                                    (spaces + "Namespace", namespace[0])])
-                    if hasattr(obj, "__source__"):
-                        fields.append((spaces + "Definition", obj.__source__))
-                    fields.append((spaces + "Docstring", obj.__doc__ or
+                    source = units.getsource(obj)
+                    if source is not None:
+                        fields.append((spaces + "Definition", source))
+                    fields.append((spaces + "Docstring", units.getdoc(obj) or
                                    "<no docstring>"))
-                    if hasattr(obj, "__timestamp__"):
-                        fields.append((spaces + "Timestamp",
-                                       obj.__timestamp__ or "<no timestamp>"))
+                    timestamp = units.gettimestamp(obj)
+                    if timestamp is not None:
+                        fields.append((spaces + "Timestamp", timestamp))
                     res.append(self.shell.inspector._format_fields(fields,13+len(spaces)))
                 page.page("\n\n".join(res))
             else:
@@ -1779,10 +1776,10 @@ class imks_magic(Magics):
                     if k1 in units.systems:
                         for k2 in units.systems[k1].repr:
                             k3 = k2.strip(" []")
-                            tmp = units.unityacc.parse(k3, lexer=units.unitlex)
+                            tmp = units.unit_parser(k3)
                             where[str(tmp[1]).strip(" []")] = tmp[0]
                     else:
-                        tmp = units.unityacc.parse(k1, lexer=units.unitlex)
+                        tmp = units.unit_parser(k1)
                         where[str(tmp[1]).strip(" []")] = tmp[0]
             else:
                 where = units.units
@@ -27,6 +27,7 @@ magic = None
 def load_imks(shell=None):
     from .magics import ImksMagic, change_engine
     from .config import config
+    from . import snapshot
     global magic
 
     # make sure we have a ~/.imks directory
@@ -75,7 +76,7 @@ def load_imks(shell=None):
     #        ip.parent.exec_lines = []
 
     # load Startup
-    magic.load_imks("Startup")
+    snapshot.load_startup(magic.shell, lambda: magic.load_imks("Startup"))
     
     if config["banner"]:
         print("Welcome to iMKS %s - © Marco Lombardi %s" % (__version__, __date__))
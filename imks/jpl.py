@@ -1,6 +1,6 @@
 from lxml import html
 import requests
-from .units import Value
+from .units import Value, Doc
 from .config import *
 
 planet_table = """
@@ -49,10 +49,10 @@ def JPLconst(value, error, unit, name="", absolute=False):
             doc += "(%s +/- %s) [%s]" % (value, error, unit)
         else:
             doc += "%s [%s]" % (value, unit)
-        v.__doc__ = doc
+        v = v & Doc(doc)
     except ValueError as s:
         v = Value(float("NaN"))
-        v.__doc__ = "Error parsing JPL data: " + str(s)
+        v = v & Doc("Error parsing JPL data: " + str(s))
     return v
 
 
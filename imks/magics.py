@@ -13,8 +13,9 @@ except NameError:
     from .shell import Magics, magics_class, line_magic
     page = print
 
-from . import units, currencies, calendars
-from .transformers import command_transformer, unit_transformer, transform
+from . import units, currencies, calendars, engines
+from .transformers import (command_transformer, unit_transformer, transform,
+                           compile_transformers)
 from ._version import __version__, __date__
 
 try:
@@ -31,17 +32,43 @@ def change_engine(namespace, newengine):
     except:
         print("Cannot load engine %s" % newengine)
         raise ImportError
-    if internals["engine_module"]:
-        internals["engine_module"].unload(namespace)
+    old_module = internals["engine_module"]
     try:
-        my_module.load(namespace)
+        engines.switch(namespace, old_module, my_module)
         internals["engine"] = "ufloat"
     except:
         print("Cannot load engine %s" % newengine)
-        internals["engine_module"].load(namespace)
+        if old_module is not None:
+            engines.switch(namespace, None, old_module)
         raise ImportError
     internals["engine_module"] = my_module
 
+
+def find_imks_script(shell, module):
+    """Find an imks script and read its code.
+
+    The script is searched first in the current directory, then in the ~/.imks
+    directory, and finally in the /script directory under the package location.
+
+    :param shell:       the shell, used to read the code
+    :param str module:  name of the script, with or without the .imks extension
+    :return tuple:      the path of the script and its code, or (None, None)
+    """
+    import os
+    filename = module
+    if os.path.splitext(filename)[1] == "":
+        filename += ".imks"
+    paths = [filename]
+    if not os.path.isabs(filename):
+        paths.append(os.path.join(os.environ["HOME"], ".imks", filename))
+        paths.append(os.path.join(os.path.dirname(units.__file__), "scripts",
+                                  filename))
+    for path in paths:
+        try:
+            return path, shell.find_user_code(path, py_only=True)
+        except:
+            pass
+    return None, None
     
 @magics_class
 class ImksMagic(Magics):
@@ -67,6 +94,9 @@ class ImksMagic(Magics):
           -e <on|off>  allow the use of the caret (^) as an exponent (**) [%s]
           -t <on|off>  toggle the zero-value tolerance.  When enabled, zero values
                        are sum-compatible with any unit [%s]
+          -i <on|off>  toggle the static dimension analysis.  When enabled, the units
+                       of each input are checked before its execution, and the
+                       proven operations are executed without further checks [%s]
           -s <on|off>  toggle the sorting of compound units.  When enabled, compound
                        units are sorted to show first positive units [%s]
           -k <on|off>  toggle the use of prefixes without units.  When enabled, one
@@ -77,7 +107,8 @@ class ImksMagic(Magics):
           -$ <0|1|2>   do not complete currencies (0), complete them only if capital
                        letters are present (1), or complete them anyway (2) [%s]
           -c <name>    specify the engine for mathematical calculations: must be one
-                       of math, mpmath, fpmath, numpy, umath, soerp, mcerp [%s]
+                       of math, mpmath, fpmath, numpy, umath, uarray, soerp,
+                       mcerp [%s]
           -o <0|1|2>   ignore errors on outputs (0), use them only to set the number
                        of significant digits (1), or show them (2) [%d]
           -d <cal>     default calendar to interpret dates (XXXX.YY.ZZ [HH[:MM[:SS]]])
@@ -99,6 +130,7 @@ class ImksMagic(Magics):
             ("on" if config["auto_brackets"] else "off",
              "on" if config["standard_exponent"] else "off",
              "on" if config["unit_tolerant"] else "off",
+             "on" if config["dimension_analysis"] else "off",
              "on" if config["sort_units"] else "off",
              "on" if config["prefix_only"] else "off",
              "2" if config["unit_verbose"] is True else
@@ -113,11 +145,12 @@ class ImksMagic(Magics):
     @line_magic
     def imks(self, args):
         def imks_print(*p_args, **p_kwargs):
-            if units.units or len(units.prefixes) > 1:
+            if reg.units or len(reg.prefixes) > 1:
                 print(*p_args, **p_kwargs)
                 
         from .config import config
-        opts, name = self.parse_options(args, 'ha:e:u:s:k:t:$:c:m:M:p:o:d:v:')
+        reg = units.get_registry()
+        opts, name = self.parse_options(args, 'ha:e:u:s:k:t:i:$:c:m:M:p:o:d:v:')
         if name in ["on", "1", "yes"]:
             config["enabled"] = True
             imks_print("iMKS enabled")
@@ -132,7 +165,7 @@ class ImksMagic(Magics):
             from . import doc
             page(doc.__doc__)
             ImksMagic.imks_doc()
-            if not units.units and len(units.prefixes) <= 1:
+            if not reg.units and len(reg.prefixes) <= 1:
                 config["banner"] = False
                 self.shell.confirm_exit = False
                 self.shell.exit()
@@ -166,10 +199,10 @@ class ImksMagic(Magics):
                 print("Incorrect argument.  Use yes/on/1 or no/off/0")
         if "k" in opts:
             if opts["k"] in ["on", "1", "yes"]:
-                config["prefix_only"] = units.prefixonly = True
+                config["prefix_only"] = reg.prefixonly = True
                 imks_print("Prefix without unit accepted")
             elif opts["k"] in ["off", "0", "no"]:
-                config["prefix_only"] = units.prefixonly = False
+                config["prefix_only"] = reg.prefixonly = False
                 imks_print("Prefix without unit not accepted")
             else:
                 print("Incorrect argument.  Use yes/on/1 or no/off/0")
@@ -182,6 +215,15 @@ class ImksMagic(Magics):
                 imks_print("Zero-value tolerance disabled")
             else:
                 print("Incorrect argument.  Use yes/on/1 or no/off/0")
+        if "i" in opts:
+            if opts["i"] in ["on", "1", "yes"]:
+                config["dimension_analysis"] = True
+                imks_print("Static dimension analysis enabled")
+            elif opts["i"] in ["off", "0", "no"]:
+                config["dimension_analysis"] = False
+                imks_print("Static dimension analysis disabled")
+            else:
+                print("Incorrect argument.  Use yes/on/1 or no/off/0")
         if "v" in opts:
             if opts["v"] in ["on", "2", "yes"]:
                 config["unit_verbose"] = units.verbose = True
@@ -208,7 +250,7 @@ class ImksMagic(Magics):
                 print("Incorrect argument.  Use yes/on/2, maybe/perhaps/1, or no/off/0")
         if "c" in opts:
             if opts["c"] in ["math", "mpmath", "fpmath", "numpy",
-                             "umath", "soerp", "mcerp"]:
+                             "umath", "uarray", "soerp", "mcerp"]:
                 try:
                     change_engine(self.shell.user_ns, opts["c"])
                     imks_print("iMKS math engine: %s.  Consider doing a %%reset." %
@@ -216,7 +258,7 @@ class ImksMagic(Magics):
                 except ImportError:
                     pass
             else:
-                print("Incorrect argument: must be math, mpmath, fpmath, numpy, umath, soerp, or mcerp.")
+                print("Incorrect argument: must be math, mpmath, fpmath, numpy, umath, uarray, soerp, or mcerp.")
                 return
             config["engine"] = opts["c"]
         if "o" in opts:
@@ -233,7 +275,8 @@ class ImksMagic(Magics):
                 print("Incorrect argument: must be 0, 1, or 2")
                 return
         if "p" in opts:
-            self.shell.user_ns["mp"].dps = config["digits"] = int(opts["p"])
+            engines.lookup(self.shell.user_ns, "mp").dps = config["digits"] = \
+                int(opts["p"])
             imks_print("Precision set to %d digits" % config["digits"])
         if "m" in opts or "M" in opts:
             from . import units_mpmath
@@ -260,33 +303,17 @@ class ImksMagic(Magics):
 
         The modules are searched first in the current directory, then in the ~/.imks
         directory, and finally in the /script directory under the package location. The
-        latter location contains the standard modules distributed with imks.
+        latter location contains the standard modules distributed with imks.  The
+        compiled modules are cached in the ~/.imks/cache directory.
         """
-        import os
+        from . import snapshot, scriptcache
         ip = self.shell
         modules = arg.split(",")
         for module in modules:
-            code = None
-            filename = module.strip()
-            if os.path.splitext(filename)[1] == "":
-                filename += ".imks"
-            try:
-                code = ip.find_user_code(filename, py_only=True)
-            except:
-                if not os.path.isabs(filename):
-                    try:
-                        path = os.path.join(os.environ["HOME"], ".imks",
-                                            filename)
-                        code = ip.find_user_code(path, py_only=True)
-                    except:
-                        try:
-                            path = os.path.dirname(units.__file__)
-                            path = os.path.join(path, "scripts", filename)
-                            code = ip.find_user_code(path, py_only=True)
-                        except:
-                            pass
+            path, code = find_imks_script(ip, module.strip())
             if code:
-                ip.run_cell(code)
+                snapshot.record_script(module.strip(), path, code)
+                scriptcache.run_script(ip, path, code)
             else:
                 raise ImportError("Could not find imks file named %s" %
                                   module.strip())
@@ -316,8 +343,9 @@ class ImksMagic(Magics):
         """
         from .config import internals
         ip = self.shell
+        reg = units.get_registry()
         oldkeys = set(ip.user_ns.keys())
-        oldunits = set(units.units.keys())
+        oldunits = set(reg.units.keys())
         exts = arg.split()
         silent = False
         if len(exts) == 0:
@@ -371,7 +399,7 @@ class ImksMagic(Magics):
                     internals["extensions"].discard(ext)
                     print("Unknown extension `%s'." % ext)
         newkeys = set(ip.user_ns.keys())
-        newunits = set(units.units.keys())
+        newunits = set(reg.units.keys())
         if not silent:
             from textwrap import wrap
             if newkeys != oldkeys:
@@ -572,12 +600,13 @@ class ImksMagic(Magics):
         separated by | as in %newsystem.  Do not use any argument to unset the
         default unit system.
         """
+        reg = units.get_registry()
         if len(arg) == 0:
-            units.defaultsystem = None
+            reg.defaultsystem = None
         else:
-            units.defaultsystem = units.System(*[v.strip("[] ")
-                                                 for v in arg.split("|")])
-            units.cachedat = {}
+            reg.defaultsystem = units.System(*[v.strip("[] ")
+                                               for v in arg.split("|")])
+            reg.cachedat = {}
 
     @line_magic
     def let(self, arg):
@@ -594,11 +623,7 @@ class ImksMagic(Magics):
         tmp = command.split("=")
         names, value = tmp[:-1], tmp[-1]
         evalue = self.shell.ev(transform(value))
-        evalue = evalue & units.Doc(doc, value)
-        try:
-            evalue.__source__ = value.strip()
-        except AttributeError:
-            pass
+        evalue = evalue & units.Doc(doc, value.strip())
         for name in names:
             self.shell.user_ns[name.strip()] = evalue
         return
@@ -709,8 +734,18 @@ class ImksMagic(Magics):
             raise SyntaxError("column sign not found")
         cregex = re.compile(regex)
         self.checkvalidname(name)
+        old = config["intrans"].get(name, None)
         config["intrans"][name] = (cregex, trans[1:].strip()) & \
             units.Doc(doc, regex + " : " + trans[1:])
+        try:
+            compile_transformers()
+        except re.error:
+            if old is None:
+                del config["intrans"][name]
+            else:
+                config["intrans"][name] = old
+            compile_transformers()
+            raise
         return
 
     @line_magic
@@ -722,6 +757,7 @@ class ImksMagic(Magics):
         """
         from .config import config
         del config["intrans"][arg.strip()]
+        compile_transformers()
         return
 
     @line_magic
@@ -740,7 +776,8 @@ class ImksMagic(Magics):
             raise SyntaxError("equal sign not found")
         name, value = command[0:i], command[i+1:]
         self.checkvalidname(name)
-        units.formats[name] = eval(value, self.shell.user_ns) & units.Doc(doc, value)
+        units.get_registry().formats[name] = eval(value, self.shell.user_ns) & \
+            units.Doc(doc, value)
         return
 
     @line_magic
@@ -750,7 +787,7 @@ class ImksMagic(Magics):
            Usage:
              %delformat name
         """
-        del units.formats[arg.strip()]
+        del units.get_registry().formats[arg.strip()]
         return
 
     @line_magic
@@ -779,21 +816,22 @@ class ImksMagic(Magics):
         if name == "":
             self.shell.run_line_magic("imks", "-h")
             return
-        u0 = dict([(k, w) for k, w in units.units.items()
-                   if k in units.baseunits])
-        u1 = dict([(k, w) for k, w in units.units.items()
-                   if k not in units.baseunits and k not in currencies.basecurrency
+        reg = units.get_registry()
+        u0 = dict([(k, w) for k, w in reg.units.items()
+                   if k in reg.baseunits])
+        u1 = dict([(k, w) for k, w in reg.units.items()
+                   if k not in reg.baseunits and k != reg.basecurrency
                    and k not in currencies.currencydict])
-        u2 = dict([(k, units.units[w]) for k, w in units.verbose_units.items()])
-        c0 = dict([(k, w) for k, w in units.units.items()
-                   if k in currencies.basecurrency])
-        c1 = dict([(k, w) for k, w in units.units.items()
-                   if k not in currencies.basecurrency
+        u2 = dict([(k, reg.units[w]) for k, w in reg.verbose_units.items()])
+        c0 = dict([(k, w) for k, w in reg.units.items()
+                   if k == reg.basecurrency])
+        c1 = dict([(k, w) for k, w in reg.units.items()
+                   if k != reg.basecurrency
                    and k in currencies.currencydict])
-        p2 = dict([(k, units.prefixes[w]) for k, w in units.verbose_prefixes.items()])
+        p2 = dict([(k, reg.prefixes[w]) for k, w in reg.verbose_prefixes.items()])
         namespaces = []
         if 's' in opts:
-            namespaces.append(("Unit systems", units.systems))
+            namespaces.append(("Unit systems", reg.systems))
         if 'u' in opts:
             namespaces.extend([("Base units", u0),
                                ("Units", u1)])
@@ -803,32 +841,34 @@ class ImksMagic(Magics):
             namespaces.extend([("Base currencies", c0),
                                ("Currencies", c1)])
         if 'p' in opts:
-            namespaces.append(("Prefixes", units.prefixes))
+            namespaces.append(("Prefixes", reg.prefixes))
         if 'P' in opts:
             namespaces.extend([("Verbose prefixes", p2)])
         if 't' in opts:
             namespaces.append(("Input Transformers", config["intrans"]))
         if 'f' in opts:
-            namespaces.append(("Output Formats", units.formats))
+            namespaces.append(("Output Formats", reg.formats))
         if not namespaces:
-            namespaces = [("Unit systems", units.systems),
+            namespaces = [("Unit systems", reg.systems),
                           ("Base units", u0),
                           ("Base currencies", c0),
                           ("Units", u1),
                           ("Verbose units", u2),
                           ("Currencies", c1),
-                          ("Prefixes", units.prefixes),
+                          ("Prefixes", reg.prefixes),
                           ("Verbose prefixes", p2),
                           ("Input Transformers", config["intrans"]),
-                          ("Output Formats", units.formats)]
+                          ("Output Formats", reg.formats)]
         if 'x' in opts:
-            namespaces.append(("Variables", self.shell.user_ns))
+            namespaces.extend([("Variables", self.shell.user_ns),
+                               ("Engine functions",
+                                engines.functions(self.shell.user_ns))])
         if 'a' in opts:
             name = name.upper()
             shown = False
             for n, d in namespaces:
                 f = [k for k, v in d.items()
-                     if getattr(v, "__doc__", "").upper().find(name) >= 0]
+                     if (units.getdoc(v) or "").upper().find(name) >= 0]
                 if f:
                     if not shown:
                         print(name)
@@ -872,16 +912,18 @@ class ImksMagic(Magics):
                         fields = [(namespace[0].upper(), "")]
                     else:
                         fields = []
-                    fields.extend([(spaces + "Type", obj.__class__.__name__),
+                    fields.extend([(spaces + "Type", "Value" if isinstance(obj, units.ScalarValue)
+                                    else obj.__class__.__name__),
                                    (spaces + "String Form", str(obj)),
                                    (spaces + "Namespace", namespace[0])])
-                    if hasattr(obj, "__source__"):
-                        fields.append((spaces + "Definition", obj.__source__))
-                    fields.append((spaces + "Docstring", obj.__doc__ or
+                    source = units.getsource(obj)
+                    if source is not None:
+                        fields.append((spaces + "Definition", source))
+                    fields.append((spaces + "Docstring", units.getdoc(obj) or
                                    "<no docstring>"))
-                    if hasattr(obj, "__timestamp__"):
-                        fields.append((spaces + "Timestamp",
-                                       obj.__timestamp__ or "<no timestamp>"))
+                    timestamp = units.gettimestamp(obj)
+                    if timestamp is not None:
+                        fields.append((spaces + "Timestamp", timestamp))
                     # noinspection PyProtectedMember
                     res.append(self.shell.inspector._format_fields(fields, 13+len(spaces)))
                 page("\n\n".join(res))
@@ -922,30 +964,30 @@ class ImksMagic(Magics):
         %compatible -l 3 -v -V "c, G, hbar" [s]
         """
         opts, us = self.parse_options(args, "uU:vV:l:")
+        reg = units.get_registry()
         level = int(opts.get("l", 1))
         if us[0] == '[' and us[-1] == ']':
             r = units.Value(1, us.strip("[] "))
         else:
             r = self.shell.ev(transform(us))
         if "v" not in opts:
-            print("Compatible units: ", end="")
             found = []
             if "U" in opts:
                 where = ODict()
                 for k in opts["U"].split(","):
                     k1 = k.strip(" []")
-                    if k1 in units.systems:
-                        for k2 in units.systems[k1].repr:
+                    if k1 in reg.systems:
+                        for k2 in reg.systems[k1].repr:
                             k3 = k2.strip(" []")
-                            tmp = units.unityacc.parse(k3, lexer=units.unitlex)
+                            tmp = units.unit_parser(k3)
                             where[str(tmp[1]).strip(" []")] = tmp[0]
                     else:
-                        tmp = units.unityacc.parse(k1, lexer=units.unitlex)
+                        tmp = units.unit_parser(k1)
                         where[str(tmp[1]).strip(" []")] = tmp[0]
             else:
-                where = units.units
+                where = reg.units
             for u in r.find_compatible(where, level=level):
-                found.append(str(u))
+                found.append(u.show() if isinstance(u, units.UnitTree) else str(u))
             if not found:
                 print("No compatible unit")
             else:
@@ -960,6 +1002,8 @@ class ImksMagic(Magics):
             where = ODict([(k, v) for k, v in where.items()
                            if isinstance(v, units.Value)])
             for u in r.find_compatible(where, level=level):
+                if isinstance(u, units.UnitTree):
+                    u = u.show()
                 uu = str(u).strip("[] ")
                 found.append(uu)
             if not found:
@@ -1046,6 +1090,7 @@ class ImksMagic(Magics):
         This does a full reset: the engine, however, is left unchanged.
         """
         from .config import config
+        from . import snapshot
         import gc
         # this code is from IPython
         ip = self.shell
@@ -1064,7 +1109,7 @@ class ImksMagic(Magics):
         # check if currencies are loaded
         currencies.reset()
         # load Startup
-        ip.run_line_magic("load_imks", "Startup")
+        snapshot.load_startup(ip, lambda: ip.run_line_magic("load_imks", "Startup"))
         # reprint the welcome message
         if config["banner"]:
             print("Welcome to iMKS %s - © Marco Lombardi %s" %
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Compiled cache of the imks scripts loaded by %load_imks.
+
+Loading a script requires its transformation (which splits the magic
+commands and converts the quantities) and its compilation.  The first time a
+script is loaded, the compiled code, together with the literals of its
+constant pool, is saved with marshal in ~/.imks/cache/<name>-<hash>.imksc;
+later loads only read and execute the code.
+
+The compiled code is keyed by the imks and Python versions, by the path,
+modification time, and contents of the script, by the shell (magic commands
+are compiled differently in IPython and in the standalone shell), by the
+settings of the transformers, and by the units and prefixes defined when the
+script is loaded, since they decide which names are taken as units.  The
+cache is not used when the dimension analysis is active, since the analysis
+depends on the current variables, and can be disabled by setting
+config["script_cache"] to False.
+"""
+
+from __future__ import absolute_import, division, print_function
+import ast
+import hashlib
+import marshal
+import os
+import sys
+
+from . import units
+from ._version import __version__
+from .transformers import transform_settings, hoist_constants, constant_pool
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+
+
+def digest(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def cache_path(path):
+    """Return the path of the compiled cache of the script at path."""
+    path = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.environ["HOME"], ".imks", "cache",
+                        "%s-%s.imksc" % (name, digest(path)[:16]))
+
+
+def registry_digest():
+    """Return a digest of the names of the units and prefixes defined."""
+    reg = units.get_registry()
+    names = []
+    for d in (reg.units, reg.prefixes, reg.verbose_units, reg.verbose_prefixes):
+        names.append(u"\0".join(d))
+    names.append(u"%s" % reg.prefixonly)
+    return digest(u"\n".join(names))
+
+
+def script_key(shell, path, code):
+    """Return the key of the compiled code of a script."""
+    return {"version": __version__, "python": tuple(sys.version_info[:3]),
+            "magic": MAGIC_NUMBER, "path": os.path.abspath(path),
+            "mtime": os.path.getmtime(path), "digest": digest(code),
+            "shell": type(shell).__name__, "settings": transform_settings(),
+            "registry": registry_digest()}
+
+
+def compile_script(shell, path, code):
+    """Transform and compile a script.
+
+    :return tuple:  the code object, and the name and sources of its constant
+                    pool (see transformers.hoist_constants)
+    """
+    if hasattr(shell, "compile_cell"):
+        return shell.compile_cell(code)
+    # IPython: the constant pool is created here, before the AST transformers
+    tree = ast.parse(shell.transform_cell(code), path, "exec")
+    tree, name, sources = hoist_constants(tree)
+    tree = shell.transform_ast(tree)
+    return compile(tree, path, "exec", shell.compile.flags, True), name, sources
+
+
+def load(path, key):
+    """Return the compiled code saved at path, if its key is still valid."""
+    try:
+        with open(path, "rb") as f:
+            entry = marshal.load(f)
+    except Exception:
+        return None
+    if not isinstance(entry, tuple) or len(entry) != 4 or entry[0] != key:
+        return None
+    return entry[1:]
+
+
+def save(path, key, compiled):
+    """Save compiled code and its key; return True if it could be saved."""
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(tmp, "wb") as f:
+            marshal.dump((key,) + tuple(compiled), f)
+        getattr(os, "replace", os.rename)(tmp, path)
+        return True
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+
+
+def run_script(shell, path, code):
+    """Run a script, using its compiled cache if possible.
+
+    :param shell:     the shell
+    :param str path:  path of the script
+    :param str code:  code of the script
+    """
+    from .config import config
+    if not config["script_cache"] or not config["enabled"] or \
+            config["dimension_analysis"]:
+        shell.run_cell(code)
+        return
+    key = script_key(shell, path, code)
+    cpath = cache_path(path)
+    compiled = load(cpath, key)
+    if compiled is None:
+        compiled = compile_script(shell, path, code)
+        save(cpath, key, compiled)
+    code, name, sources = compiled
+    with constant_pool(shell.user_ns, name, sources):
+        if hasattr(shell, "compile_cell"):
+            shell.ev(code)
+        else:
+            run_ipython(shell, code, path)
+
+
+def run_ipython(shell, code, path):
+    """Run compiled code in IPython as shell.run_cell would.
+
+    The execution events are triggered, and an exception is shown by the
+    shell instead of being raised.
+
+    :return ExecutionResult:  the result, with the exception if any
+    """
+    from IPython.core.interactiveshell import ExecutionInfo, ExecutionResult
+    source = "%%load_imks %s" % path
+    try:
+        info = ExecutionInfo(source, False, False, True, None)
+    except TypeError:
+        # IPython 7, without cell ids
+        info = ExecutionInfo(source, False, False, True)
+    result = ExecutionResult(info)
+    shell.events.trigger("pre_execute")
+    shell.events.trigger("pre_run_cell", info)
+    try:
+        exec(code, shell.user_global_ns, shell.user_ns)
+    except Exception as e:
+        result.error_in_exec = e
+        shell.showtraceback()
+    finally:
+        shell.events.trigger("post_execute")
+        shell.events.trigger("post_run_cell", result)
+    return result
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""A local conversion service keeping a warm unit registry.
+
+The service is a long-running process, started with
+
+> python -m imks serve
+
+that listens on the Unix socket ~/.imks/service.sock (or another one, with
+--socket), and loads the registry once through
+imks_standalone.load_imks and then keeps it, together with its caches (the
+compiled systems in cachedat, the converters, the transformed cells), for
+all its clients.  The protocol uses JSON lines: each request is an object
+
+    {"id": 1, "method": "convert", "params": {"value": 3, "unit": "km/h",
+                                              "to": "m/s"}}
+
+and each response an object with the same id and either a "result" or an
+"error" field.  The methods are:
+
+  evaluate    evaluate an expression or execute a statement (params:
+              expression), returning the fields of session.Result
+  convert     convert a number or a list of numbers expressed in a unit, or
+              the value of an expression (params: value, to, and optionally
+              unit), returning the value, the uncertainty, and the unit
+  compatible  find the units compatible with a value or a unit in brackets
+              (params: expression, and optionally level), returning the list
+              of unit names
+
+Requests can be pipelined: several requests can be sent without waiting for
+their responses, which are always written in the order of the requests.
+Requests are executed in the shell of the service one at a time, in a thread,
+so that the service keeps reading requests.  Evaluations can instead be
+offloaded to a pool of processes (--processes), each with its own shell: this
+is done for the requests with "offload": true and, by default, for all the
+evaluations if the engine is a slow one (see `heavy_engines`).  Offloaded
+evaluations are independent: they do not see the variables defined by other
+requests.
+
+The service executes arbitrary Python code for its clients: the Unix socket
+is therefore created readable and writable by its owner only.  A TCP port
+(--host and --port) is instead open to all the users of the host, which can
+then run code as the owner of the service: use it only on single-user
+machines.
+"""
+
+from __future__ import absolute_import, division, print_function
+import asyncio
+import json
+import os
+import socket
+import numpy as np
+
+from . import units
+
+# Engines whose evaluations are offloaded by default to the process pool
+heavy_engines = ("mpmath", "fpmath", "soerp", "mcerp")
+
+# Maximum number of pipelined requests of a connection waiting for a response
+max_pipeline = 256
+
+
+def default_socket():
+    """Return the path of the default Unix socket, creating its directory."""
+    path = os.path.join(os.path.expanduser("~"), ".imks")
+    if not os.path.isdir(path):
+        os.makedirs(path, 0o700)
+    return os.path.join(path, "service.sock")
+
+
+def bootstrap(engine="math"):
+    """Load imks in a new standalone shell, using the global registry.
+
+    :param str engine:  name of the math engine
+    :return Shell:      the shell
+    """
+    from .config import config
+    from .magics import change_engine
+    from .shell import Shell
+    from . import imks_standalone
+    config["banner"] = False
+    magic = imks_standalone.load_imks(Shell())
+    if engine != "math":
+        change_engine(magic.shell.user_ns, engine)
+        config["engine"] = engine
+    return magic.shell
+
+
+def evaluate(shell, expression):
+    """Evaluate an expression: see the `evaluate` method of the service."""
+    from .session import Result
+    return Result(expression, shell.run_cell(expression)).as_dict()
+
+
+def convert(shell, value, to, unit=None):
+    """Convert a value: see the `convert` method of the service."""
+    from .session import plain, split_uncertainty
+    to = to.strip("[] ")
+    if unit is None:
+        x = units.converter(None, to)(shell.run_cell(value))
+    else:
+        if isinstance(value, list):
+            value = np.array(value, dtype=float)
+        x = units.converter(unit.strip("[] "), to)(value)
+    number, uncertainty = split_uncertainty(x)
+    return {"value": plain(number), "uncertainty": plain(uncertainty),
+            "unit": to}
+
+
+def compatible(shell, expression, level=1):
+    """Find compatible units: see the `compatible` method of the service."""
+    expression = expression.strip()
+    if expression[0] == '[' and expression[-1] == ']':
+        value = units.Value(1, expression.strip("[] "))
+    else:
+        value = shell.run_cell(expression)
+    if not isinstance(value, units.Value):
+        value = units.Value(value)
+    return [u.show() if isinstance(u, units.UnitTree) else str(u)
+            for u in value.find_compatible(level=level)]
+
+
+methods = {"evaluate": evaluate, "convert": convert, "compatible": compatible}
+
+
+# The shell of a worker process, created by init_worker
+worker_shell = None
+
+
+def init_worker(engine):
+    """Load imks in a worker process."""
+    global worker_shell
+    worker_shell = bootstrap(engine)
+
+
+def call_worker(method, params):
+    """Execute a request in a worker process."""
+    return methods[method](worker_shell, **params)
+
+
+class Service(object):
+    """The conversion service: a warm shell, with its executors."""
+
+    def __init__(self, engine="math", processes=0, offload=None):
+        """Load imks and create the executors.
+
+        :param str engine:     name of the math engine
+        :param int processes:  number of worker processes (0 for no pool)
+        :param bool offload:   offload the evaluations by default (if None,
+                               only for the engines in heavy_engines)
+        """
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        import multiprocessing
+        self.shell = bootstrap(engine)
+        self.executor = ThreadPoolExecutor(1)
+        if processes > 0:
+            self.pool = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(engine,))
+        else:
+            self.pool = None
+        self.offload = engine in heavy_engines if offload is None else offload
+        self.connections = set()
+
+    def close(self):
+        """Shut down the executors."""
+        self.executor.shutdown()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def call(self, method, params):
+        """Execute a request in the shell of the service."""
+        return methods[method](self.shell, **params)
+
+    async def handle(self, request):
+        """Execute a request, returning the response.
+
+        :param dict request:  the request, with method, params, and id
+        :return dict:         the response
+        """
+        loop = asyncio.get_event_loop()
+        response = {"id": request.get("id")}
+        try:
+            method = request["method"]
+            params = request.get("params", {})
+            if method not in methods:
+                raise ValueError("Unknown method %s" % method)
+            if method == "evaluate" and self.pool is not None and \
+                    request.get("offload", self.offload):
+                future = loop.run_in_executor(self.pool, call_worker, method,
+                                              params)
+            else:
+                future = loop.run_in_executor(self.executor, self.call, method,
+                                              params)
+            response["result"] = await future
+        except Exception as e:
+            response["error"] = "%s: %s" % (type(e).__name__, e)
+        return response
+
+    async def respond(self, pending, writer):
+        """Write the responses of a connection in the order of the requests.
+
+        If the client disconnects, the remaining responses are discarded.
+        """
+        connected = True
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            response = await task
+            if not connected:
+                continue
+            try:
+                writer.write(json.dumps(response, ensure_ascii=False)
+                             .encode("utf-8") + b"\n")
+                await writer.drain()
+            except (ConnectionError, OSError):
+                connected = False
+
+    async def connection(self, reader, writer):
+        """Serve the requests of a connection."""
+        current = asyncio.current_task()
+        self.connections.add(current)
+        pending = asyncio.Queue(max_pipeline)
+        responder = asyncio.ensure_future(self.respond(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, OSError):
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be an object")
+                    task = asyncio.ensure_future(self.handle(request))
+                except ValueError as e:
+                    task = asyncio.get_event_loop().create_future()
+                    task.set_result({"id": None,
+                                     "error": "Invalid request: %s" % e})
+                await pending.put(task)
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+            self.connections.discard(current)
+
+    async def start(self, path=None, host=None, port=8765):
+        """Start the server on a Unix socket, or on a TCP port.
+
+        The Unix socket is only accessible to the user running the service.
+
+        :param str path:  path of the Unix socket (by default, the one of
+                          `default_socket`)
+        :param str host:  the host: if set, a TCP port is used instead of
+                          the Unix socket
+        :param int port:  the TCP port
+        :return:          the asyncio server
+        """
+        if host is not None:
+            return await asyncio.start_server(self.connection, host, port)
+        if path is None:
+            path = default_socket()
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.connection, path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        return server
+
+    async def stop(self, server):
+        """Stop a server, waiting for its connections to be closed."""
+        server.close()
+        await server.wait_closed()
+        if self.connections:
+            await asyncio.wait(list(self.connections))
+
+    def serve(self, path=None, host=None, port=8765):
+        """Run the server until interrupted: see `start`."""
+        async def run():
+            server = await self.start(path, host, port)
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+
+class Client(object):
+    """A simple blocking client of the service."""
+
+    def __init__(self, path=None, host=None, port=8765):
+        """Connect to the service: see `Service.start`."""
+        if host is None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path if path is not None else default_socket())
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rb")
+        self.count = 0
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def call_many(self, requests):
+        """Send several requests at once, returning their responses.
+
+        The requests are pipelined in windows of at most max_pipeline
+        requests, whose responses are read before sending the next window:
+        otherwise the client and the service could both block on writing.
+
+        :param requests:  a list of tuples (method, params)
+        :return list:     the responses, in the same order
+        """
+        responses = []
+        for start in range(0, len(requests), max_pipeline):
+            window = requests[start:start + max_pipeline]
+            data = []
+            for method, params in window:
+                self.count += 1
+                data.append(json.dumps({"id": self.count, "method": method,
+                                        "params": params}))
+            self.socket.sendall(("\n".join(data) + "\n").encode("utf-8"))
+            responses.extend(json.loads(self.file.readline().decode("utf-8"))
+                             for _ in window)
+        return responses
+
+    def call(self, method, **params):
+        """Execute a request, returning its result or raising its error."""
+        response = self.call_many([(method, params)])[0]
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
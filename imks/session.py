@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Sessions evaluating imks expressions without an interactive shell.
+
+A Session owns a unit registry, a namespace with the functions of an engine,
+and the magics used by the scripts; its methods return the results as
+`Result` objects, without printing them:
+
+>>> session = Session()
+>>> r = session.evaluate("(3+/-0.1)[km/h] @ [m/s]")
+>>> r.text, r.number, r.unit
+('0.8333333333333334[m s^-1]', 0.8333333333333334, 'm s^-1')
+
+Each session uses its own registry (see units.UnitRegistry), activated only
+while one of its methods runs, so that sessions can be used by different
+threads; calls to the same session are serialized.  The configuration, the
+input transformers (see config.config), and the engine used by the lazy
+constants are shared by all sessions.
+Expressions are transformed and compiled through the transformation cache,
+so that repeated expressions are only executed.
+"""
+
+from __future__ import absolute_import, division, print_function
+import math
+import threading
+
+from . import units, engines
+
+
+class Result(object):
+    """The result of the evaluation of an expression.
+
+    :ivar str expression:  the expression evaluated
+    :ivar value:           the result (None for statements)
+    :ivar str text:        the result as shown (empty for statements)
+    :ivar number:          the number shown, without uncertainty (None if the
+                           result is not a number or a quantity)
+    :ivar str unit:        the unit shown, without brackets
+    :ivar uncertainty:     the uncertainty of number, or None
+    :ivar str error:       the error message, if the evaluation failed
+    :ivar str output:      the output printed by the evaluation, if captured
+    """
+    __slots__ = ("expression", "value", "text", "number", "unit", "uncertainty",
+                 "error", "output")
+
+    def __init__(self, expression, value=None, error=None):
+        self.expression = expression
+        self.value = value
+        self.error = error
+        self.output = ""
+        self.number = self.uncertainty = None
+        self.unit = ""
+        if value is None:
+            self.text = ""
+            return
+        self.text = str(value)
+        if isinstance(value, units.Quantity):
+            parts = value.shown()
+            if parts is None:
+                return
+            number, unit = parts[0], parts[1].show()
+            if isinstance(number, units.Quantity):
+                # Values scaled by a prefix
+                number = number.value
+        else:
+            number, unit = value, ""
+        if isinstance(number, bool) or \
+                not (isinstance(number, (int, float, complex)) or
+                     hasattr(number, "nominal_value") or hasattr(number, "var") or
+                     hasattr(number, "shape")):
+            return
+        self.number, self.uncertainty = split_uncertainty(number)
+        self.unit = unit
+
+    def __repr__(self):
+        if self.error is not None:
+            return "Result(%r, error=%r)" % (self.expression, self.error)
+        return "Result(%r, %r)" % (self.expression, self.text)
+
+    def as_dict(self):
+        """Return the result as a dictionary of plain values (e.g., for JSON)."""
+        return {"expression": self.expression, "text": self.text,
+                "value": plain(self.number), "unit": self.unit,
+                "uncertainty": plain(self.uncertainty), "error": self.error,
+                "output": self.output}
+
+
+def split_uncertainty(x):
+    """Split a number into its nominal value and its uncertainty (or None)."""
+    if hasattr(x, "nominal_value"):
+        return x.nominal_value, x.std_dev
+    if hasattr(x, "var") and not callable(x.var):
+        # mcerp and soerp distributions
+        return x.mean, math.sqrt(x.var)
+    return x, None
+
+
+def plain(x):
+    """Convert a number or an array to a value accepted by json."""
+    if x is None or isinstance(x, (int, float)):
+        return x
+    if hasattr(x, "tolist"):
+        return plain(x.tolist())
+    if isinstance(x, list):
+        return [plain(y) for y in x]
+    if isinstance(x, complex):
+        return [x.real, x.imag]
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return str(x)
+
+
+# Magics used by Session.define for the different kinds of definitions
+define_magics = {"variable": "let", "unit": "newunit", "baseunit": "newbaseunit",
+                 "prefix": "newprefix", "system": "newsystem"}
+
+
+class Session(object):
+    """An imks session: a unit registry with its namespace and engine."""
+
+    def __init__(self, scripts=("Startup",), engine="math", registry=None):
+        """Create a new session, loading the engine and the scripts.
+
+        :param scripts:   names of the imks scripts to load (see %load_imks)
+        :param str engine:  name of the math engine (see %imks -e)
+        :param registry:  the unit registry, by default a new one
+        """
+        from importlib import import_module
+        from .config import config, internals
+        from .magics import ImksMagic
+        from .shell import Shell
+        self.registry = registry if registry is not None else units.UnitRegistry()
+        self.lock = threading.RLock()
+        self.shell = Shell()
+        self.namespace = self.shell.user_ns
+        config.setdefault("intrans", {})
+        with self.lock, self.registry:
+            self.magic = ImksMagic(shell=self.shell)
+            self.registry.load_variables(self.namespace)
+            # The engine is loaded in the namespace of the session; it also
+            # becomes the global one (used by the lazy constants) if none is set
+            module = import_module("imks.units_" + engine)
+            engines.switch(self.namespace, None, module)
+            if internals["engine_module"] is None:
+                internals["engine_module"] = module
+            self.engine = engine
+            for script in scripts:
+                self.magic.load_imks(script)
+
+    def run(self, code):
+        """Execute code (expressions, statements, or magics) in the session.
+
+        :param str code:  the code to execute
+        :return:          the value of the expression, or None for statements
+        """
+        with self.lock, self.registry:
+            return self.shell.run_cell(code)
+
+    def evaluate(self, expression):
+        """Evaluate an expression, or execute a statement.
+
+        :param str expression:  the expression, with the imks syntax
+        :return Result:         the result
+        """
+        with self.lock, self.registry:
+            return Result(expression, self.shell.run_cell(expression))
+
+    def evaluate_many(self, expressions, errors="raise"):
+        """Evaluate several expressions in order.
+
+        :param expressions:  an iterable of expressions
+        :param str errors:   "raise" to stop at the first exception, or
+                             "return" to record its message in the result
+        :return list:        the results
+        """
+        results = []
+        with self.lock, self.registry:
+            for expression in expressions:
+                try:
+                    results.append(Result(expression,
+                                          self.shell.run_cell(expression)))
+                except Exception as e:
+                    if errors != "return":
+                        raise
+                    results.append(Result(expression,
+                                          error="%s: %s" % (type(e).__name__, e)))
+        return results
+
+    def define(self, name, expression=None, doc="", kind="variable"):
+        """Define a variable, a unit, a prefix, or a unit system.
+
+        :param str name:        the name (possibly with aliases, as in
+                                "u=µ" for a prefix)
+        :param str expression:  the value (not used for base units)
+        :param str doc:         the documentation string
+        :param str kind:        one of "variable", "unit", "baseunit",
+                                "prefix", or "system"
+        """
+        if kind not in define_magics:
+            raise ValueError("Unknown definition kind %s" % kind)
+        line = name if expression is None else "%s=%s" % (name, expression)
+        if doc:
+            doc = doc.encode("unicode_escape").decode("latin-1")
+            line += ' # "%s"' % doc.replace('"', '\\"')
+        with self.lock, self.registry:
+            self.magic.magics[define_magics[kind]](line)
+
+    def __getitem__(self, name):
+        return self.namespace[name]
+
+
+default_session = None
+
+
+def evaluate(expression):
+    """Evaluate an expression in the default session, created when needed.
+
+    :param str expression:  the expression, with the imks syntax
+    :return Result:         the result
+    """
+    global default_session
+    if default_session is None:
+        default_session = Session()
+    return default_session.evaluate(expression)
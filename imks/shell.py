@@ -1,3 +1,4 @@
+import ast
 import getopt
 import inspect
 import os
@@ -7,7 +8,11 @@ import tokenize
 from code import InteractiveConsole
 from io import StringIO, open
 
-from .transformers import command_transformer, unit_transformer, magic_transformer
+from .analysis import analyze
+from .config import config
+from .engines import new_layer
+from .transformers import (command_transformer, unit_transformer, magic_transformer,
+                           cached_transform, hoist_constants, constant_pool)
 
 
 class Inspector(object):
@@ -45,13 +50,14 @@ class Shell(InteractiveConsole):
     def __init__(self, locals=None, filename="<console>"):
         InteractiveConsole.__init__(self, locals=locals, filename=filename)
         self.locals.update({"run_magic": lambda s: self.run_magic(s)})
+        self.locals.setdefault("__builtins__", new_layer())
         self.user_ns = self.locals
         self.inspector = Inspector()
         self.magics = {}
 
     # noinspection PyUnusedLocal
     def reset(self, new_session=True):
-        self.locals = {}
+        self.locals = {"__builtins__": new_layer()}
         self.locals.update({"run_magic": lambda s: self.run_magic(s)})
         self.user_ns = self.locals
 
@@ -95,28 +101,64 @@ class Shell(InteractiveConsole):
         with open(target, "rt", encoding="utf-8") as f:
             return f.read()
 
-    def run_cell(self, cell):
+    @staticmethod
+    def transform_cell(cell):
         # N.B.: formally almost identical to transformers.transform, but w/
         # the addition of magic_transformer
-        cell = command_transformer(cell.rstrip())
+        cell = command_transformer(cell)
         tokens = tokenize.generate_tokens(StringIO(cell).readline)
         newtokens = unit_transformer(magic_transformer(list(tokens)))
-        newcell = tokenize.untokenize(newtokens)
+        return tokenize.untokenize(newtokens)
+
+    @staticmethod
+    def parse_cell(newcell):
         try:
-            code = compile(newcell, '<stdin>', 'eval')
+            mode = 'eval'
+            tree = ast.parse(newcell, '<stdin>', mode)
         except SyntaxError:
-            code = compile(newcell, '<stdin>', 'exec')
-        return self.ev(code)
+            mode = 'exec'
+            tree = ast.parse(newcell, '<stdin>', mode)
+        return mode, tree
+
+    def compile_cell(self, cell):
+        mode, tree = self.parse_cell(self.transform_cell(cell))
+        tree, name, sources = hoist_constants(tree)
+        return compile(tree, '<stdin>', mode), name, sources
+
+    def run_cell(self, cell):
+        cell = cell.rstrip()
+        if config["enabled"] and config["dimension_analysis"]:
+            # The analysis depends on the current variables: only the
+            # transformation is cached
+            newcell = cached_transform("cell", cell, self.transform_cell)
+            mode, tree = self.parse_cell(newcell)
+            tree, name, sources = hoist_constants(analyze(tree, self.locals))
+            code = compile(tree, '<stdin>', mode)
+        else:
+            code, name, sources = cached_transform("code", cell, self.compile_cell)
+        # A new pool at each run: literals are evaluated with the current units
+        with constant_pool(self.locals, name, sources):
+            return self.ev(code)
 
     def runsource(self, code, filename="<input>", symbol="single"):
-        code = command_transformer(code.rstrip())
         try:
-            tokens = tokenize.generate_tokens(StringIO(code).readline)
-            newtokens = unit_transformer(magic_transformer(list(tokens)))
-            newcode = tokenize.untokenize(newtokens)
+            newcode = cached_transform("cell", code.rstrip(), self.transform_cell)
         except tokenize.TokenError:
             return True
-        return InteractiveConsole.runsource(self, newcode, filename, symbol)
+        try:
+            compiled = self.compile(newcode, filename, symbol)
+        except (OverflowError, SyntaxError, ValueError):
+            self.showsyntaxerror(filename)
+            return False
+        if compiled is None:
+            # Incomplete input
+            return True
+        tree, name, sources = hoist_constants(ast.parse(newcode, filename, symbol))
+        if name is not None:
+            compiled = compile(tree, filename, symbol, self.compile.compiler.flags, True)
+        with constant_pool(self.locals, name, sources):
+            self.runcode(compiled)
+        return False
 
 
 magics = {}
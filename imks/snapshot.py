@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""Snapshots of the unit registry, used to speed up the startup.
+
+Loading Startup.imks requires the transformation and the execution of each
+line of the script, and the parsing of hundreds of units.  The first time
+the script is loaded, the complete state it produces (the unit registry,
+the extension data, the configuration, and the new variables of the user
+namespace) is saved in a binary snapshot, ~/.imks/registry.snapshot; later
+startups load the snapshot in a single step.
+
+The snapshot is keyed by the imks, Python, and numpy versions, by the
+engine, by the contents of all the imks scripts loaded (searched again at
+each startup, so that a new script in the current directory is detected), and
+by the data files of the extensions.  It is also ignored when these data
+files are older than the grace period of the extension, so that they are
+refreshed as in a normal startup.  When the state cannot be saved (for
+example, because a script defined a variable that cannot be pickled), the
+startup proceeds normally.
+
+Functions defined in the scripts are saved through their code objects, and
+lazy values through their callbacks; the documentation of the variables
+that cannot hold it (see units.getdoc) is saved separately.  The snapshots
+can be disabled by setting config["startup_snapshot"] to False.
+"""
+
+from __future__ import absolute_import, division, print_function
+import hashlib
+import marshal
+import os
+import pickle
+import re
+import sys
+import time
+import types
+
+from . import units
+from ._version import __version__
+
+try:
+    from objproxies import CallbackProxy, LazyProxy
+except ImportError:
+    from peak.util.proxies import CallbackProxy, LazyProxy
+
+# Module variables of the registry, set by the startup scripts
+registry = {"units": ("baseunits", "basecurrency", "units", "verbose_units",
+                      "space_units", "prefixes", "verbose_prefixes", "systems",
+                      "formats", "defaultsystem"),
+            "currencies": ("currencydict", "currencytime"),
+            "constants": ("constants",),
+            "wolfram": ("app_id",)}
+
+# Extensions whose state is saved, with their data file and grace period
+extensions = {"constants": ("constants.dat", 30),
+              "currencies": ("currencies.dat", 3),
+              "wolfram": (None, None)}
+
+# Configuration entries mirrored by variables of the units module
+config_units = {"sort_units": "sortunits", "unit_tolerant": "tolerant",
+                "unit_verbose": "verbose", "prefix_only": "prefixonly",
+                "show_errors": "showerrors"}
+
+# Version of the saved state, part of the key of the snapshot
+snapshot_format = 2
+
+# IPython history variables, never saved
+re_history = re.compile(r"^(_+|_i+|_i?\d+|_oh|_ih|_dh|_exit_code|In|Out)$")
+
+# Scripts loaded while recording a snapshot
+recording = None
+
+
+def snapshot_path():
+    return os.path.join(os.environ["HOME"], ".imks", "registry.snapshot")
+
+
+def digest(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def record_script(module, path, code):
+    """Record a script loaded by %load_imks, if a snapshot is being recorded."""
+    if recording is not None:
+        recording.append((module, path, digest(code)))
+
+
+def data_files():
+    """Return the paths and digests of the data files of the extensions."""
+    from .config import internals
+    files = []
+    for ext in sorted(internals["extensions"]):
+        filename = extensions[ext][0]
+        if filename:
+            path = os.path.join(os.environ["HOME"], ".imks", filename)
+            try:
+                with open(path, "rb") as f:
+                    files.append((path, digest(f.read()), extensions[ext][1]))
+            except (IOError, OSError):
+                files.append((path, None, extensions[ext][1]))
+    return files
+
+
+def header(scripts, files):
+    """Return the key of a snapshot."""
+    from .config import config
+    import numpy as np
+    return {"version": __version__, "format": snapshot_format,
+            "python": tuple(sys.version_info[:2]),
+            "numpy": np.__version__, "engine": config["engine"],
+            "scripts": scripts, "data": files}
+
+
+def valid(shell, key):
+    """Check if the key of a snapshot is still valid."""
+    from .magics import find_imks_script
+    scripts = []
+    for module, _, _ in key["scripts"]:
+        path, code = find_imks_script(shell, module)
+        if code is None:
+            return False
+        scripts.append((module, path, digest(code)))
+    if header(scripts, key["data"]) != key:
+        return False
+    for path, sha1, grace in key["data"]:
+        try:
+            with open(path, "rb") as f:
+                if digest(f.read()) != sha1:
+                    return False
+            if (time.time() - os.path.getmtime(path)) / 86400.0 > grace:
+                return False
+        except (IOError, OSError):
+            if sha1 is not None:
+                return False
+    return True
+
+
+class SnapshotPickler(pickle.Pickler):
+    """Pickler saving by value the functions and lazy values of the namespace."""
+    def __init__(self, f, namespace):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.namespace = namespace
+
+    def persistent_id(self, obj):
+        t = type(obj)
+        if t is types.FunctionType and obj.__globals__ is self.namespace:
+            if obj.__closure__:
+                raise pickle.PicklingError("Closure %s cannot be saved" %
+                                           obj.__name__)
+            return ("function", marshal.dumps(obj.__code__), obj.__name__,
+                    obj.__defaults__, getattr(obj, "__kwdefaults__", None),
+                    obj.__doc__, obj.__dict__)
+        if t is CallbackProxy or t is LazyProxy:
+            return ("proxy", t is LazyProxy,
+                    CallbackProxy.__callback__.__get__(obj))
+        if t is types.ModuleType:
+            return ("module", obj.__name__)
+        if obj is self.namespace:
+            return ("namespace",)
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """Unpickler for the SnapshotPickler."""
+    def __init__(self, f, namespace):
+        pickle.Unpickler.__init__(self, f)
+        self.namespace = namespace
+
+    def persistent_load(self, pid):
+        if pid[0] == "function":
+            code, name, defaults, kwdefaults, doc, attributes = pid[1:]
+            f = types.FunctionType(marshal.loads(code), self.namespace, name,
+                                   defaults)
+            if kwdefaults:
+                f.__kwdefaults__ = kwdefaults
+            f.__doc__ = doc
+            f.__dict__.update(attributes)
+            return f
+        if pid[0] == "proxy":
+            return (LazyProxy if pid[1] else CallbackProxy)(pid[2])
+        if pid[0] == "module":
+            from importlib import import_module
+            return import_module(pid[1])
+        if pid[0] == "namespace":
+            return self.namespace
+        raise pickle.UnpicklingError("Unknown persistent id %s" % pid[0])
+
+
+def save(shell, before, scripts, path):
+    """Save the state produced by the startup scripts.
+
+    :param shell:         the shell
+    :param dict before:   copy of the user namespace before the scripts
+    :param list scripts:  scripts loaded, as recorded by `record_script`
+    :param str path:      path of the snapshot
+    :return bool:         True if the snapshot could be saved
+    """
+    from .config import config, internals
+    if not internals["extensions"] <= set(extensions):
+        return False
+    namespace = shell.user_ns
+    variables = dict((k, v) for k, v in namespace.items()
+                     if not re_history.match(k) and
+                     (k not in before or before[k] is not v))
+    deleted = [k for k in before if k not in namespace]
+    modules = {}
+    for name, attrs in registry.items():
+        # Modules never imported have not been used by the scripts
+        module = sys.modules.get("imks." + name)
+        if module is not None:
+            modules[name] = dict((attr, getattr(module, attr)) for attr in attrs)
+    # The documentation of objects with slots is not pickled with them
+    docs = dict((k, units.documentation.get(v)) for k, v in variables.items()
+                if units.documentation.get(v) is not None)
+    state = {"variables": variables, "deleted": deleted, "registry": modules,
+             "docs": docs,
+             "config": dict((k, v) for k, v in config.items()
+                            if k != "initial_status"),
+             "extensions": set(internals["extensions"])}
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(header(scripts, data_files()), f, pickle.HIGHEST_PROTOCOL)
+            SnapshotPickler(f, namespace).dump(state)
+        getattr(os, "replace", os.rename)(tmp, path)
+        return True
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+
+
+def restore(shell, path):
+    """Restore the state saved in a snapshot, if it is valid.
+
+    :param shell:     the shell
+    :param str path:  path of the snapshot
+    :return bool:     True if the snapshot was restored
+    """
+    from importlib import import_module
+    from .config import config, internals
+    try:
+        with open(path, "rb") as f:
+            if not valid(shell, pickle.load(f)):
+                return False
+            namespace = shell.user_ns
+            state = SnapshotUnpickler(f, namespace).load()
+    except Exception:
+        return False
+    # Containers are updated in place, since other modules keep references
+    # to them (for example, calendars to the units dictionary)
+    replaced = {}
+    for name, attrs in state["registry"].items():
+        module = import_module("imks." + name)
+        for attr, value in attrs.items():
+            current = getattr(module, attr, None)
+            if type(current) is type(value) and isinstance(value, (dict, list)):
+                if isinstance(value, dict):
+                    current.clear()
+                    current.update(value)
+                else:
+                    current[:] = value
+                replaced[id(value)] = current
+            else:
+                setattr(module, attr, value)
+    config.update(state["config"])
+    for key, attr in config_units.items():
+        setattr(units, attr, config[key])
+    internals["extensions"].update(state["extensions"])
+    for k in state["deleted"]:
+        namespace.pop(k, None)
+    namespace.update((k, replaced.get(id(v), v))
+                     for k, v in state["variables"].items())
+    for k, entry in state.get("docs", {}).items():
+        units.documentation.set(namespace[k], *entry)
+    units.load_variables(namespace)
+    if "wolfram" in internals["extensions"]:
+        from . import wolfram
+        wolfram.namespace = namespace
+    units.bump_generation()
+    return True
+
+
+def load_startup(shell, load):
+    """Load the startup scripts, using the registry snapshot if possible.
+
+    :param shell:    the shell
+    :param load:     function loading the startup scripts (Startup.imks)
+    """
+    global recording
+    from .config import config
+    if not config["startup_snapshot"]:
+        load()
+        return
+    path = snapshot_path()
+    if restore(shell, path):
+        return
+    before = dict(shell.user_ns)
+    engine = config["engine"]
+    recording = []
+    try:
+        load()
+    finally:
+        scripts, recording = recording, None
+    # A script changing the engine also changes the key of the snapshot
+    if config["engine"] == engine:
+        save(shell, before, scripts, path)
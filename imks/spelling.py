@@ -3,11 +3,18 @@
 import re
 
 # TODO: try to remove inflect dependency
-try:
-    import inflect
-    inflect_engine = inflect.engine()
-except ImportError:
-    inflect_engine = None
+# The inflect engine is created on first use, since importing inflect takes
+# much longer than importing the rest of imks
+inflect_engine = None
+
+
+def engine():
+    """Return the inflect engine."""
+    global inflect_engine
+    if inflect_engine is None:
+        import inflect
+        inflect_engine = inflect.engine()
+    return inflect_engine
 
 
 __all__ = ["cardinal_to_number", "ordinal_to_number", "number_to_cardinal", "number_to_ordinal", "plural"]
@@ -171,7 +178,7 @@ def number_to_cardinal(n):
         number_to_cardinal(2) -> "two"
         number_to_cardinal(4) -> "four"
     """
-    return inflect_engine.number_to_words(n)
+    return engine().number_to_words(n)
 
 
 def number_to_ordinal(n, short=False, numerator=False):
@@ -191,12 +198,12 @@ def number_to_ordinal(n, short=False, numerator=False):
         if n == 2:
             s = "half"
         else:
-            s = inflect_engine.ordinal(inflect_engine.number_to_words(n))
-        return inflect_engine.plural(s, count=numerator)
+            s = engine().ordinal(engine().number_to_words(n))
+        return engine().plural(s, count=numerator)
     else:
-        return inflect_engine.ordinal(inflect_engine.number_to_words(n))
+        return engine().ordinal(engine().number_to_words(n))
 
 
 def plural(s):
     """Return the plural of a name."""
-    return inflect_engine.plural(s)
+    return engine().plural(s)
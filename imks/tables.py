@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Chunked reading and conversion of CSV files with units in the headers.
+
+The header of a column can carry its unit in brackets, as in power[kW] or
+temp[°C]; each unit is parsed once, with unit_parser.  The rows are read in
+chunks of fixed size, and the numbers of the columns with a unit are stored
+in numpy buffers allocated once, so that the memory used does not depend on
+the size of the file:
+
+>>> for chunk in read_csv("data.csv", chunk_size=10000):
+...     power = chunk["power"]           # a Value array, in base units
+
+The arrays of a chunk are views of the buffers, and are overwritten by the
+next chunk: copy them to keep them.  convert_csv writes a copy of a file with
+some columns converted to other units, applying to each chunk a single
+multiply-add per column (see units.converter); the other columns are copied
+unchanged.  Empty fields are read as NaN (and written back as empty fields);
+blank lines are skipped.  Columns without a unit are left as strings.
+"""
+
+from __future__ import absolute_import, division, print_function
+import csv
+import io
+import re
+
+import numpy as np
+
+from . import units
+
+header_re = re.compile(r"^\s*(.*?)\s*\[(.*)\]\s*$")
+
+
+def parse_header(field):
+    """Split a header field into the column name and its unit.
+
+    :param str field:  the header field, as in "power[kW]"
+    :return tuple:     the name and the unit (None if there is no unit)
+    """
+    m = header_re.match(field)
+    if m is None:
+        return field.strip(), None
+    return m.group(1), m.group(2).strip() or None
+
+
+class Column(object):
+    """A column of a CSV file, with its unit and its buffer."""
+
+    def __init__(self, index, field, chunk_size):
+        self.index = index
+        self.name, self.unit = parse_header(field)
+        if self.unit is None:
+            self.value = self.tree = self.buffer = None
+        else:
+            self.value, self.tree = units.unit_parser(self.unit)
+            self.buffer = np.empty(chunk_size)
+
+    def __repr__(self):
+        if self.unit is None:
+            return "Column(%r)" % self.name
+        return "Column(%r, %r)" % (self.name, self.unit)
+
+    def fill(self, rows):
+        """Read the numbers of the column from rows into the buffer.
+
+        :param list rows:  the rows of the chunk, as lists of strings
+        :return:           the part of the buffer used (a plain array)
+        """
+        n = self.index
+        data = self.buffer[:len(rows)]
+        fields = [row[n] for row in rows]
+        try:
+            data[:] = fields
+        except ValueError:
+            data[:] = [float(f) if f.strip() else np.nan for f in fields]
+        return data
+
+
+def reader(f, delimiter):
+    """Return the csv reader and the file to close (None if f is a stream)."""
+    if isinstance(f, units.basestring):
+        f = io.open(f, "rt", encoding="utf-8", newline="")
+        return csv.reader(f, delimiter=delimiter), f
+    return csv.reader(f, delimiter=delimiter), None
+
+
+def chunks(rows, chunk_size, width):
+    """Group rows into lists of at most chunk_size rows.
+
+    Empty rows (blank lines) are skipped.
+
+    :param rows:        the csv reader
+    :param int width:   the number of fields of the header
+    :raises ValueError:  if a row has fewer fields than the header
+    """
+    chunk = []
+    for row in rows:
+        if not row:
+            continue
+        if len(row) < width:
+            raise ValueError("line %d: %d fields instead of %d"
+                             % (rows.line_num, len(row), width))
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_csv(f, chunk_size=65536, delimiter=","):
+    """Read a CSV file in chunks.
+
+    :param f:               a file name or a text stream
+    :param int chunk_size:  the number of rows of each chunk
+    :param str delimiter:   the field delimiter
+    :return:                a generator of ordered dictionaries, one for each
+                            chunk, with the columns: Value arrays (in base
+                            units, shown in the unit of the header) for the
+                            columns with a unit, lists of strings for the
+                            others
+    :raises ValueError:     if a row has fewer fields than the header
+    """
+    rows, close = reader(f, delimiter)
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [Column(n, field, chunk_size)
+                   for n, field in enumerate(header)]
+        for chunk in chunks(rows, chunk_size, len(header)):
+            result = units.ODict()
+            for c in columns:
+                if c.unit is None:
+                    result[c.name] = [row[c.index] for row in chunk]
+                    continue
+                data = c.fill(chunk)
+                np.multiply(data, c.value.value, out=data)
+                result[c.name] = units.Value(data, c.value.unit,
+                                             absolute=c.value.absolute,
+                                             showunit=c.tree)
+            yield result
+    finally:
+        if close is not None:
+            close.close()
+
+
+def convert_csv(src, dst, targets, chunk_size=65536, delimiter=","):
+    """Copy a CSV file, converting some of its columns to other units.
+
+    :param src:             the input file name or text stream
+    :param dst:             the output file name or text stream
+    :param dict targets:    the target units of the columns to convert,
+                            by column name
+    :param int chunk_size:  the number of rows converted at once
+    :param str delimiter:   the field delimiter
+    :return int:            the number of rows written
+    :raises ValueError:     if a row has fewer fields than the header
+    """
+    rows, close_src = reader(src, delimiter)
+    if isinstance(dst, units.basestring):
+        dst = close_dst = io.open(dst, "wt", encoding="utf-8", newline="")
+    else:
+        close_dst = None
+    count = 0
+    try:
+        writer = csv.writer(dst, delimiter=delimiter, lineterminator="\n")
+        header = next(rows, None)
+        if header is None:
+            return count
+        columns = [Column(n, field, chunk_size) for n, field in enumerate(header)]
+        converters = []
+        for c in columns:
+            if c.name not in targets:
+                converters.append(None)
+                continue
+            if c.unit is None:
+                raise units.UnitError("Column %s has no unit" % c.name)
+            converters.append(units.converter(c.unit, targets[c.name]))
+            header[c.index] = "%s[%s]" % (c.name, targets[c.name])
+        writer.writerow(header)
+        for chunk in chunks(rows, chunk_size, len(header)):
+            values = []
+            for c, conv in zip(columns, converters):
+                if conv is None:
+                    values.append([row[c.index] for row in chunk])
+                    continue
+                data = c.fill(chunk)
+                conv(data, out=data)
+                column = data.tolist()
+                for i in np.flatnonzero(np.isnan(data)):
+                    if not chunk[i][c.index].strip():
+                        column[i] = ""
+                values.append(column)
+            writer.writerows(zip(*values))
+            count += len(chunk)
+    finally:
+        if close_src is not None:
+            close_src.close()
+        if close_dst is not None:
+            close_dst.close()
+    return count
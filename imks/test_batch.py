@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from . import units
+from .batch import split_cells, evaluate_stream
+
+
+class BatchTestCase(unittest.TestCase):
+    source = ("(3+/-0.1)[km/h] @ [m/s]\n"
+              "# A comment\n"
+              "x = 3[m]\n"
+              "\n"
+              "def f(y):\n"
+              "    z = (2 *\n"
+              "  y)\n"
+              "\n"
+              "    return z\n"
+              "1/0\n"
+              "f(x) @ [km]\n")
+
+    @classmethod
+    def setUpClass(cls):
+        units.reset()
+        fd, cls.path = tempfile.mkstemp(suffix=".imks")
+        with os.fdopen(fd, "w") as f:
+            f.write(cls.source)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def evaluate(self, path=None, **kwargs):
+        output, errors = io.StringIO(), io.StringIO()
+        count = evaluate_stream([path or self.path], output=output,
+                                errors=errors, engine="umath", **kwargs)
+        return count, output.getvalue(), errors.getvalue()
+
+    def test_split_cells(self):
+        self.assertEqual(list(split_cells(self.source.splitlines(True))),
+                         [(1, "(3+/-0.1)[km/h] @ [m/s]"), (3, "x = 3[m]"),
+                          (5, "def f(y):\n    z = (2 *\n  y)\n\n    return z"),
+                          (10, "1/0"), (11, "f(x) @ [km]")])
+        self.assertEqual(list(split_cells(["try:\n", "  a\n", "except E:\n",
+                                           "  b\n", "@d\n", "def g(): pass\n",
+                                           "if a: b\n", "else: c\n"])),
+                         [(1, "try:\n  a\nexcept E:\n  b"),
+                          (5, "@d\ndef g(): pass"), (7, "if a: b\nelse: c")])
+
+    def test_text(self):
+        count, output, errors = self.evaluate()
+        self.assertEqual(count, 1)
+        self.assertEqual(output, "(0.833+/-0.028)[m s^-1]\n0.006[km]\n")
+        self.assertEqual(errors, "%s:10: ZeroDivisionError: division by zero\n"
+                         % self.path)
+
+    def test_jsonl(self):
+        count, output, _ = self.evaluate(fmt="jsonl", stop=True)
+        records = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(count, 1)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["unit"], "m s^-1")
+        self.assertAlmostEqual(records[0]["value"], 0.8333333333333334)
+        self.assertAlmostEqual(records[0]["uncertainty"], 0.0277777777777778)
+        self.assertEqual((records[1]["line"], records[1]["error"]),
+                         (10, "ZeroDivisionError: division by zero"))
+
+    def test_jobs(self):
+        # The cells are sent to a worker in chunks, in the input order
+        self.assertEqual(self.evaluate(jobs=2), self.evaluate())
+
+    def test_output(self):
+        # Printed output is captured, and kept out of the jsonl records
+        fd, path = tempfile.mkstemp(suffix=".imks")
+        with os.fdopen(fd, "w") as f:
+            f.write('print("hello")\n(print("x"), 2[m])[1]\nprint("y"); 1/0\n')
+        try:
+            self.assertEqual(self.evaluate(path)[1], "hello\nx\n2.0[m]\ny\n")
+            for jobs in (1, 2):
+                count, output, _ = self.evaluate(path, fmt="jsonl", jobs=jobs)
+                records = [json.loads(line) for line in output.splitlines()]
+                self.assertEqual([(r["output"], r["text"], r["error"])
+                                  for r in records],
+                                 [("hello\n", "", None), ("x\n", "2.0[m]", None),
+                                  ("y\n", "", "ZeroDivisionError: division by zero")])
+        finally:
+            os.remove(path)
+
+    def test_startup_error(self):
+        # Sessions that cannot be created stop the evaluation, also in workers
+        from .__main__ import main
+        for jobs in ("1", "2"):
+            self.assertEqual(main(["eval", "-j", jobs, "-e", "nosuchengine",
+                                   self.path]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
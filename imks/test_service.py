@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from . import units
+from .service import Service, Client, max_pipeline
+
+
+class ServiceTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        units.reset()
+        cls.service = Service()
+        cls.path = os.path.join(tempfile.mkdtemp(), "imks.sock")
+        cls.loop = asyncio.new_event_loop()
+        cls.server = cls.loop.run_until_complete(cls.service.start(cls.path))
+        cls.thread = threading.Thread(target=cls.loop.run_forever)
+        cls.thread.start()
+        cls.client = Client(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        asyncio.run_coroutine_threadsafe(cls.service.stop(cls.server),
+                                         cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+        cls.service.close()
+        os.remove(cls.path)
+        os.rmdir(os.path.dirname(cls.path))
+
+    def test_permissions(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_evaluate(self):
+        self.assertEqual(self.client.call("evaluate", expression="w = 3[km]")["text"],
+                         "")
+        r = self.client.call("evaluate", expression="w @ [m]")
+        self.assertEqual((r["text"], r["value"], r["unit"]),
+                         ("3000.0[m]", 3000.0, "m"))
+
+    def test_convert(self):
+        r = self.client.call("convert", value=[36, 72], unit="km/h", to="[m/s]")
+        self.assertEqual(r["unit"], "m/s")
+        self.assertAlmostEqual(r["value"][0], 10.0)
+        self.assertAlmostEqual(r["value"][1], 20.0)
+        r = self.client.call("convert", value="300[K]", to="Celsius")
+        self.assertAlmostEqual(r["value"], 26.85)
+
+    def test_compatible(self):
+        self.assertIn("knot", self.client.call("compatible", expression="[m/s]"))
+
+    def test_pipeline(self):
+        responses = self.client.call_many(
+            [("evaluate", {"expression": "%d[km] @ [m]" % n}) for n in range(20)] +
+            [("evaluate", {"expression": "1/0"}), ("unknown", {})])
+        self.assertEqual([r["result"]["value"] for r in responses[:20]],
+                         [1000.0 * n for n in range(20)])
+        self.assertEqual(responses[20]["error"],
+                         "ZeroDivisionError: division by zero")
+        self.assertEqual(responses[21]["error"], "ValueError: Unknown method unknown")
+        self.assertEqual([r["id"] for r in responses],
+                         list(range(responses[0]["id"], responses[0]["id"] + 22)))
+
+    def test_long_pipeline(self):
+        # More requests than max_pipeline, sent in windows by the client
+        n = 3 * max_pipeline + 10
+        responses = self.client.call_many(
+            [("convert", {"value": k, "unit": "km", "to": "m"}) for k in range(n)])
+        self.assertEqual([r["result"]["value"] for r in responses],
+                         [1000.0 * k for k in range(n)])
+
+
+if __name__ == '__main__':
+    unittest.main()
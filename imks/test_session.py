@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from . import units, currencies
+from .session import Session
+
+
+class SessionTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        units.reset()
+        cls.session = Session(engine="umath")
+
+    def test_evaluate(self):
+        r = self.session.evaluate("(3+/-0.1)[km/h] @ [m/s]")
+        self.assertAlmostEqual(r.number, 0.8333333333333334)
+        self.assertAlmostEqual(r.uncertainty, 0.0277777777777778)
+        self.assertEqual(r.unit, "m s^-1")
+        r = self.session.evaluate("1200s @ k")
+        self.assertEqual((r.text, r.number, r.unit), ("1.2[ks]", 1.2, "ks"))
+        r = self.session.evaluate("12h 30m @ hms")
+        self.assertEqual((r.text, r.number), ("12h 30m 0s", None))
+        self.assertEqual(self.session.evaluate("z = 3[m]").text, "")
+        self.assertEqual(self.session.evaluate("z * 2").as_dict()["value"], 6.0)
+
+    def test_define(self):
+        self.session.define("furlong", "201.168[m]", doc='A "furlong"', kind="unit")
+        self.assertEqual(self.session.evaluate("2 furlong @ m").number, 402.336)
+        self.assertEqual(self.session.registry.units["furlong"].__doc__,
+                         'A "furlong"')
+        self.assertNotIn("furlong", units.units)
+        self.assertRaises(ValueError, self.session.define, "x", "1", kind="y")
+
+    def test_evaluate_many(self):
+        results = self.session.evaluate_many(["1/0", "2[m]"], errors="return")
+        self.assertEqual(results[0].error, "ZeroDivisionError: division by zero")
+        self.assertEqual(results[1].text, "2.0[m]")
+        self.assertRaises(ZeroDivisionError, self.session.evaluate_many, ["1/0"])
+
+
+class CurrencySessionTestCase(unittest.TestCase):
+    def setUp(self):
+        units.reset()
+        currencies.reset()
+        self.tmpdir = tempfile.mkdtemp()
+        self.script = os.path.join(self.tmpdir, "exchange.imks")
+        with open(self.script, "w") as f:
+            f.write('openexchangerates_id = "0123456789"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        currencies.reset()
+
+    @staticmethod
+    def getrates(app_id="", **kw):
+        currencies.currencydict = {"EUR": "Euro", "USD": "US Dollar"}
+        return {"EUR": 1.0, "USD": 1.25}
+
+    def test_startup(self):
+        # The full Startup script, which loads the currencies and sets the
+        # default system, must only change the registry of the session
+        startup = os.path.join(os.path.dirname(units.__file__), "scripts",
+                               "Startup.imks")
+        with mock.patch.object(currencies, "getrates", self.getrates):
+            session = Session(scripts=(self.script, startup))
+        self.assertEqual(session.evaluate("100 USD @ EUR").text, "80.0[EUR]")
+        self.assertEqual(session.registry.basecurrency, "EUR")
+        self.assertEqual(str(session.registry.defaultsystem), "[si]")
+        self.assertIsNone(units.default_registry.basecurrency)
+        self.assertIsNone(units.defaultsystem)
+        self.assertNotIn("USD", units.units)
+
+
+if __name__ == '__main__':
+    unittest.main()
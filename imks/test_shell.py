@@ -80,6 +80,109 @@ class UnitTestCase(unittest.TestCase):
             self.assertEqual(u1, u2,
                              msg="Operation failed (unit error): %s != %s" % (u1, u2))
 
+    def test_engines(self):
+        from .engines import get_layer
+        self.assertNotIn("sqrt", self.shell.locals)
+        self.shell.run_cell("def root(x):\n    return sqrt(x)\n")
+        self.shell.run_cell("sin = 3")
+        self.shell.push(u"%imks -c umath")
+        self.shell.push(u"_res_ = root((4+/-0.1)[m^2])")
+        self.assertEqual(str(self.shell.locals["_res_"]), "(2.000+/-0.025)[m]")
+        self.assertEqual(self.shell.locals["sin"], 3)
+        layer = get_layer(self.shell.locals)
+        self.shell.push(u"%imks -c math")
+        self.assertIs(get_layer(self.shell.locals), layer)
+        self.assertEqual(self.run_line("root(4[m^2])")[1], 2.0)
+        self.assertEqual(self.run_line("len([1, 2])")[1], 2.0)
+        from .engines import functions
+        self.assertIs(functions(self.shell.locals)["sqrt"],
+                      self.shell.locals["__builtins__"]["sqrt"])
+        self.assertNotIn("sin", functions(self.shell.locals))
+
+    def test_transform_cache(self):
+        from .transformers import transform, transform_cache_info
+        info = transform_cache_info()
+        self.assertEqual(transform("3 furlong"), transform(" 3 furlong "))
+        self.assertEqual(transform_cache_info()["hits"], info["hits"] + 1)
+        self.assertNotIn("Value", transform("3 furlong"))
+        self.shell.push(u"%newunit furlong = 201.168[m]")
+        self.assertIn("Value", transform("3 furlong"))
+        for _ in range(2):
+            self.assertAlmostEqual(self.run_line("2 furlong")[1], 402.336)
+        self.assertEqual(transform_cache_info()["hits"], info["hits"] + 3)
+        # Without input transformers, before imks is loaded
+        from .config import config
+        intrans = config.pop("intrans")
+        try:
+            self.assertIn("Value", transform("4 furlong"))
+        finally:
+            config["intrans"] = intrans
+
+    def test_constant_pool(self):
+        import ast
+        from .transformers import hoist_constants, transform
+        tree = ast.parse(transform("[3[m/s] + (2+/-0.1)[m/s] for i in range(2)]"))
+        tree, name, sources = hoist_constants(tree)
+        self.assertEqual(sources, ["Value(ufloat('3.0'),'m/s')"])
+        self.assertIsNone(hoist_constants(ast.parse(transform("x = 3[m/s]")))[1])
+        # Each use of a pooled quantity gets its own copy
+        self.shell.run_cell("L = []\nfor i in range(3):\n    x = +3[km]\n"
+                            "    L.append(x.value)\n    x.value = 0")
+        self.assertEqual(self.shell.locals['L'], [3000.0] * 3)
+        # The pools do not survive their cells
+        self.assertEqual([k for k in self.shell.locals
+                          if k.startswith("__imks_constants")], [])
+        self.shell.run_cell("G = (1[m] for i in range(3))")
+        self.assertEqual(len(list(self.shell.locals['G'])), 3)
+        self.shell.push(u"%newunit furlong = 201.168[m]")
+        self.shell.run_cell("E = 0[m]\nfor i in range(10):\n    E += 1[furlong]")
+        self.assertAlmostEqual(self.shell.locals['E'].value, 2011.68)
+        self.shell.push(u"%newunit furlong = 200[m]")
+        self.shell.run_cell("E = 0[m]\nfor i in range(10):\n    E += 1[furlong]")
+        self.assertAlmostEqual(self.shell.locals['E'].value, 2000.0)
+
+    def test_input_transformers(self):
+        from .transformers import command_transformer
+        self.assertEqual(command_transformer("1d 12h 30m + 12h 30m 25.2s"),
+                         'dhms(**{"d": 1, "h": 12, "M": 30}) + '
+                         'hms(**{"h": 12, "m": 30, "s": 25.2})')
+        self.shell.push(u'%newtransformer twice="(?P<d>\\d)(?P=d)":str')
+        self.assertEqual(command_transformer("(33, 34)"), '(str(**{"d": 3}), 34)')
+        self.shell.push(u"%deltransformer twice")
+        self.assertEqual(command_transformer("(33, 34)"), "(33, 34)")
+
+    def test_script_cache(self):
+        import os
+        import shutil
+        import tempfile
+        from . import scriptcache
+        home = os.environ["HOME"]
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "Test.imks")
+        compile_script = scriptcache.compile_script
+        compiled = []
+        scriptcache.compile_script = lambda *args: compiled.append(
+            compile_script(*args)) or compiled[-1]
+        try:
+            os.environ["HOME"] = directory
+            for code in ("L = [2[km] for i in range(2)]\nx = 3 km", None,
+                         "L = [2[km] for i in range(2)]\nx = 4 km"):
+                if code:
+                    with open(path, "w") as f:
+                        f.write(code)
+                self.shell.push(u"%load_imks " + path)
+            self.assertEqual(len(compiled), 2)
+            self.assertTrue(os.path.exists(scriptcache.cache_path(path)))
+            # The literal of the loop is in the constant pool
+            self.assertEqual(len(compiled[-1][2]), 1)
+            self.assertEqual([v.value for v in self.shell.locals['L']],
+                             [2000.0, 2000.0])
+            self.assertAlmostEqual(self.shell.locals['x'].value, 4000.0)
+        finally:
+            os.environ["HOME"] = home
+            scriptcache.compile_script = compile_script
+            shutil.rmtree(directory)
+
     def test_calendars(self):
         tests = [('Gregorian(1900, 2, 28) + 1[day]', '/Thursday, 1 March 1900.*/'),
                  ('(Julian(1900, 2, 28) + 1[day]).month', '2'),
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import io
+import math
+import unittest
+import numpy as np
+from . import units
+from .units import Value as V
+from .tables import parse_header, read_csv, convert_csv
+
+
+class TablesTestCase(unittest.TestCase):
+    data = (u"time,power[kW],temp [degC],note\n"
+            u"1,1.5,20,a\n"
+            u"2,2,,b\n"
+            u"\n"
+            u"3,0.5,-273.15,c\n"
+            u"\n")
+
+    def setUp(self):
+        units.reset()
+        for b in ['m', 'g', 's', 'K']:
+            units.newbaseunit(b)
+        for k, v in [('k', 1000.0), ('', 1.0), ('m', 0.001)]:
+            units.newprefix(k, v)
+        for k, v, u in [('N', 1.0, 'kg m s^-2'),
+                        ('J', 1.0, 'N m'),
+                        ('W', 1.0, 'J/s')]:
+            units.newunit(k, V(v, u))
+        units.newunit('degC', (V(273.15, 'K'), V(1.0, 'K')))
+
+    def test_parse_header(self):
+        self.assertEqual(parse_header("power[kW]"), ("power", "kW"))
+        self.assertEqual(parse_header(" temp [degC] "), ("temp", "degC"))
+        self.assertEqual(parse_header("note"), ("note", None))
+        self.assertEqual(parse_header("ratio[]"), ("ratio", None))
+
+    def test_read_csv(self):
+        chunks = list(read_csv(io.StringIO(self.data), chunk_size=2))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(list(chunks[0]), ["time", "power", "temp", "note"])
+        self.assertEqual(chunks[0]["note"], ["a", "b"])
+        # The buffers are reused by the next chunk
+        self.assertTrue(np.shares_memory(chunks[0]["power"],
+                                        chunks[1]["power"]))
+        power = chunks[1]["power"]
+        self.assertEqual(power.unit, V(1, "W").unit)
+        self.assertEqual(power.tolist(), [V(0.5, "kW").value])
+        self.assertEqual(str(power), "[0.5][kW]")
+        temp = chunks[1]["temp"]
+        self.assertEqual(str(temp), "[-273.15][degC]")
+        self.assertEqual(list(read_csv(io.StringIO(u""))), [])
+        self.assertTrue(math.isnan(chunks[0]["temp"][1]))
+        with self.assertRaisesRegex(ValueError, "line 3"):
+            list(read_csv(io.StringIO(u"a[m],b[m]\n1,2\n3\n")))
+
+    def test_convert_csv(self):
+        out = io.StringIO()
+        self.assertEqual(convert_csv(io.StringIO(self.data), out,
+                                     {"power": "W", "temp": "K"}, chunk_size=2), 3)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "time,power[W],temp[K],note")
+        self.assertEqual(lines[1], "1,1500.0,293.15,a")
+        self.assertEqual(lines[3], "3,500.0,0.0,c")
+        self.assertEqual(lines[2], "2,2000.0,,b")
+        self.assertEqual(len(lines), 4)
+        self.assertRaises(units.UnitError, convert_csv, io.StringIO(self.data),
+                          io.StringIO(), {"note": "W"})
+        self.assertRaises(units.UnitCompatibilityError, convert_csv,
+                          io.StringIO(self.data), io.StringIO(), {"power": "K"})
+
+
+if __name__ == '__main__':
+    unittest.main()
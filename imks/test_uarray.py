@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+import uncertainties
+from uncertainties import unumpy
+from . import units, units_uarray
+from .units import Value
+from .units_uarray import UArray, uarray
+
+
+class UArrayTestCase(unittest.TestCase):
+    def setUp(self):
+        units.reset()
+        units.newbaseunit("m")
+        self.nominal = np.array([1.0, 2.0, 3.0])
+        self.std_dev = np.array([0.1, 0.1, 0.2])
+
+    def check(self, x, y):
+        """Compare a UArray with an array of AffineScalarFunc's."""
+        np.testing.assert_allclose(x.nominal_value, unumpy.nominal_values(y))
+        np.testing.assert_allclose(x.std_dev, unumpy.std_devs(y))
+
+    def test_operations(self):
+        x = uarray(self.nominal, self.std_dev)
+        y = unumpy.uarray(self.nominal, self.std_dev)
+        z = UArray.independent(2.0, 0.5)
+        w = uncertainties.ufloat(2.0, 0.5)
+        self.check(x * x + 1 / x, y * y + 1 / y)
+        self.check(np.sqrt(x) - x ** z, unumpy.sqrt(y) - y ** w)
+        self.check(np.arctan2(x, z) * np.exp(-x), unumpy.arctan2(y, w) * unumpy.exp(-y))
+        self.check(x - x.mean(), y - y.mean())
+        self.check(x[1:] - x[:-1], y[1:] - y[:-1])
+        self.assertEqual(list((x - x).std_dev), [0, 0, 0])
+
+    def test_reductions(self):
+        x = uarray(np.arange(6.0).reshape(2, 3), 0.1)
+        y = unumpy.uarray(np.arange(6.0).reshape(2, 3), 0.1)
+        self.check(x.sum(axis=0), y.sum(axis=0))
+        self.check(x.sum(axis=1), y.sum(axis=1))
+        self.check(np.add.reduce(x), np.add.reduce(y))
+        s = x.sum()
+        self.assertAlmostEqual(s.nominal_value, 15)
+        self.assertAlmostEqual(s.std_dev, 0.1 * np.sqrt(6))
+
+    def test_sparse(self):
+        max_dense = units_uarray.max_dense
+        units_uarray.max_dense = 4
+        try:
+            x = uarray(self.nominal, self.std_dev)
+            z = UArray.independent(2.0, 0.5)
+            self.assertTrue(units_uarray.sparse.issparse(x.jacobian))
+            y = unumpy.uarray(self.nominal, self.std_dev)
+            w = uncertainties.ufloat(2.0, 0.5)
+            self.check(x * z - x.sum(axis=0), y * w - y.sum())
+            self.check((x / z)[::2], (y / w)[::2])
+        finally:
+            units_uarray.max_dense = max_dense
+
+    def test_correlations(self):
+        x = uarray(self.nominal, self.std_dev)
+        c = (x - x.mean()).covariance_matrix()
+        y = unumpy.uarray(self.nominal, self.std_dev)
+        np.testing.assert_allclose(
+            c, uncertainties.covariance_matrix(y - y.mean()), atol=1e-15)
+
+    def test_units(self):
+        x = uarray(Value(self.nominal, "m"), Value(self.std_dev, "m"))
+        self.assertEqual(str(x), "([1.00+/-0.10 2.00+/-0.10 3.00+/-0.20])[m]")
+        self.assertEqual(str(np.sqrt(x * x) - x),
+                         "([0.0+/-0 0.0+/-0 0.0+/-0])[m]")
+        self.assertEqual(str(units_uarray.std_devs(x + x)), "[0.2 0.2 0.4][m]")
+        self.assertRaises(units.UnitCompatibilityError,
+                          lambda: x + Value(UArray.independent(1.0, 0.1)))
+        self.assertRaises(units.UnitError, lambda: Value(2.0, "m") ** uarray(
+            [1.0, 2.0], [0.1, 0.1]))
+        self.check((Value(2.0) ** uarray(self.nominal, self.std_dev)).value,
+                   2.0 ** unumpy.uarray(self.nominal, self.std_dev))
+
+
+if __name__ == '__main__':
+    unittest.main()
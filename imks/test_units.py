@@ -56,6 +56,302 @@ class UnitTestCase(unittest.TestCase):
             self.assertAlmostEqual((a - b).value, 0.0,
                                    msg="Unit operation failed: %s != %s" % (a, b))
 
+    def test_unit_dimensions(self):
+        tests = [('m/s', 'km h^-1'),
+                 ('N', 'kg m s^-2'),
+                 ('m^1/2', 'cm^0.5'),
+                 ('J/s', 'W'),
+                 ('', 'm/m')]
+        for u1, u2 in tests:
+            self.assertIs(units.Unit(u1), units.Unit(u2),
+                          msg="Units not interned: %s, %s" % (u1, u2))
+            self.assertEqual(hash(units.Unit(u1)), hash(units.Unit(u2)))
+        u = units.Unit('m/s')
+        self.assertIs(u + u - u, u)
+        self.assertIs(u * 2 / 2, u)
+        self.assertIs((V(3.0, 'm')**(1.0/3.0)).unit * 3, units.Unit('m'))
+        self.assertFalse(bool(u - u))
+
+    def test_scalar_values(self):
+        import numpy as np
+        x = V(3.0, 'km')
+        y = V(np.array([1.0, 2.0]), 'm')
+        self.assertIsInstance(x, units.ScalarValue)
+        self.assertIsInstance(x, V)
+        self.assertNotIsInstance(y, units.ScalarValue)
+        for z in (x + y, y + x, x * y, y / x):
+            self.assertNotIsInstance(z, units.ScalarValue)
+            self.assertEqual(z.value.shape, (2,))
+        self.assertEqual(list((x + y).value), [3001.0, 3002.0])
+        self.assertIs((x * x / V(2.0, 's')).unit, units.Unit('m^2/s'))
+        self.assertEqual(str(x | units.System('km')), '3.0[km]')
+
+    def test_parse_cache(self):
+        info = units.parse_cache_info()
+        V(1.0, 'km/h')
+        V(2.0, 'km/h')
+        new_info = units.parse_cache_info()
+        self.assertEqual(new_info['misses'], info['misses'] + 1)
+        self.assertEqual(new_info['hits'], info['hits'] + 1)
+        units.newunit('furlong', V(201.168, 'm'))
+        self.assertGreater(units.parse_cache_info()['generation'], info['generation'])
+        self.assertAlmostEqual(V(1.0, 'kfurlong/h').value, 201168.0 / 3600.0)
+        units.delunit('furlong')
+        self.assertRaises(units.UnitParseError, V, 1.0, 'kfurlong/h')
+
+    def test_parser(self):
+        tests = [('m/s kg', 'm s^-1 kg^-1'),
+                 ('m/s/kg', 'm s^-1 kg^-1'),
+                 ('m s^2', 'm s^2'),
+                 ('m2 s-1', 'm^2/s'),
+                 ('(m/s)^(1/2)', 'm^1/2 s^-1/2'),
+                 ('m per s squared', 'm/s^2'),
+                 ('square km per h', 'km^2/h'),
+                 ('inverse s', 's^-1'),
+                 ('m to the 1 over 3', 'm^1/3'),
+                 ('m to the third', 'm^3')]
+        for u1, u2 in tests:
+            self.assertIs(V(1.0, u1).unit, V(1.0, u2).unit, msg=u1)
+            self.assertAlmostEqual((V(1.0, u1) / V(1.0, u2)).value, 1.0, msg=u1)
+        self.assertEqual(units.parse_unit('km s^2')[1], (('km', 1), ('s', 2.0)))
+        for u in ['m^', '(m', 'm / 2', 'two m', 'm 2 3', 'm % s', "'undefined'"]:
+            self.assertRaises(units.UnitParseError, units.parse_unit, u)
+
+    def test_isunit(self):
+        self.assertEqual(units.isunit('m'), ('', 'm'))
+        self.assertEqual(units.isunit('mm'), ('m', 'm'))
+        self.assertEqual(units.isunit('kmph'), ('k', 'mph'))
+        self.assertEqual(units.isunit('dam'), ('da', 'm'))
+        self.assertFalse(units.isunit('kx'))
+        units.newunit('ah', V(1.0, 'A h'))
+        self.assertEqual(units.isunit('dah'), ('da', 'h'))
+        units.delprefix('da')
+        self.assertEqual(units.isunit('dah'), ('d', 'ah'))
+        units.units['zz'] = V(1.0, 'm')
+        self.assertEqual(units.isunit('kzz'), ('k', 'zz'))
+        self.assertEqual(units.isunit('km', verbose=True), ('k', 'm'))
+
+    def test_compiled_systems(self):
+        args = units.System('km', 'h').args
+        cs = units.compile_system(args)
+        self.assertIs(units.compile_system(args), cs)
+        self.assertIs(cs.showunit(units.Unit('m/s')), cs.showunit(units.Unit('m/s')))
+        self.assertEqual(str(V(20.0, 'm/s') | units.System('km', 'h')), '72.0[km h^-1]')
+        units.newunit('furlong', V(201.168, 'm'))
+        self.assertIsNot(units.compile_system(args), cs)
+        cs = units.compile_system(units.System('planck').args)
+        self.assertIs(units.compile_system(units.System('planck').args), cs)
+        units.user_ns = dict(units.user_ns, c=V(3.0e8, 'm/s'))
+        self.assertIsNot(units.compile_system(units.System('planck').args), cs)
+
+    def test_find_compatible(self):
+        x = V(1.0, 'J/m^3')
+        self.assertEqual(list(x.find_compatible(level=0)), ['Pa'])
+        self.assertEqual(list(x.find_compatible(level=1)), [(('Pa', 1),)])
+        self.assertEqual(list(V(1.0, 'm^2').find_compatible(level=1)), [(('m', 2),)])
+        res = list(x.find_compatible(level=2))
+        self.assertEqual(res[0], (('m', -2), ('N', 1)))
+        res = list(x.find_compatible(level=3))
+        self.assertEqual(res[0], (('m', -1), ('g', 1), ('s', -2)))
+        for tree in res:
+            self.assertIs(tree.to_value().unit, x.unit)
+        self.assertEqual(list(V(1.0, 'm/s').find_compatible(level=-2)),
+                         [(('m', 1), ('s', -1)), (('m', 1), ('h', -1)),
+                          (('N', -1), ('W', 1))])
+
+    def test_ufuncs(self):
+        import numpy as np
+        x = V(np.array([1.0, 4.0, 9.0]), 'm')
+        y = V(np.array([1.0, 2.0, 3.0]), 'km')
+        tests = [(np.sqrt(x), [1.0, 2.0, 3.0], 'm^1/2'),
+                 (np.add(x, y), [1001.0, 2004.0, 3009.0], 'm'),
+                 (np.multiply(x, y), [1000.0, 8000.0, 27000.0], 'm^2'),
+                 (np.maximum(x, 2.0 * x), [2.0, 8.0, 18.0], 'm'),
+                 (np.power(x, 2), [1.0, 16.0, 81.0], 'm^2'),
+                 (np.add.reduce(x), 14.0, 'm'),
+                 (np.multiply.reduce(x), 36.0, 'm^3'),
+                 (np.maximum.accumulate(x[::-1]), [9.0, 9.0, 9.0], 'm'),
+                 (x.mean(), 14.0 / 3.0, 'm')]
+        for a, v, u in tests:
+            self.assertIs(a.unit, units.Unit(u))
+            np.testing.assert_allclose(a.value, v)
+        out = V(np.zeros(3), '')
+        self.assertIs(np.multiply(x, V(2.0, 's'), out=out), out)
+        self.assertIs(out.unit, units.Unit('m s'))
+        np.add(x, y, out=out, where=np.array([True, False, True]))
+        self.assertIs(out.unit, units.Unit('m'))
+        np.testing.assert_allclose(out.value, [1001.0, 8.0, 3009.0])
+        self.assertEqual(list(np.less(x, V(np.array([2.0, 2.0, 2.0]), 'm'))),
+                         [True, False, False])
+        self.assertIsInstance(np.sqrt(V(4.0, 'm^2')), units.ScalarValue)
+        for f in (lambda: np.exp(x), lambda: np.add(x, V(1.0, 's')),
+                  lambda: np.multiply.accumulate(x),
+                  lambda: np.sqrt(x, out=np.zeros(3))):
+            self.assertRaises(units.UnitError, f)
+
+    def test_converters(self):
+        import numpy as np
+        c = units.converter('km/h', 'm/s')
+        self.assertIs(units.converter('km/h', 'm/s'), c)
+        self.assertAlmostEqual(c(36.0), 10.0)
+        out = np.zeros(2)
+        self.assertIs(c(np.array([36.0, 72.0]), out=out), out)
+        np.testing.assert_allclose(out, [10.0, 20.0])
+        self.assertAlmostEqual(units.converter(None, 'km/h')(V(10.0, 'm/s')), 36.0)
+        self.assertAlmostEqual(units.converter('degC', 'K')(0.0), 273.15)
+        np.testing.assert_allclose(units.converter('K', 'degC')(np.array([273.15, 300.0])),
+                                   [0.0, 26.85])
+        self.assertEqual(str(V(300.0, 'K', absolute=0.0) | units.System('degC')),
+                         '26.850000000000023[degC]')
+        self.assertRaises(units.UnitCompatibilityError, units.converter, 'm', 's')
+        self.assertRaises(units.UnitCompatibilityError, c, V(1.0, 's'))
+
+    def test_registries(self):
+        import threading
+        reg = units.UnitRegistry()
+        with reg:
+            for b in ['m', 's']:
+                units.newbaseunit(b)
+            units.newprefix('k', 1000.0)
+            units.newunit('furlong', V(201.168, 'm'))
+            units.newsystem('fs', ['furlong', 's'])
+            self.assertIs(units.get_registry(), reg)
+            self.assertAlmostEqual(V(1.0, 'kfurlong/s').value, 201168.0)
+            self.assertEqual(str(V(201.168, 'm') | units.System('fs')), '1.0[furlong]')
+        self.assertIs(units.get_registry(), units.default_registry)
+        self.assertNotIn('furlong', units.units)
+        self.assertNotIn('fs', units.systems)
+        self.assertRaises(units.UnitParseError, V, 1.0, 'kfurlong')
+        self.assertEqual(reg.isunit('kfurlong'), ('k', 'furlong'))
+        errors = []
+
+        def work(registry, name, value):
+            try:
+                with registry:
+                    for n in range(200):
+                        u = '%s^%d' % (name, n % 7 + 1)
+                        x = V(1.0, u)
+                        if abs(x.value - value ** (n % 7 + 1)) > 1e-9 * x.value:
+                            errors.append(u)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=args)
+                   for args in [(reg, 'kfurlong', 201168.0),
+                                (units.default_registry, 'km', 1000.0)] * 4]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_tree_memo(self):
+        import pickle
+        tree = units.parse_unit('km/h')[1]
+        c = tree.converter()
+        self.assertIs(tree.converter(), c)
+        self.assertIs(units.converter(None, tree), c)
+        factor, unit, absolute = tree.evaluate()
+        self.assertAlmostEqual(factor, 1.0 / 3.6)
+        self.assertIs(unit, units.Unit('m/s'))
+        self.assertIs(absolute, False)
+        units.newunit('furlong', V(201.168, 'm'))
+        self.assertIsNot(tree.converter(), c)
+        tree = units.UnitTree.simple('"c"')
+        x = V(3.0e8, 'm/s') | units.System('"c"')
+        self.assertTrue(str(x).startswith('1.0006'))
+        units.user_ns = dict(units.user_ns, c=V(3.0e8, 'm/s'))
+        self.assertEqual(str(x), '1.0')
+        self.assertAlmostEqual(tree.evaluate()[0], 3.0e8)
+        self.assertEqual(tree.show(), '')
+        self.assertEqual(pickle.loads(pickle.dumps(tree)).__dict__, {})
+
+    def test_pickle(self):
+        import pickle
+        import numpy as np
+        x = V(np.array([273.15, 300.0]), 'K', absolute=0.0)
+        x.__doc__ = 'Temperatures'
+        y = pickle.loads(pickle.dumps(x, pickle.HIGHEST_PROTOCOL))
+        np.testing.assert_allclose(y.value, x.value)
+        self.assertIs(y.unit, x.unit)
+        self.assertEqual(y.absolute, 0.0)
+        self.assertEqual(y.__doc__, 'Temperatures')
+        y = pickle.loads(pickle.dumps(V(3.0, 'km/h')))
+        self.assertEqual(y, V(3.0, 'km/h'))
+        self.assertIs(y.unit, V(3.0, 'km/h').unit)
+
+    def test_documentation(self):
+        from .units import Doc, getdoc, getsource, documentation, make_object_w_doc
+
+        class Slotted(object):
+            __slots__ = ()
+
+        documentation.prune()
+        classes, entries = len(float.__subclasses__()), len(documentation)
+        x = float("2.5") & Doc("A float", "5 / 2")
+        t = tuple([1, 2]) & Doc("A tuple")
+        self.assertEqual((x, t), (2.5, (1, 2)))
+        self.assertEqual(len(float.__subclasses__()), classes)
+        self.assertEqual((getdoc(x), getsource(x)), ("A float", "5 / 2"))
+        self.assertEqual(getdoc(t), "A tuple")
+        self.assertEqual(getdoc(float("2.5")), float.__doc__)
+        self.assertEqual(getdoc(V(1.0, 'm') & Doc("A length")), "A length")
+        # Objects shared by the interpreter are copied
+        one = 1 & Doc("One")
+        self.assertEqual((one, getdoc(one), getdoc(1)), (1, "One", int.__doc__))
+        self.assertEqual(getdoc(() & Doc("Empty")), "Empty")
+        namespace = {"Doc": Doc}
+        exec("a = 0.5 & Doc('A')\nb = 0.5 & Doc('B')", namespace)
+        self.assertEqual((getdoc(namespace["a"]), getdoc(namespace["b"])),
+                         ("A", "B"))
+        self.assertRaises(TypeError, lambda: True & Doc("True"))
+        self.assertIs(None & Doc("", "None"), None)
+        # Objects with slots are documented in the table
+        z = Slotted() & Doc("Slots")
+        self.assertEqual(getdoc(z), "Slots")
+        self.assertEqual(len(documentation), entries + 1)
+        # Called when loading objects pickled by previous versions
+        y = make_object_w_doc(float("3.5"), "Old")
+        self.assertEqual(getdoc(y), "Old")
+        del x, t, y, z
+        documentation.prune()
+        self.assertEqual(len(documentation), entries)
+
+    def test_dimension_analysis(self):
+        import ast
+        from . import analysis
+        namespace = {'Value': V, 'v': V(2.0, 'm/s')}
+        code = ("x = v + Value(3.6, 'km/h')\n"
+                "for i in range(3):\n"
+                "    x = x - v\n"
+                "    t = x / v\n"
+                "    b = x < Value(1.0, 'm/s')\n")
+        tree = analysis.analyze(ast.parse(code), namespace)
+        names = set(n.id for n in ast.walk(tree) if isinstance(n, ast.Name))
+        for name in ('__imks_add__', '__imks_sub__', '__imks_truediv__', '__imks_lt__'):
+            self.assertIn(name, names)
+        exec(compile(tree, '<test>', 'exec'), namespace)
+        self.assertAlmostEqual(namespace['x'].value, -3.0)
+        self.assertIs(namespace['t'].unit, units.Unit())
+        self.assertTrue(namespace['b'])
+        self.assertRaises(units.UnitCompatibilityError, analysis.analyze,
+                          ast.parse("Value(1.0, 'm') + Value(2.0, 's')"), namespace)
+        # In tolerant mode, variables might be zero: function bodies are
+        # not checked anyway, since they are run later
+        for code in ("Value(0.0, 'm') + Value(2.0, 's')", "v < Value(1.0, 'kg')",
+                     "def f():\n    return v + Value(1.0, 's')"):
+            analysis.analyze(ast.parse(code), namespace)
+        tolerant, units.tolerant = units.tolerant, False
+        try:
+            for code in ("v < Value(1.0, 'kg')",
+                         "for i in range(3):\n    x = v\n    x -= Value(1.0, 'm')"):
+                self.assertRaises(units.UnitCompatibilityError, analysis.analyze,
+                                  ast.parse(code), namespace)
+        finally:
+            units.tolerant = tolerant
+        x = V([1.0, 2.0], 'm')
+        self.assertEqual(list(analysis.unchecked_add(x, x).value), [2.0, 4.0])
+
     def test_comparisons(self):
         tests = [(V(1.2, 'm'), V(119.0, 'cm'), '__gt__'),
                  (V(0.1, 'm'), V(100.0, 'cm'), '__lt__'),
@@ -1,8 +1,13 @@
+import ast
+import itertools
 import re
+import sys
 import tokenize
 from collections import deque
+from contextlib import contextmanager
 from io import StringIO
 from . import units
+from .analysis import constant
 
 
 re_date = re.compile(r"(\d+(\.\d+){2,})([ ]+\d\d?:\d\d?:\d\d?(\.\d*)?|[ ]+\d\d?:\d\d?(\.\d*)?|[ ]+\d\d?(\.\d*)?)?")
@@ -74,6 +79,207 @@ def magic_transformer(tokens):
 ######################################################################
 # Command transformer: works on strings and does, e.g., date input
 
+# Named groups, backreferences, and escapes in a regular expression
+re_pattern_refs = re.compile(r"\\([0-7]{3}|0[0-7]{0,2}|[1-9]\d?)|\\.|"
+                             r"\(\?P<(\w+)>|\(\?P=(\w+)\)|\(\?\((\w+)\)")
+
+# Global flags at the start of a regular expression
+re_pattern_flags = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+# The date regex and the input transformers combined in a single regex, as
+# (intrans, (calendar, len(intrans)), regex, transformers): see
+# compile_transformers
+combined = (None, None, None, None)
+
+# The input transformers used before imks defines config["intrans"]
+_no_intrans = {}
+
+
+def scoped_pattern(pattern, prefix, offset):
+    """Adapt a regular expression to be part of a larger one.
+
+    Named groups and backreferences are renamed adding prefix, numbered
+    backreferences are shifted by offset, and global flags are made local.
+
+    :param str pattern:  the original regular expression
+    :param str prefix:   prefix of the group names
+    :param int offset:   number of groups preceding the pattern
+    :return str:         the adapted regular expression
+    """
+    def rename(m):
+        number, group, ref, cond = m.group(1, 2, 3, 4)
+        if number is not None:
+            if len(number) == 3 or number[0] == "0":
+                return m.group(0)
+            return "(?:\\%d)" % (int(number) + offset)
+        if group is not None:
+            return "(?P<%s%s>" % (prefix, group)
+        if ref is not None:
+            return "(?P=%s%s)" % (prefix, ref)
+        if cond is not None:
+            if cond.isdigit():
+                return "(?(%d)" % (int(cond) + offset)
+            return "(?(%s%s)" % (prefix, cond)
+        return m.group(0)
+    m = re_pattern_flags.match(pattern)
+    if m:
+        flags = m.group(1)
+        pattern = "(?%s:%s%s)" % (flags, pattern[m.end():],
+                                  "\n" if "x" in flags else "")
+    return re_pattern_refs.sub(rename, pattern)
+
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Character classes of the categories, used by first_chars
+class_categories = {sre_parse.CATEGORY_DIGIT: r"\d", sre_parse.CATEGORY_NOT_DIGIT: r"\D",
+                    sre_parse.CATEGORY_SPACE: r"\s", sre_parse.CATEGORY_NOT_SPACE: r"\S",
+                    sre_parse.CATEGORY_WORD: r"\w", sre_parse.CATEGORY_NOT_WORD: r"\W"}
+
+
+def first_chars(items):
+    """Find the characters that can start a match of a parsed regex.
+
+    :param items:   the items of a parsed regex (see sre_parse.parse)
+    :return tuple:  a list of character class elements, and a flag set if the
+                    regex can match an empty string; None if unknown
+    """
+    chars = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            return chars + [re.escape(chr(av))], False
+        elif op is sre_parse.IN:
+            for iop, iav in av:
+                if iop is sre_parse.LITERAL:
+                    chars.append(re.escape(chr(iav)))
+                elif iop is sre_parse.RANGE:
+                    chars.append("%s-%s" % (re.escape(chr(iav[0])),
+                                            re.escape(chr(iav[1]))))
+                elif iop is sre_parse.CATEGORY and iav in class_categories:
+                    chars.append(class_categories[iav])
+                else:
+                    return None
+            return chars, False
+        elif op is sre_parse.AT:
+            continue
+        elif op is sre_parse.SUBPATTERN:
+            if len(av) == 4 and av[1] & re.IGNORECASE:
+                return None
+            result = first_chars(av[-1])
+        elif op is sre_parse.BRANCH:
+            result = [], False
+            for branch in av[1]:
+                sub = first_chars(branch)
+                if sub is None:
+                    return None
+                result = result[0] + sub[0], result[1] or sub[1]
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            result = first_chars(av[2])
+            if result is not None and av[0] == 0:
+                result = result[0], True
+        else:
+            return None
+        if result is None:
+            return None
+        chars.extend(result[0])
+        if not result[1]:
+            return chars, False
+    return chars, True
+
+
+def first_class(regex):
+    """Return the elements of a class matching the first character of a regex.
+
+    :param regex:  a compiled regular expression
+    :return list:  the character class elements, or None if unknown
+    """
+    if regex.flags & re.IGNORECASE:
+        return None
+    result = first_chars(sre_parse.parse(regex.pattern, regex.flags))
+    if result is None or result[1]:
+        return None
+    return result[0]
+
+
+def compile_transformers():
+    """Combine the date regex and the input transformers in a single regex.
+
+    The date regex (used if a default calendar is set) comes first, followed
+    by the input transformers in the order they were defined: when several
+    of them match at the same position, the first one is used.  Each part is
+    enclosed in a group named _date or _tN, and the named groups of the Nth
+    transformer are renamed _tN_name.  When possible, a lookahead first
+    checks the characters that can start a match.  The combination is
+    recomputed by %newtransformer and %deltransformer, and when the input
+    transformers or the default calendar change.
+
+    :return:  the combined regex, or None if there is nothing to transform
+    """
+    global combined
+    from .config import config
+    intrans = config.get("intrans", _no_intrans)
+    calendar = config.get("default_calendar", None)
+    parts = []
+    starts = []
+    transformers = {}
+    groups = 0
+    if calendar:
+        parts.append("(?P<_date>%s)" % re_date.pattern)
+        starts.append(first_class(re_date))
+        groups += 1 + re_date.groups
+    for n, (r, t) in enumerate(intrans.values()):
+        name = "_t%d" % n
+        prefix = name + "_"
+        parts.append("(?P<%s>%s)" % (name, scoped_pattern(r.pattern, prefix,
+                                                           groups + 1)))
+        starts.append(first_class(r))
+        transformers[name] = (t, [(k, prefix + k) for k in r.groupindex])
+        groups += 1 + r.groups
+    if not parts:
+        regex = None
+    elif None in starts:
+        regex = re.compile("|".join(parts))
+    else:
+        # A lookahead on the first character, which re does not derive for
+        # an alternation of groups, avoids trying all parts everywhere
+        chars = []
+        for c in itertools.chain(*starts):
+            if c not in chars:
+                chars.append(c)
+        regex = re.compile("(?=[%s])(?:%s)" % ("".join(chars), "|".join(parts)))
+    combined = (intrans, (calendar, len(intrans)), regex, transformers)
+    return regex
+
+
+def combined_transformers():
+    """Return the combined regex of the input transformers, see compile_transformers."""
+    from .config import config
+    intrans, key, regex, _ = combined
+    if intrans is not config.get("intrans", _no_intrans) or \
+            key != (config.get("default_calendar", None), len(intrans)):
+        return compile_transformers()
+    return regex
+
+
+def apply_transformer(m):
+    """Return the replacement of a match of the combined regex."""
+    from .config import config
+    name = m.lastgroup
+    if name == "_date":
+        date = re_date.match(m.group(0))
+        datetime = [e.strip() for e in date.group(1).split(".")]
+        if date.group(3):
+            datetime.extend([e.strip() for e in date.group(3).split(":")])
+        return "%s(%s)" % (config["default_calendar"], ",".join(datetime))
+    t, names = combined[3][name]
+    reps = ['"%s": %s' % (k, m.group(g)) for k, g in names
+            if m.group(g) is not None]
+    return "%s(**{%s})" % (t, ", ".join(reps))
+
+
 def command_transformer(line):
     from .config import config
     if not config["enabled"]:
@@ -83,498 +289,411 @@ def command_transformer(line):
             line = "%uinfo -a " + line[:-2]
         else:
             line = "%uinfo " + line[:-1]
-    if config.get("default_calendar", None):
-        replaces = []
-        for m in re_date.finditer(line):
-            datetime = [e.strip() for e in m.group(1).split(".")]
-            if m.group(3):
-                datetime.extend([e.strip() for e in m.group(3).split(":")])
-            replaces.insert(0, ("%s(%s)" % (config["default_calendar"],
-                                            ",".join(datetime)),
-                                m.start(), m.end()))
-        for what, start, end in replaces:
-            line = line[:start] + what + line[end:]
-    for r, t in config["intrans"].values():
-        replaces = []
-        for m in r.finditer(line):
-            args = m.groupdict()
-            reps = ['"%s": %s' % arg for arg in args.items()
-                    if arg[1] is not None]
-            replaces.insert(0, ("%s(**{%s})" % (t, ", ".join(reps)),
-                                m.start(), m.end()))
-        for what, start, end in replaces:
-            line = line[:start] + what + line[end:]
+    combined = combined_transformers()
+    if combined is not None:
+        line = combined.sub(apply_transformer, line)
     return line
 
 
 ######################################################################
 # Unit transformer: works on tokens and does all the job
 
-def unit_quote(queue):
-    u = tokenize.untokenize(queue).replace('\\', '').replace('\n', ' ').strip()
+# Comments used as documentation strings, as in x = 3[m] # "Length": this is
+# the COMMENT token of Python 2 (in Python 3 use %let)
+doc_comment = tokenize.N_TOKENS
+
+# Numbers containing these characters are converted by the engine
+engine_marks = (".", "e", "E", "/", "(")
+
+
+def source_text(tokens):
+    """Return the source of a sequence of tokens, spaced as in the input.
+
+    Tokens on different lines are separated by spaces.
+    """
+    parts = []
+    row = col = None
+    for t in tokens:
+        if row is not None:
+            if t[2][0] > row:
+                parts.append(" " * (t[2][0] - row + t[2][1]))
+            elif t[2][1] > col:
+                parts.append(" " * (t[2][1] - col))
+        parts.append(t[1])
+        row, col = t[3]
+    return "".join(parts).replace("\\", "").replace("\n", " ").strip()
+
+
+def unit_quote(u):
     if u.find('"') < 0:
         return u'"' + u + u'"'
     elif u.find("'") < 0:
         return u"'" + u + u"'"
     else:
         return u'"""' + u + u'"""'
-    
 
-def unit_create(substatus, queue, brackets=False):
-    string = queue[0][-1]
-    if substatus == 0:
-        if brackets:
-            unit_part = queue[2:-1]
+
+def is_op(t, value):
+    return t is not None and t[0] == tokenize.OP and t[1] == value
+
+
+def is_exponent_name(t):
+    """Check if t is a name such as e12 (possibly followed by a unit)."""
+    return t is not None and t[0] == tokenize.NAME and len(t[1]) >= 2 and \
+        t[1][0].lower() == "e" and t[1][1].isdigit()
+
+
+class TokenReader(object):
+    """Reader of the input tokens, with lookahead.
+
+    When uncertainties are enabled, numbers written as 1.2+/-0.1,
+    (1.2+/-0.1)e3, or 1.234(5)e-3 are read as a single NUMBER token.
+    """
+    def __init__(self, tokens, uncertainties):
+        self.tokens = tokens
+        self.index = 0
+        self.uncertainties = uncertainties
+        self.ahead = deque()
+
+    def read(self):
+        if self.ahead:
+            return self.ahead.popleft()
+        return self.fetch()
+
+    def peek(self, n=0):
+        ahead = self.ahead
+        while len(ahead) <= n:
+            t = self.fetch()
+            if t is None:
+                return None
+            ahead.append(t)
+        return ahead[n]
+
+    def fetch(self):
+        tokens, n = self.tokens, self.index
+        if n >= len(tokens):
+            return None
+        if self.uncertainties:
+            t = tokens[n]
+            if t[0] == tokenize.NUMBER or is_op(t, "("):
+                merged = self.uncertain(n)
+                if merged is not None:
+                    return merged
+        self.index = n + 1
+        return tokens[n]
+
+    def merge(self, start, stop, exponent=None, outer=None):
+        """Merge tokens[start:stop] into a number, and move after them.
+
+        If exponent is given, tokens[stop-1] is a name starting with an
+        exponent: only its first exponent characters are merged, and the rest
+        of the name is read next.  If outer is given, the number replaces
+        tokens[outer:stop+1] (that is, the parentheses around it).
+        """
+        tokens = self.tokens
+        parts = tokens[start:stop]
+        if exponent is not None:
+            t = parts[-1]
+            end = (t[2][0], t[2][1] + exponent)
+            parts[-1] = (t[0], t[1][:exponent], t[2], end, t[4])
+            if len(t[1].rstrip()) > exponent:
+                self.ahead.append((t[0], t[1][exponent:], end, t[3], t[4]))
+        if outer is None:
+            self.index = stop
+            return (tokenize.NUMBER, source_text(parts), parts[0][2], parts[-1][3],
+                    parts[0][4])
+        self.index = stop + 1
+        return (tokenize.NUMBER, source_text(parts), tokens[outer][2],
+                tokens[stop][3], parts[0][4])
+
+    def with_exponent(self, start, n):
+        """Merge tokens[start:n] and the exponent following them, if any."""
+        tokens = self.tokens
+        ntokens = len(tokens)
+        if n < ntokens and is_exponent_name(tokens[n]):
+            s = tokens[n][1]
+            i = 2
+            while i < len(s) and s[i].isdigit():
+                i += 1
+            return self.merge(start, n + 1, i)
+        if n < ntokens - 2 and tokens[n][0] == tokenize.NAME and \
+                tokens[n][1].lower() == "e" and \
+                tokens[n+1][0] == tokenize.OP and tokens[n+1][1] in ("+", "-") and \
+                tokens[n+2][0] == tokenize.NUMBER:
+            return self.merge(start, n + 3)
+        return None
+
+    def uncertain(self, n):
+        """Return the number with uncertainty starting at tokens[n], or None."""
+        tokens = self.tokens
+        ntokens = len(tokens)
+        if tokens[n][0] == tokenize.OP:
+            # (a +/- b), possibly followed by an exponent, but not f(a +/- b)
+            if n + 6 < ntokens and self.plusminus(n + 1) and \
+                    is_op(tokens[n+6], ")") and \
+                    (n == 0 or tokens[n-1][0] != tokenize.NAME):
+                return self.with_exponent(n, n + 7) or \
+                    self.merge(n + 1, n + 6, outer=n)
+            return None
+        if n < ntokens - 4 and self.plusminus(n):
+            return self.merge(n, n + 5)
+        if n < ntokens - 3 and is_op(tokens[n+1], "(") and \
+                tokens[n+2][0] == tokenize.NUMBER and is_op(tokens[n+3], ")"):
+            # the 1.234(5) notation
+            return self.with_exponent(n, n + 4) or self.merge(n, n + 4)
+        return None
+
+    def plusminus(self, n):
+        tokens = self.tokens
+        return tokens[n][0] == tokenize.NUMBER and is_op(tokens[n+1], "+") and \
+            is_op(tokens[n+2], "/") and is_op(tokens[n+3], "-") and \
+            tokens[n+4][0] == tokenize.NUMBER
+
+
+class UnitTransformer(object):
+    """Transformer of a list of tokens, in a single pass.
+
+    Quantities (12 m/s or 12[m/s]) become Value calls, conversions (x @ km,
+    x @ [km|h]) become System calls, ^ becomes ** (if standard_exponent is
+    set), and numbers are converted by the engine.  The tokens produced keep
+    the spacing of the input, so that they can be passed to untokenize.
+    """
+    def __init__(self, tokens, engine, auto_brackets, standard_exponent):
+        self.reader = TokenReader([t for t in tokens if t[0] != tokenize.NL],
+                                  engine == "ufloat")
+        self.engine = engine
+        self.auto_brackets = auto_brackets
+        self.standard_exponent = standard_exponent
+        self.result = []
+        self.row = self.col = 0         # end of the last token produced
+        self.shift_row = 0              # row of the last replacement...
+        self.shift = 0                  # ...and columns it added to the row
+        self.line = ""
+
+    def run(self):
+        reader = self.reader
+        t = reader.read()
+        while t is not None:
+            self.statement(t)
+            t = reader.read()
+        return self.result
+
+    # Output
+    def place(self, start):
+        """Return the position of the output token replacing an input one."""
+        row, col = start
+        if row != self.shift_row:
+            self.shift_row, self.shift = row, 0
+        col += self.shift
+        if row == self.row and col < self.col:
+            col = self.col
+        return row, col
+
+    def emit(self, kind, value, start=None):
+        """Produce a new token, at start (an input position) or after the last one."""
+        if start is None:
+            row, col = self.row, self.col
+        else:
+            row, col = self.place(start)
+        end = (row, col + len(value))
+        self.result.append((kind, value, (row, col), end, self.line))
+        self.row, self.col = end
+
+    def follow(self, end):
+        """Keep the spacing of the input after a replacement ending at end."""
+        if end[0] == self.row:
+            self.shift_row, self.shift = end[0], self.col - end[1]
         else:
-            unit_part = queue[1:]
-        u = unit_quote(unit_part)
-        l1, c1 = queue[0][2]
-        l2, c2 = queue[0][3]
-        value = queue[0][1]
+            self.shift_row, self.shift = end[0], 0
+
+    def emit_token(self, t):
+        kind, value, start, end, self.line = t
+        if kind == tokenize.NUMBER:
+            self.emit_number(value, start)
+        elif kind == tokenize.OP and value == "^" and self.standard_exponent:
+            self.emit(kind, u"**", start)
+        elif start[0] == end[0]:
+            self.emit(kind, value, start)
+        else:
+            # Multi-line strings
+            row, col = self.place(start)
+            self.result.append((kind, value, (row, col), end, self.line))
+            self.row, self.col = end
+            self.shift_row, self.shift = end[0], 0
+            return
+        self.follow(end)
+
+    def emit_number(self, value, start=None):
+        engine = self.engine
+        if engine and any(value.find(c) >= 0 for c in engine_marks):
+            self.emit(tokenize.NAME, engine, start)
+            self.emit(tokenize.OP, u"(")
+            self.emit(tokenize.STRING, '"' + value + '"')
+            self.emit(tokenize.OP, u")")
+        else:
+            self.emit(tokenize.NUMBER, value, start)
+
+    # Parsing
+    def statement(self, t):
+        kind, value = t[0], t[1]
+        if kind == tokenize.OP and value == "@":
+            self.system(t)
+        elif kind == tokenize.NUMBER:
+            self.quantity(t)
+        elif kind == doc_comment:
+            comment = value[1:].strip()
+            if len(comment) > 0 and comment[0] in "'\"" and comment[-1] == comment[0]:
+                self.line = t[4]
+                comment = comment.encode('latin-1').decode('unicode_escape')
+                self.emit(tokenize.OP, u"&", t[2])
+                self.emit(tokenize.NAME, u"Doc")
+                self.emit(tokenize.OP, u"(")
+                self.emit(tokenize.STRING, comment)
+                self.emit(tokenize.OP, u")")
+                self.follow(t[3])
+            else:
+                self.emit_token(t)
+        else:
+            self.emit_token(t)
+
+    def isunit(self, t):
+        return t is not None and t[0] == tokenize.NAME and units.isunit(t[1])
+
+    def quantity(self, number):
+        """Transform a number, possibly followed by a unit."""
+        reader = self.reader
+        t = reader.peek()
+        if is_op(t, "["):
+            reader.read()
+            parts, close = self.bracket()
+            if close is None:
+                self.emit_token(number)
+                self.emit_token(t)
+                for t in parts[0]:
+                    self.emit_token(t)
+                return
+            unit = parts[0]
+            end = close[3]
+        elif self.auto_brackets and self.isunit(t):
+            unit = self.units()
+            end = unit[-1][3]
+        else:
+            self.emit_token(number)
+            return
+        self.line = number[4]
+        value = number[1]
         if value.find(".") < 0 and value.find("e") < 0:
             value = value + ".0"
-            c2 = c2 + 2
-        offset = c2 + 8 + len(u) - queue[-1][3][1]
-        return [(tokenize.NAME, u"Value", (l1, c1), (l1, c1+5), string),
-                (tokenize.OP, u'(', (l1, c1+5), (l1, c1+6), string),
-                (tokenize.NUMBER, value, (l1, c1+6), (l2, c2+6), string),
-                (tokenize.OP, u',', (l2, c2+6), (l2, c2+7), string),
-                (tokenize.STRING, u, (l2, c2+7), (l2, c2+7+len(u)), string),
-                (tokenize.OP, u')', (l2, c2+7+len(u)), (l2, c2+8+len(u)), string)], \
-            offset
-    else:
-        if brackets:
-            u = unit_quote(queue[1:-1])
-            l1, c1 = queue[0][2]
-            offset = c1 + len(u) - queue[-1][3][1]
-            return [(tokenize.STRING, u, (l1, c1), (l1, c1+len(u)), string)], \
-                offset
-        else:
-            u = unit_quote(queue)
-            l1, c1 = queue[0][2]
-            offset = c1 + len(u) - queue[-1][3][1]
-            return [(tokenize.STRING, u, (l1, c1), (l1, c1+len(u)), string)], \
-                offset
+        self.emit(tokenize.NAME, u"Value", number[2])
+        self.emit(tokenize.OP, u"(")
+        self.emit_number(value)
+        self.emit(tokenize.OP, u",")
+        self.emit(tokenize.STRING, unit_quote(source_text(unit)))
+        self.emit(tokenize.OP, u")")
+        self.follow(end)
 
+    def bracket(self, separators=()):
+        """Read the tokens up to the closing bracket.
 
-def unit_transformer(tokens):
-    from .config import config, internals
-    if not config["enabled"]:
-        return tokens
-    engine = internals["engine"]
-    
-    # fix multi-line issue
-    tokens = list(filter(lambda x: x[0] != tokenize.NL, tokens))
+        :return tuple:  the list of the parts separated by separators (each a
+                        list of tokens), and the closing bracket (None if not
+                        found)
+        """
+        reader = self.reader
+        parts = [[]]
+        t = reader.read()
+        while t is not None:
+            if is_op(t, "]"):
+                return parts, t
+            if t[0] == tokenize.OP and t[1] in separators:
+                parts.append([])
+            else:
+                parts[-1].append(t)
+            t = reader.read()
+        return parts, None
 
-    # DEBUG ONLY:
-    # for t in tokens:
-    #    print(t)
-    
-    # First, check if there are uncertainties combinations
-    if engine == "ufloat":
-        newtoks = []
-        ntokens = len(tokens)
-        n = 0
-        while n < ntokens:
-            c0 = tokens[n][0]
-            if c0 == tokenize.NUMBER:
-                if n < ntokens - 4 and \
-                        tokens[n+1][0] == tokenize.OP and tokens[n+1][1] == "+" and \
-                        tokens[n+2][0] == tokenize.OP and tokens[n+2][1] == "/" and \
-                        tokens[n+3][0] == tokenize.OP and tokens[n+3][1] == "-" and \
-                        tokens[n+4][0] == tokenize.NUMBER:
-                    # check if we are using the (a +/- b)[exp] syntax
-                    if 0 < n < ntokens - 5 and \
-                            tokens[n-1][0] == tokenize.OP and tokens[n-1][1] == "(" and \
-                            tokens[n+5][0] == tokenize.OP and tokens[n+5][1] == ")":
-                        # OK, we might be using it, check if this is a function
-                        # call
-                        if n <= 1 or tokens[n-2][0] != tokenize.NAME:
-                            # not a function call: we need to remove the
-                            # parentheses; check if the exponent is following
-                            newtoks.pop()
-                            if n < ntokens - 6 and \
-                                    tokens[n+6][0] == tokenize.NAME and \
-                                    len(tokens[n+6][1]) >= 2 and \
-                                    tokens[n+6][1][0].lower() == "e" and \
-                                    tokens[n+6][1][1].isdigit():
-                                # Get all digits after "e": the rest might be a
-                                # unit specification
-                                i = 2
-                                t1 = tokens[n+6]
-                                s = t1[1]
-                                while i < len(s) and s[i].isdigit():
-                                    i = i+1
-                                tokens[n+6] = (t1[0], s[0:i], t1[2],
-                                               (t1[3][0], t1[2][1] + i), t1[4])
-                                t = (tokenize.NUMBER,
-                                     tokenize.untokenize(tokens[n-1:n+7]),
-                                     tokens[n-1][2], tokens[n+6][3],
-                                     tokens[n][4])
-                                newtoks.append(t)
-                                if len(s.rstrip()) > i:
-                                    t1 = (t1[0], s[i:], (t1[2][0], t1[2][1]+i),
-                                          t1[3], t1[4])
-                                    tokens[n+6] = t1
-                                    n = n - 1
-                                n = n + 7
-                                continue
-                            elif n < ntokens - 8 and \
-                                    tokens[n+6][0] == tokenize.NAME and \
-                                    tokens[n+6][1].lower() == "e" and \
-                                    tokens[n+7][0] == tokenize.OP and \
-                                    tokens[n+7][1] in ["+", "-"] and \
-                                    tokens[n+8][0] == tokenize.NUMBER:
-                                t = (tokenize.NUMBER,
-                                     tokenize.untokenize(tokens[n-1:n+9]),
-                                     tokens[n-1][2], tokens[n+8][3],
-                                     tokens[n][4])
-                                newtoks.append(t)
-                                n = n + 9
-                                continue
-                            else:
-                                # The parentheses are not needed: remove them!
-                                t = (tokenize.NUMBER,
-                                     tokenize.untokenize(tokens[n:n+5]),
-                                     tokens[n-1][2], tokens[n+4][3],
-                                     tokens[n][4])
-                                newtoks.append(t)
-                                n = n + 6
-                                continue
-                    t = (tokenize.NUMBER, tokenize.untokenize(tokens[n:n+5]),
-                         tokens[n][2], tokens[n+4][3], tokens[n][4])
-                    newtoks.append(t)
-                    n = n + 5
-                    continue
-                if n < ntokens - 3 and \
-                        tokens[n+1][0] == tokenize.OP and tokens[n+1][1] == "(" and \
-                        tokens[n+2][0] == tokenize.NUMBER and \
-                        tokens[n+3][0] == tokenize.OP and tokens[n+3][1] == ")":
-                    # using the 1.234(5) notation: verify the possible presence
-                    # of an exponent
-                    if n < ntokens - 4 and \
-                            tokens[n+4][0] == tokenize.NAME and \
-                            len(tokens[n+4][1]) >= 2 and \
-                            tokens[n+4][1][0].lower() == "e" and \
-                            tokens[n+4][1][1].isdigit():
-                        # Get all digits after "e": the rest might be a
-                        # unit specification
-                        i = 2
-                        t1 = tokens[n+4]
-                        s = t1[1]
-                        while i < len(s) and s[i].isdigit():
-                            i = i+1
-                        tokens[n+4] = (t1[0], s[0:i], t1[2],
-                                       (t1[3][0], t1[2][1] + i), t1[4])
-                        t = (tokenize.NUMBER,
-                             tokenize.untokenize(tokens[n:n+5]),
-                             tokens[n][2], tokens[n+4][3],
-                             tokens[n][4])
-                        newtoks.append(t)
-                        if len(s.rstrip()) > i:
-                            t1 = (t1[0], s[i:], (t1[2][0], t1[2][1]+i),
-                                  t1[3], t1[4])
-                            tokens[n+4] = t1
-                            n = n - 1
-                        n = n + 5
-                        continue
-                    elif n < ntokens - 6 and \
-                            tokens[n+4][0] == tokenize.NAME and \
-                            tokens[n+4][1].lower() == "e" and \
-                            tokens[n+5][0] == tokenize.OP and \
-                            tokens[n+5][1] in ["+", "-"] and \
-                            tokens[n+6][0] == tokenize.NUMBER:
-                        t = (tokenize.NUMBER,
-                             tokenize.untokenize(tokens[n:n+7]),
-                             tokens[n][2], tokens[n+6][3],
-                             tokens[n][4])
-                        newtoks.append(t)
-                        n = n + 7
-                        continue
-                    else:
-                        t = (tokenize.NUMBER, tokenize.untokenize(tokens[n:n+4]),
-                             tokens[n][2], tokens[n+3][3], tokens[n][4])
-                        newtoks.append(t)
-                        n = n + 4
-                        continue
-            newtoks.append(tokens[n])
-            n = n + 1
-        tokens = newtoks
-    # Now proceed
-    newtoks = []                        # Transformed tokens
-    queue = []                          # Queue used to store partial units
-    status = 0                          # General status
-    substatus = 0                       # Substatus: before (0) or after (1) @
-    offset = 0                          # Current offset of the tokens
-    reset = False                       # Do a reset after a newline
-    for tt in tokens:                   # Feed loop
-        if False and tt[1] == "~":      # Debug me! @@@
-            import pdb
-            pdb.set_trace()
-            continue
-        if reset:
-            status = 0
-            substatus = 0 
-            offset = 0
-            reset = False
-        if tt[0] in (tokenize.NEWLINE, tokenize.NL):
-            reset = True
-        tokens1 = deque([offset_token(tt, offset)])
-        while tokens1:                  # Internal loop
-            t = tokens1.popleft()
-            codex, value, p1, p2, string = t
-            if codex == tokenize.OP and value == "@" and not queue:
-                substatus = 1
-                status = 1
-            if codex == tokenize.N_TOKENS:
-                comment = value[1:].strip()
-                if len(comment) > 0 and comment[0] in "'\"" and comment[-1] == comment[0]:
-                    comment = comment.encode('latin-1').decode('unicode_escape')
-                    codex = tokenize.OP
-                    value = "&"
-                    l1, c1 = p1
-                    t = codex, value, p1, (l1, c1+1), string
-                    lc = len(comment)
-                    tokens1.extend([t,
-                                    (tokenize.NAME, "Doc", (l1, c1+2), (l1, c1+5),
-                                     string),
-                                    (tokenize.OP, "(", (l1, c1+5), (l1, c1+6), string),
-                                    (tokenize.STRING, comment, (l1, c1+6),
-                                     (l1, c1+6+lc), string),
-                                    (tokenize.OP, ")", (l1, c1+6+lc), (l1, c1+7+lc),
-                                     string)])
-                    continue
-            if status <= 0:                 # ...
-                if codex == tokenize.NUMBER and substatus == 0:
-                    status = 1
-                    queue.append(t)
-                else:
-                    newtoks.append(t)
-            elif status == 1:               # ...12 or ... @
-                if codex == tokenize.OP and value == "[":
-                    status = 2
-                    queue.append(t)
-                elif config["auto_brackets"] and codex == tokenize.NAME and \
-                        (units.isunit(value) or substatus == 1):
-                    status = 3
-                    queue.append(t)
-                elif config["auto_brackets"] and value == "*" and \
-                        substatus == 1:
-                    status = 1
-                    queue.append(t)
-                elif substatus == 1 and value == "@":
-                    value = "|"
-                    l1, c1 = t[3]
-                    s = t[-1]
-                    offset += 7             # This is OK, tokens1 is empty now
-                    newtoks.extend([change_token(t, value),
-                                    (tokenize.NAME, u"System", (l1, c1), (l1, c1+6), s),
-                                    (tokenize.OP, u"(", (l1, c1+6), (l1, c1+7), s)])
-                else:
-                    newtoks.extend(queue)
-                    queue = []
-                    tokens1.appendleft(t)
-                    if substatus == 1:
-                        l1, c1 = t[3]
-                        s = t[-1]
-                        newtoks.append((tokenize.OP, u")", (l1, c1+1), (l1, c1+2), s))
-                        substatus = 0
-                        offset += 1
-                        tokens1 = offset_tokens(tokens1, 2)
-                    status = 0
-            elif status == 2:               # ...12[ or ... @[
-                if codex == tokenize.OP and value == "]":
-                    status = 0
-                    queue.append(t)
-                    queue, delta = unit_create(substatus, queue, True)
-                    newtoks.extend(queue)
-                    if substatus == 1:
-                        delta += 1
-                        newtoks.append(offset_token(change_token(t, ")"), delta))
-                        substatus = 0
-                    offset += delta
-                    tokens1 = offset_tokens(tokens1, delta)
-                    queue = []
-                elif substatus == 1 and codex == tokenize.OP and \
-                        (value == "," or value == "|"):
-                    queue.append(change_token(t, "]"))
-                    queue, delta = unit_create(substatus, queue, True)
-                    newtoks.extend(queue)
-                    newtoks.append(offset_token(change_token(t, ","), delta + 1))
-                    queue = [offset_token(change_token(t, "["), delta + 2)]
-                    offset += delta + 3
-                    tokens1 = offset_tokens(tokens1, delta + 4)
-                else:
-                    queue.append(t)
-            elif status == 3:               # ...12 m or ... @ m
-                if codex == tokenize.NAME and units.isunit(value):
-                    queue.append(t)
-                elif codex == tokenize.OP and value == "/":
-                    status = 4
-                    queue.append(t)
-                elif codex == tokenize.OP and value == "^":
-                    status = 5
-                    queue.append(t)
-                elif codex == tokenize.OP and value == ".":
-                    status = 8
-                    queue.append(t)
-                else:
-                    queue, delta = unit_create(substatus, queue)
-                    newtoks.extend(queue)
-                    tokens1.appendleft(t)
-                    offset += delta
-                    tokens1 = offset_tokens(tokens1, delta)
-                    if substatus == 1:
-                        col = queue[-1][3][1]
-                        tokens1 = offset_tokens(tokens1, 1)
-                        tokens1.appendleft((tokenize.OP, ")",
-                                           (t[2][0], col),
-                                           (t[2][0], col+1), t[4]))
-                        substatus = 0
-                        offset += 1
-                    status = 0
-                    queue = []
-            elif status == 4 or status == 8:  # ...12 m / or ...12 m.
-                if codex == tokenize.NAME:
-                    # Mmh, found a name after a / in a possible unit specification.
-                    # Is it really a possible unit or not?  Check...
-                    if units.isunit(value):
-                        # It is a unit, use it
-                        status = 3
-                        queue.append(t)
-                        continue
-                # We did not find a name after a / or the name was not a valid
-                # unit.  Put everything back!
-                status = 0
-                t0 = queue.pop()
-                queue, delta = unit_create(substatus, queue)
-                newtoks.extend(queue)
-                if substatus == 1:
-                    tokens1.appendleft(offset_token(t, 1))
-                    tokens1.appendleft((tokenize.OP, ")", (t[2][0], t[2][1]),
-                                       (t[2][0], t[2][1]+1), t[4]))
-                    substatus = 0
-                else:
-                    tokens1.appendleft(t)
-                tokens1.appendleft(t0)
-                offset += delta
-                tokens1 = offset_tokens(tokens1, delta)
-                queue = []
-            elif status == 5:               # 12 m^
-                if codex == tokenize.NUMBER:
-                    status = 6
-                    queue.append(t)
-                elif codex == tokenize.OP and (value == "-" or value == "+"):
-                    status = 7
-                    queue.append(t)
-                else:
-                    status = 0
-                    t0 = queue[-1]
-                    queue = queue[0:-1]
-                    queue, delta = unit_create(substatus, queue)
-                    newtoks.extend(queue)
-                    if substatus == 1:
-                        tokens1.appendleft(offset_token(t, 1))
-                        tokens1.appendleft((tokenize.OP, ")", (t[2][0], t[2][1]),
-                                            (t[2][0], t[2][1]+1), t[4]))
-                        substatus = 0
-                    else:
-                        tokens1.appendleft(t)
-                    tokens1.appendleft(t0)
-                    offset += delta
-                    tokens1 = offset_tokens(tokens1, delta)
-                    queue = []
-            elif status == 6:               # 12 m^2 or 12 m^-2
-                if codex == tokenize.NAME and units.isunit(value):
-                    queue.append(t)
-                    status = 3
-                elif codex == tokenize.OP and value == "/":
-                    status = 4
-                    queue.append(t)
-                elif codex == tokenize.OP and value == ".":
-                    status = 8
-                    queue.append(t)
-                else:
-                    status = 0
-                    queue, delta = unit_create(substatus, queue)
-                    newtoks.extend(queue)
-                    if substatus == 1:
-                        tokens1.appendleft(offset_token(t, 1))
-                        tokens1.appendleft((tokenize.OP, ")", (t[2][0], t[2][1]),
-                                            (t[2][0], t[2][1]+1), t[4]))
-                        substatus = 0
-                    else:
-                        tokens1.appendleft(t)
-                    offset += delta
-                    tokens1 = offset_tokens(tokens1, delta)
-                    queue = []
-                continue
-            elif status == 7:               # 12 m^-
-                if codex == tokenize.NUMBER:
-                    status = 6
-                    queue.append(t)
-                    continue
+    def units(self):
+        """Read a unit specification, such as km h^-1 or m/s^2."""
+        reader = self.reader
+        isunit = self.isunit
+        unit = [reader.read()]
+        exponent = True                 # Can an exponent follow?
+        while True:
+            t = reader.peek()
+            if isunit(t):
+                unit.append(reader.read())
+                exponent = True
+            elif is_op(t, "/") or is_op(t, "."):
+                if not isunit(reader.peek(1)):
+                    break
+                unit.extend([reader.read(), reader.read()])
+                exponent = True
+            elif is_op(t, "^") and exponent:
+                t1 = reader.peek(1)
+                if t1 is not None and t1[0] == tokenize.NUMBER:
+                    unit.extend([reader.read(), reader.read()])
+                elif (is_op(t1, "-") or is_op(t1, "+")) and \
+                        reader.peek(2) is not None and \
+                        reader.peek(2)[0] == tokenize.NUMBER:
+                    unit.extend([reader.read(), reader.read(), reader.read()])
                 else:
-                    status = 0
-                    t0 = queue[-1]
-                    queue = queue[0:-1]
-                    queue, delta = unit_create(substatus, queue)
-                    newtoks.extend(queue)
-                    if substatus == 1:
-                        tokens1.appendleft(offset_token(t, 1))
-                        tokens1.appendleft((tokenize.OP, ")", (t[2][0], t[2][1]),
-                                            (t[2][0], t[2][1]+1), t[4]))
-                        substatus = 0
-                    else:
-                        tokens1.appendleft(t)
-                    tokens1.appendleft(t0)
-                    tokens1.appendleft(t)
-                    tokens1.appendleft(t)
-                    offset += delta
-                    tokens1 = offset_tokens(tokens1, delta)
-                    queue = []
+                    break
+                exponent = False
             else:
-                newtoks.append(t)
-    if substatus == 0:
-        result = newtoks
-        # Fix for problem w/ tokenize.ENDMARKER
-        if len(result) >= 2 and result[-1][0] == tokenize.ENDMARKER:
-            l1, c1 = result[-2][3]
-            result = result[0:-1]
-            result.append((tokenize.ENDMARKER, "",  (l1, c1), (l1, c1+1), result[-1][-1]))
-    else:
-        result = newtoks
-    if config["standard_exponent"]:
-        result = [(codex, u"**", p1, p2, string) if codex == tokenize.OP and value == "^"
-                  else (codex, value, p1, p2, string)
-                  for codex, value, p1, p2, string in result]
-    if engine:
-        uresult = []
-        offset = 0
-        for t in result:
-            t = offset_token(t, offset)
-            if t[0] == tokenize.NUMBER and \
-                (t[1].find(".") >= 0 or t[1].find("e") >= 0 or
-                 t[1].find("E") >= 0 or
-                 t[1].find("/") >= 0 or t[1].find("(") >= 0):
-                l1, c1 = t[2]
-                l2, c2 = t[3]
-                le = len(engine)
-                uresult.extend([(tokenize.NAME, engine, t[2], (l1, c1+le), t[4]),
-                                (tokenize.OP, u"(", (l1, c1+le), (l1, c1+le+1), t[4]),
-                                (tokenize.STRING, '"' + t[1] + '"', (l1, c1+le+1),
-                                 (l2, c2+le+3), t[4]),
-                                (tokenize.OP, u")", (l2, c2+le+3), (l2, c2+le+4), t[4])])
-                offset += le + 4
+                break
+        return unit
+
+    def system(self, at):
+        """Transform a conversion, such as x @ km/h or x @ [km|h]."""
+        reader = self.reader
+        self.line = at[4]
+        self.emit(tokenize.OP, u"|", at[2])
+        self.emit(tokenize.NAME, u"System")
+        self.emit(tokenize.OP, u"(")
+        self.follow(at[3])
+        stars = []
+        while True:
+            t = reader.peek()
+            if is_op(t, "["):
+                reader.read()
+                parts, close = self.bracket((",", "|"))
+                parts[0][0:0] = stars
+                for n, part in enumerate(parts):
+                    if n > 0:
+                        self.emit(tokenize.OP, u",")
+                    self.emit(tokenize.STRING, unit_quote(source_text(part)),
+                              t[2] if n == 0 else None)
+                self.emit(tokenize.OP, u")")
+                if close is not None:
+                    self.follow(close[3])
+                return
+            elif self.auto_brackets and t is not None and t[0] == tokenize.NAME:
+                unit = stars + self.units()
+                self.emit(tokenize.STRING, unit_quote(source_text(unit)), unit[0][2])
+                self.emit(tokenize.OP, u")")
+                self.follow(unit[-1][3])
+                return
+            elif self.auto_brackets and is_op(t, "*"):
+                stars.append(reader.read())
+            elif is_op(t, "@"):
+                reader.read()
+                self.emit(tokenize.OP, u"|", t[2])
+                self.emit(tokenize.NAME, u"System")
+                self.emit(tokenize.OP, u"(")
+                self.follow(t[3])
             else:
-                uresult.append(t)
-            if t[0] in (tokenize.NEWLINE, tokenize.NL):
-                offset = 0
-        result = uresult
-    # @@@DEBUG
-    # for t in result:
-    #     print(t)
-    return result
+                for star in stars:
+                    self.emit_token(star)
+                self.emit(tokenize.OP, u")")
+                return
+
+
+def unit_transformer(tokens):
+    from .config import config, internals
+    if not config["enabled"]:
+        return tokens
+    return UnitTransformer(tokens, internals["engine"], config["auto_brackets"],
+                           config["standard_exponent"]).run()
 
 
 ######################################################################
@@ -589,5 +708,280 @@ except NameError:
 
 def transform(code):
     # We should probably add a command_transformer call here?
-    tokens = tokenize.generate_tokens(StringIO(unicode(code.strip())).readline)
+    return cached_transform("expression", code.strip(), transform_expression)
+
+
+def transform_expression(code):
+    tokens = tokenize.generate_tokens(StringIO(unicode(code)).readline)
     return tokenize.untokenize(unit_transformer(list(tokens)))
+
+
+######################################################################
+# Transformation cache
+
+transform_cache = units.LRUCache(512)
+
+
+def transform_settings():
+    """Return the settings the transformers depend on, besides the units.
+
+    These are the configuration flags, the input transformers, and the
+    engine, as a tuple of plain values.
+    """
+    from .config import config, internals
+    intrans = tuple((k, r.pattern, t)
+                    for k, (r, t) in config.get("intrans", _no_intrans).items())
+    return (config["enabled"], config["auto_brackets"],
+            config["standard_exponent"], config["constant_pool"],
+            config.get("default_calendar", None), intrans, internals["engine"])
+
+
+def transform_key(kind, source):
+    """Return the key used to cache the transformation of source.
+
+    Besides the source, the key includes everything the transformers depend
+    on: the settings returned by `transform_settings`, and the current unit
+    registry with its generation (units are recognized by `units.isunit`).
+
+    :param str kind:  name of the transformation (transformations of
+                      different kinds are cached separately)
+    :param source:    source string or tuple of tokens
+    """
+    reg = units.get_registry()
+    return (kind, source) + transform_settings() + \
+        (id(reg), reg.generation, reg.prefixonly)
+
+
+def cached_transform(kind, source, function):
+    """Transform source using function, or return the cached transformation.
+
+    :param str kind:     name of the transformation
+    :param source:       source string or tuple of tokens
+    :param function:     function performing the transformation of source
+    :return:             the value returned by function (exceptions are not
+                         cached)
+    """
+    key = transform_key(kind, source)
+    result = transform_cache.get(key)
+    if result is None:
+        result = function(source)
+        transform_cache.put(key, result)
+    return result
+
+
+def cached_unit_transformer(tokens):
+    """Version of `unit_transformer` using the transformation cache."""
+    return list(cached_transform("tokens", tuple(tokens),
+                                 lambda ts: unit_transformer(list(ts))))
+
+
+def transform_cache_info():
+    """Return the statistics of the transformation cache.
+
+    :return dict:  a dictionary with hits, misses, size, maxsize, and the
+                   hit rate
+    """
+    info = transform_cache.info()
+    total = info["hits"] + info["misses"]
+    info["hit_rate"] = info["hits"] / float(total) if total else 0.0
+    return info
+
+
+######################################################################
+# Constant pool: quantity and date literals hoisted out of the loops
+
+re_plain_number = re.compile(r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?[jJ]?$")
+
+# Types of the values kept by the constant pools (calendars add their dates);
+# the types other than numbers must define __copy__, see ConstantPool
+constant_types = [units.ScalarValue, float, int, complex]
+
+pool_counter = itertools.count()
+
+
+class ConstantPool(dict):
+    """Values of the literals hoisted out of the loops of a cell.
+
+    Maps the index of each literal to its value.  A literal is evaluated in
+    the user namespace when it is first used, and its value is kept only if
+    it belongs to one of the `constant_types`; other values are computed again
+    at each use.  Quantities and dates are mutable (for example, through
+    their showunit), so each use receives a copy of the kept value.
+    """
+    def __init__(self, namespace, sources):
+        """Create an empty pool.
+
+        :param dict namespace:  user namespace
+        :param list sources:    source code of the literals
+        """
+        dict.__init__(self)
+        self.namespace = namespace
+        self.sources = sources
+
+    def __getitem__(self, index):
+        value = dict.__getitem__(self, index)
+        if isinstance(value, (float, int, complex)) or index not in self:
+            return value
+        return value.__copy__()
+
+    def __missing__(self, index):
+        value = eval(self.sources[index], self.namespace)
+        if isinstance(value, tuple(constant_types)):
+            self[index] = value
+        return value
+
+
+def literal_source(node, names):
+    """Return the source code of a literal, or None if node is not a literal.
+
+    Literals are calls of one of names (Value, the engine, and the default
+    calendar) with numbers and strings as arguments, possibly nested.  Numbers
+    with uncertainties and units depending on the user variables (quoted
+    units) are not literals, since they must be evaluated each time.
+    """
+    if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name) or \
+            node.func.id not in names or node.keywords or \
+            getattr(node, "starargs", None) or getattr(node, "kwargs", None):
+        return None
+    args = []
+    for arg in node.args:
+        source = literal_source(arg, names)
+        if source is None:
+            ok, value = constant(arg)
+            if not ok or isinstance(value, bool) or value is None:
+                return None
+            if isinstance(value, (str, unicode)):
+                if "'" in value or '"' in value or \
+                        (node.func.id != "Value" and not re_plain_number.match(value)):
+                    return None
+            source = repr(value)
+        args.append(source)
+    return "%s(%s)" % (node.func.id, ",".join(args))
+
+
+class ConstantHoister(ast.NodeTransformer):
+    """Replace the literals found in loops and comprehensions with pool lookups.
+
+    The bodies of functions and lambdas are not changed, since they can be
+    executed after the registry has changed, and neither are generator
+    expressions, which can be consumed after the cell has run and its pool
+    has been removed.
+    """
+    def __init__(self, name, names):
+        self.name = name
+        self.names = names
+        self.sources = []
+        self.indices = {}
+        self.loops = 0
+
+    def visit_loop(self, node):
+        self.loops += 1
+        try:
+            return self.generic_visit(node)
+        finally:
+            self.loops -= 1
+
+    visit_For = visit_AsyncFor = visit_While = visit_loop
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_loop
+
+    def visit_definition(self, node):
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_Lambda = visit_definition
+    visit_GeneratorExp = visit_definition
+
+    def visit_Call(self, node):
+        source = literal_source(node, self.names) if self.loops else None
+        if source is None:
+            return self.generic_visit(node)
+        index = self.indices.get(source)
+        if index is None:
+            index = self.indices[source] = len(self.sources)
+            self.sources.append(source)
+        if hasattr(ast, "Constant"):
+            key = ast.Constant(index)
+        else:
+            key = ast.Num(index)
+        if sys.version_info < (3, 9):
+            key = ast.Index(key)
+        return ast.copy_location(ast.Subscript(ast.Name(self.name, ast.Load()), key,
+                                               ast.Load()), node)
+
+
+def hoist_constants(tree):
+    """Move the quantity and date literals of the loops of tree to a constant pool.
+
+    :param ast.AST tree:  syntax tree of the transformed code
+    :return tuple:        the new tree, the name of the pool, and the sources
+                          of the literals; the name is None if no literal was
+                          found (see `constant_pool`)
+    """
+    from .config import config, internals
+    if not config["enabled"] or not config["constant_pool"]:
+        return tree, None, []
+    names = set(["Value"])
+    for name in (internals["engine"], config.get("default_calendar", None)):
+        if name:
+            names.add(name)
+    hoister = ConstantHoister("__imks_constants_%d__" % next(pool_counter), names)
+    tree = hoister.visit(tree)
+    if not hoister.sources:
+        return tree, None, []
+    return ast.fix_missing_locations(tree), hoister.name, hoister.sources
+
+
+# Marks a pool name not defined before a cell
+_no_pool = object()
+
+
+@contextmanager
+def constant_pool(namespace, name, sources):
+    """Define an empty constant pool in namespace while a cell runs.
+
+    The pool is removed when the cell ends, so that the pools of the cells
+    do not accumulate in the user namespace; a pool with the same name (of
+    a run of the same cell in progress) is restored.
+    """
+    if name is None:
+        yield
+        return
+    old = namespace.get(name, _no_pool)
+    namespace[name] = ConstantPool(namespace, sources)
+    try:
+        yield
+    finally:
+        if old is _no_pool:
+            namespace.pop(name, None)
+        else:
+            namespace[name] = old
+
+
+class ShellConstantPool(ast.NodeTransformer):
+    """AST transformer using constant pools in IPython.
+
+    The pools are created when a cell is transformed, and removed by the
+    post_run_cell event; the events of nested cells (e.g., of a script run
+    by a cell) only remove their own pools.
+    """
+    def __init__(self, shell):
+        super(ShellConstantPool, self).__init__()
+        self.shell = shell
+        self.pools = []
+        self.marks = []
+        shell.events.register("pre_run_cell", self.mark_pools)
+        shell.events.register("post_run_cell", self.remove_pools)
+
+    def visit(self, node):
+        node, name, sources = hoist_constants(node)
+        if name is not None:
+            self.shell.user_ns[name] = ConstantPool(self.shell.user_ns, sources)
+            self.pools.append(name)
+        return node
+
+    def mark_pools(self, *args):
+        self.marks.append(len(self.pools))
+
+    def remove_pools(self, *args):
+        mark = self.marks.pop() if self.marks else 0
+        while len(self.pools) > mark:
+            self.shell.user_ns.pop(self.pools.pop(), None)
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, division, print_function
+from abc import ABCMeta
 from collections import OrderedDict as ODict
 from fractions import Fraction
+import itertools
 import numpy as np
-from ply import lex, yacc
 import re
+import sys
+import threading
 
 # from IPython.core.debugger import Pdb
 # Pdb().set_trace()
@@ -22,6 +25,12 @@ try:
 except ImportError:
     mpnumeric = float
 
+try:
+    from math import gcd
+except ImportError:
+    # noinspection PyDeprecation
+    from fractions import gcd
+
 from .spelling import *
 
 #####################################################################
@@ -50,6 +59,67 @@ def fraction(x, max_den=10000000):
     return f.numerator, f.denominator
 
 
+#####################################################################
+# Caching
+
+_missing = object()
+
+class LRUCache(object):
+    """A bounded, thread-safe cache that discards the least recently used items.
+
+    Lookups never wait for the lock: the recency of an item is updated only
+    if no other thread is changing the cache.  The cache also keeps track of
+    the (approximate) number of hits and misses of `get`.
+    """
+    def __init__(self, maxsize=1024):
+        """Create a new cache.
+
+        :param int maxsize:  maximum number of items stored
+        """
+        self.maxsize = maxsize
+        self.data = ODict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value associated to key, or default if key is not cached."""
+        value = self.data.get(key, _missing)
+        if value is _missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.lock.acquire(False):
+            try:
+                if key in self.data:
+                    self.data[key] = self.data.pop(key)
+            finally:
+                self.lock.release()
+        return value
+
+    def put(self, key, value):
+        """Store a value in the cache, possibly discarding the oldest item."""
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        """Remove all items from the cache (statistics are retained)."""
+        with self.lock:
+            self.data.clear()
+
+    def info(self):
+        """Return the cache statistics.
+
+        :return dict:  a dictionary with hits, misses, size, and maxsize
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self.data), "maxsize": self.maxsize}
+
+
 #####################################################################
 # Unit errors definition
 
@@ -74,18 +144,25 @@ class UnitParseError(UnitError):
                    (self.expression, self.message)
 
 
+def caller_name():
+    """Name of the function that raised a unit exception.
+
+    The frames of the exception constructor and of check_units/check_pure
+    are skipped.  Frames are inspected directly, since building a full
+    traceback would be much slower than the operation that failed.
+    """
+    frame = sys._getframe(2)
+    if frame.f_code.co_name in ("check_units", "check_pure"):
+        frame = frame.f_back
+    return frame.f_code.co_name
+
+
 class UnitCompatibilityError(UnitError):
     """Class for unit compability exceptions."""
     def __init__(self, u1, u2, where=None):
-        import traceback
         self.u1 = u1
         self.u2 = u2
-        if where and where > 2:
-            self.fn = where
-        else:
-            self.fn = traceback.extract_stack()[-2][2]
-        if self.fn == "check_units" or self.fn == "check_pure":
-            self.fn = traceback.extract_stack()[-3][2]
+        self.fn = where or caller_name()
 
     def __str__(self):
         return "%s incompatible with %s in %s" % \
@@ -95,15 +172,9 @@ class UnitCompatibilityError(UnitError):
 class UnitAbsoluteError(Exception):
     """Class for exceptions related to absolute units."""
     def __init__(self, a1, a2, where=None):
-        import traceback
         self.a1 = "absolute" if a1 is not False else "relative"
         self.a2 = "absolute" if a2 is not False else "relative"
-        if where and where > 2:
-            self.fn = where
-        else:
-            self.fn = traceback.extract_stack()[-2][2]
-        if self.fn == "check_units" or self.fn == "check_pure":
-            self.fn = traceback.extract_stack()[-3][2]
+        self.fn = where or caller_name()
 
     def __str__(self):
         return "%s unit incompatible with %s unit in %s" % \
@@ -113,18 +184,132 @@ class UnitAbsoluteError(Exception):
 #####################################################################
 # Documentation functions
 
-def make_object_w_doc(value, doc="", source=""):
+class DocRegistry(object):
+    """Documentation of the objects that do not accept new attributes.
+
+    Objects with slots, such as the numbers of some engines, cannot hold a
+    documentation string: their documentation, source, and timestamp are kept
+    in this table, keyed by the id of the object.  (Built-in numbers, strings,
+    and tuples are instead copied into one of the `doc_types`, since the
+    interpreter shares equal instances.)  Each entry keeps a reference to its
+    object, so that the id cannot be reused by another object; entries whose
+    objects are not referenced anywhere else are pruned when the table grows.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.limit = 256
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def set(self, obj, doc="", source="", timestamp=None):
+        """Record the documentation of an object.
+
+        :param obj:            the object to document
+        :param str doc:        documentation string
+        :param source:         source string
+        :param str timestamp:  time of last update of the object
+        """
+        with self.lock:
+            self.entries[id(obj)] = (obj, doc, source, timestamp)
+            if len(self.entries) > self.limit:
+                self.prune()
+                self.limit = max(256, 2 * len(self.entries))
+
+    def get(self, obj):
+        """Return the tuple (doc, source, timestamp) of an object, or None."""
+        entry = self.entries.get(id(obj))
+        if entry is not None and entry[0] is obj:
+            return entry[1:]
+        return None
+
+    def prune(self):
+        """Remove the entries of the objects only referenced by the table."""
+        getrefcount = getattr(sys, "getrefcount", None)
+        if getrefcount is None:
+            return
+        with self.lock:
+            # References: the entry, and the argument of getrefcount
+            for key in [k for k, e in self.entries.items()
+                        if getrefcount(e[0]) <= 2]:
+                del self.entries[key]
+
+
+documentation = DocRegistry()
+
+
+class DocInt(int):
+    """An integer that can hold a documentation string and a source."""
+
+
+class DocFloat(float):
+    """A float that can hold a documentation string and a source."""
+
+
+class DocComplex(complex):
+    """A complex number that can hold a documentation string and a source."""
+
+
+class DocStr(str):
+    """A string that can hold a documentation string and a source."""
+
+
+class DocBytes(bytes):
+    """A bytes object that can hold a documentation string and a source."""
+
+
+class DocTuple(tuple):
+    """A tuple that can hold a documentation string and a source."""
+
+
+class DocFrozenset(frozenset):
+    """A frozenset that can hold a documentation string and a source."""
+
+
+# Built-in types whose instances can be shared by unrelated names (small
+# integers, strings, and the constants of a code object), with the types
+# used to document them.  None and booleans cannot be documented.
+doc_types = {int: DocInt, float: DocFloat, complex: DocComplex, str: DocStr,
+             bytes: DocBytes, tuple: DocTuple, frozenset: DocFrozenset}
+
+
+def getdoc(obj, default=None):
+    """Return the documentation string of an object.
+
+    :param obj:      the object
+    :param default:  value returned if the object has no documentation
+    """
+    entry = documentation.get(obj)
+    if entry is not None:
+        return entry[0]
+    return getattr(obj, "__doc__", default)
+
+
+def getsource(obj, default=None):
+    """Return the source string of an object (see `getdoc`)."""
+    entry = documentation.get(obj)
+    if entry is not None:
+        return entry[1] or default
+    return getattr(obj, "__source__", default)
+
+
+def gettimestamp(obj, default=None):
+    """Return the time of last update of an object (see `getdoc`)."""
+    entry = documentation.get(obj)
+    if entry is not None:
+        return entry[2] or default
+    return getattr(obj, "__timestamp__", default)
+
+
+def make_object_w_doc(value, doc="", source="", timestamp=None):
     """Defines an object with a documentation string.
 
-    Works by creating a new class that inherits all attributes of the original
-    object. Needed for base objects that allow no attributes (for example
-    tuples).
+    Objects that allow no attributes (for example tuples or scalar values)
+    are documented as explained in `Doc`.  Kept to load the objects pickled by
+    previous versions, which used a class per object.
     """
-    c = type(value.__class__.__name__ + "_w_doc",
-             (value.__class__,),
-             {"__doc__": doc, "__source__": source,
-              "__reduce__": lambda s: (make_object_w_doc, (value, doc, source))})
-    return c(value)
+    return value & Doc(doc, source, timestamp)
 
 
 make_object_w_doc.__safe_for_unpickling__ = True
@@ -136,37 +321,52 @@ def extract_name(doc):
 
 
 def unit_parser(unit):
-    """General parser for units.
+    """General parser for units, using the current registry.
 
     :param str unit: the string to parse
     :return (Value, UnitTree): the full result of the parsing
 
-    The parse tries to parse first simple units, such as 'm/s^', then verbose
-    ones, such as 'meter per second squared'.
+    See `UnitRegistry.parse`.
     """
-    try:
-        unitlex.verbose = unityacc.verbose = False
-        res = unityacc.parse(unit, lexer=unitlex)
-    except UnitParseError:
-        try:
-            unitlex.verbose = unityacc.verbose = True
-            res = unityacc.parse(unit, lexer=unitlex)
-        finally:
-            unitlex.verbose = unityacc.verbose = False
-    return res
+    return get_registry().parse(unit)
+
+
+def parse_unit(unit):
+    """Parse a unit without using the cache: see `unit_parser`."""
+    return get_registry().parse_unit(unit)
+
+
+def parse_cache_info():
+    """Return the statistics of the parser cache of the current registry.
+
+    :return dict:  a dictionary with hits, misses, size, maxsize, and the
+                   current registry generation
+    """
+    return get_registry().parse_cache_info()
+
+
+def bump_generation():
+    """Signal a change in the current registry, invalidating the parser cache.
+
+    Must be called every time units or prefixes are added, removed, or
+    modified.
+    """
+    get_registry().bump_generation()
 
 
 class Doc(object):
     tdict = {}
 
-    def __init__(self, doc="", source=""):
+    def __init__(self, doc="", source="", timestamp=None):
         """A class o generate documentation strings.
 
-        :param str doc:  documentation string
-        :param source:   source string
+        :param str doc:        documentation string
+        :param source:         source string
+        :param str timestamp:  time of last update of the object
         """
         self.doc = doc
         self.source = source
+        self.timestamp = timestamp
 
     def __rand__(self, x):
         """Operator overload for Doc objects.
@@ -178,15 +378,30 @@ class Doc(object):
         :return Any:   x annotated
 
         If x is a basic type that cannot be extended with the __doc__ attribute,
-        this function returns a new copy of x generated with `make_object_w_doc`.
+        scalar values are copied into a DocScalarValue, and built-in numbers,
+        strings, and tuples into one of the `doc_types`; the documentation of
+        other objects is recorded in the `documentation` table (see `getdoc`).
+
+        :raises TypeError:  if x is None or a boolean, and doc is not empty
         """
+        if self.doc or self.source or self.timestamp:
+            if type(x) is ScalarValue:
+                x = DocScalarValue(x)
+            elif type(x) in doc_types:
+                x = doc_types[type(x)](x)
         try:
             if self.doc:
                 x.__doc__ = self.doc
             if self.source:
                 x.__source__ = self.source
+            if self.timestamp:
+                x.__timestamp__ = self.timestamp
         except AttributeError:
-            x = make_object_w_doc(x, self.doc, self.source)
+            if x is None or isinstance(x, bool):
+                if self.doc:
+                    raise TypeError("%r cannot hold a documentation string" % x)
+            else:
+                documentation.set(x, self.doc, self.source, self.timestamp)
         return x
 
 
@@ -206,6 +421,10 @@ class UnitTree(tuple):
     as
 
     (("kg", 1), ((("km", 1), ("s", -1)), 2))
+
+    The conversion to the unit represented by a tree is memoized in the
+    tree itself (see `converter`), so that values sharing the same display
+    unit are shown without evaluating the tree again.
     """
     def __new__(cls, obj=()):
         """Overrides constructor for immutable type.
@@ -215,6 +434,10 @@ class UnitTree(tuple):
         # noinspection PyArgumentList
         return super(UnitTree, cls).__new__(cls, obj)
 
+    def __reduce__(self):
+        # The memoized converter is not pickled
+        return UnitTree, (tuple(self),)
+
     @classmethod
     def simple(cls, name, exp=1):
         """Return a simple UnitTree with a single unit.
@@ -270,7 +493,6 @@ class UnitTree(tuple):
 
         :return Value:  value represented by the UnitTree
         """
-        global user_ns
         r = Value(1.0)
         for u, e in self:
             if e == 0:
@@ -279,12 +501,58 @@ class UnitTree(tuple):
                 r = r * u.to_value() ** e
             else:
                 if u[0] == '"':
-                    x = user_ns[u[1:-1]]
+                    x = get_registry().user_ns[u[1:-1]]
                 else:
                     x = unit_parser(u)[0]
                 r = r * x ** e
         return r
 
+    def variables(self):
+        """Return the names of the user variables used as units in the tree.
+
+        :return list(str):  names of the quoted units
+        """
+        names = []
+        for u, e in self:
+            if isinstance(u, UnitTree):
+                names.extend(u.variables())
+            elif u[0] in ("'", '"') and u[0] == u[-1]:
+                names.append(u[1:-1])
+        return names
+
+    def converter(self):
+        """Return the converter from base units to the unit of the tree.
+
+        The converter is memoized in the tree until the registry changes or
+        one of the quoted variables of the tree is rebound in the user
+        namespace.
+
+        :rtype Converter:
+        """
+        reg = get_registry()
+        memo = self.__dict__.get("memo")
+        if memo is not None and memo[0] is reg and memo[1] == reg.generation:
+            for k, v in memo[2]:
+                if reg.user_ns.get(k) is not v:
+                    break
+            else:
+                return memo[3]
+        generation = reg.generation
+        depends = tuple((k, reg.user_ns.get(k)) for k in self.variables())
+        c = Converter(None, self)
+        self.memo = (reg, generation, depends, c)
+        return c
+
+    def evaluate(self):
+        """Return the factor, the dimension, and the offset of the tree.
+
+        :return (float, Unit, float):  value, unit, and absolute attributes of
+                                       the Value represented by the tree (see
+                                       `to_value`), memoized as `converter`
+        """
+        c = self.converter()
+        return c.divisor, c.unit, c.dst_offset
+
     def remove_variable_units(self):
         """Remove double quoted units.
 
@@ -294,7 +562,7 @@ class UnitTree(tuple):
 
         :return UnitTree:  New UnitTree without units
         """
-        global user_ns
+        user_ns = get_registry().user_ns
         factor = 1
         new_unit = []
         for k, v in self:
@@ -317,7 +585,24 @@ class UnitTree(tuple):
                               "meters per second"
         :param bool singular: If true, do not use plurals in verbose mode
         :return str:          The converted UnitTree
+
+        Non verbose strings only depend on the tree, and are memoized.
         """
+        if verbose:
+            return self.render(latex, verbose, singular)
+        shown = self.__dict__.get("shown")
+        if shown is None:
+            shown = self.shown = {}
+        try:
+            return shown[latex]
+        except KeyError:
+            result = shown[latex] = self.render(latex)
+            return result
+
+    # noinspection PyShadowingNames
+    def render(self, latex=False, verbose=False, singular=False):
+        """Convert the UnitTree to a string without memoization: see `show`."""
+        reg = get_registry()
         unit = []
         negpow = None
         first = True
@@ -337,10 +622,10 @@ class UnitTree(tuple):
                     if u[0] == "'" == u[-1] or not verbose:
                         base = u
                     else:  # thus verbose and no quotes
-                        iu = isunit(u) or isunit(u, True)
-                        base = (extract_name(prefixes[iu[0]].__doc__) if iu[0] else "") + \
-                               (extract_name(units[iu[1]].__doc__) if iu[1] else "")
-                        space_like = iu[1] in space_units
+                        iu = reg.isunit(u) or reg.isunit(u, True)
+                        base = (extract_name(reg.prefixes[iu[0]].__doc__) if iu[0] else "") + \
+                               (extract_name(reg.units[iu[1]].__doc__) if iu[1] else "")
+                        space_like = iu[1] in reg.space_units
                         if first and not singular:   # First unit!
                             base = plural(base)
                 if base.find(' ') >= 0 or base.find('^') >= 0 or \
@@ -351,7 +636,7 @@ class UnitTree(tuple):
                 if len(u) > 1 or e != 1:
                     base = '(' + base + ')'
                 elif isinstance(u[0][0], basestring):
-                    space_like = isunit(u[0][0])[1] in space_units
+                    space_like = reg.isunit(u[0][0])[1] in reg.space_units
             # Ok, the base is not set; concentrate on the exponent
             first = False
             if almost_equal(e, 1):
@@ -412,78 +697,233 @@ class UnitTree(tuple):
                 return " ".join(unit)
 
 
-class Unit(np.ndarray):
+class Unit(tuple):
     """A unit representation.
 
-    Units are stored as simple vectors of real numbers, where each element is
-    the exponent of the corresponding base unit. For example, if the base
-    units are 'm', 's', 'kg', the unit
+    Units are stored as immutable tuples of exact exponents (integers or
+    fractions), where each element is the exponent of the corresponding base
+    unit.  For example, if the base units are 'm', 's', 'kg', the unit
+
+    (1, -2)
 
-    [1, -2, 0]
+    would represent an acceleration [m/s^2].  Trailing zero exponents are
+    never stored, so that the dimensionless unit is the empty tuple and units
+    stay valid when new base units are defined.
 
-    would represent an acceleration [m/s^2].
+    Units are interned: two equal units are always the same object, so that
+    they can be compared by identity and used as dictionary keys.
     """
+    __slots__ = ()
 
     def __new__(cls, *args, **kwargs):
         """Build a new unit following the arguments
 
-        :param Union(str, np.ndarray, List[float]) args:  Unit specification
+        :param Union(str, Unit, np.ndarray, List[float]) args:  Unit specification
         :param kwargs:  Unused
         :return Unit:   Newly created unit
         """
-        shape = len(baseunits)
-        obj = np.zeros(shape).view(cls)
         if len(args) == 0:
-            return obj
-        if len(args) == 1 and isinstance(args[0], basestring):
-            if not re.match(r"^[ \t]*$", args[0]):
-                tmp = unit_parser(args[0])[0]
-                if isinstance(tmp, tuple):
-                    obj += tmp[1].unit
-                else:
-                    obj += tmp.unit
-        elif len(args) == 1 and isinstance(args[0], np.ndarray):
-            np.copyto(obj, args[0])
+            return dimensionless
+        arg = args[0]
+        if len(args) == 1 and isinstance(arg, Unit):
+            return arg
+        if len(args) == 1 and isinstance(arg, basestring):
+            if re.match(r"^[ \t]*$", arg):
+                return dimensionless
+            tmp = unit_parser(arg)[0]
+            if isinstance(tmp, tuple):
+                return tmp[1].unit
+            else:
+                return tmp.unit
+        elif len(args) == 1 and isinstance(arg, (np.ndarray, list, tuple)):
+            exps = arg
         else:
-            tmp = np.array(*args)
-            np.copyto(obj, tmp)
-        return obj
+            exps = np.array(*args)
+        return intern_unit(tuple(exponent(e) for e in np.ravel(exps)))
 
-    # noinspection PyMethodMayBeStatic
-    def __array_finalize__(self, obj):
-        if obj is None:
-            return
+    # Make sure numpy defers to our (reflected) operators
+    __array_ufunc__ = None
+
+    def __reduce__(self):
+        return Unit, (tuple(self),)
+
+    def vector(self, n=None):
+        """Return the unit as a float vector of exponents.
+
+        :param int n:  length of the vector [number of base units]
+        :rtype np.ndarray:
+        """
+        v = np.zeros(len(get_registry().baseunits) if n is None else n)
+        v[:len(self)] = self
+        return v
 
     def show(self, *args, **kwargs):
+        baseunits = get_registry().baseunits
         lst = tuple((baseunits[n], e) for n, e in enumerate(self) if e != 0)
         return UnitTree(lst).show(*args, **kwargs)
 
-    def __bool__(self):
-        """Check if a unit is non zero, i.e. if it represents a non-pure number."""
-        return np.asscalar(np.any(self))
-
     def __eq__(self, obj):
-        return not bool(self - obj)
+        if self is obj:
+            return True
+        if isinstance(obj, (np.ndarray, list)) or type(obj) is tuple:
+            return Unit(obj) is self
+        return False if isinstance(obj, Unit) else NotImplemented
 
     def __ne__(self, obj):
-        return bool(self - obj)
+        if self is obj:
+            return False
+        result = self.__eq__(obj)
+        if result is NotImplemented:
+            return result
+        return not result
 
-    def __nonzero__(self):
-        """Python 2 compatibility method that calls __bool__."""
-        return self.__bool__()
+    __hash__ = tuple.__hash__
+
+    def __add__(self, u):
+        """Sum of units, i.e. product of quantities.
+
+        :param Unit u:  unit to add
+        """
+        if not isinstance(u, Unit):
+            u = Unit(u)
+        try:
+            return _unit_sums[id(self), id(u)]
+        except KeyError:
+            pass
+        if len(self) < len(u):
+            r = tuple(a + b for a, b in zip(tuple(self) + (0,) * (len(u) - len(self)), u))
+        else:
+            r = tuple(a + b for a, b in zip(self, tuple(u) + (0,) * (len(self) - len(u))))
+        r = intern_unit(r)
+        _unit_sums[id(self), id(u)] = r
+        return r
+
+    def __sub__(self, u):
+        """Difference of units, i.e. ratio of quantities.
+
+        :param Unit u:  unit to subtract
+        """
+        if not isinstance(u, Unit):
+            u = Unit(u)
+        try:
+            return _unit_differences[id(self), id(u)]
+        except KeyError:
+            pass
+        r = self + (-u)
+        _unit_differences[id(self), id(u)] = r
+        return r
+
+    def __neg__(self):
+        if not self:
+            return self
+        return intern_unit(tuple(-e for e in self))
+
+    def __mul__(self, f):
+        """Multiplication of a unit, i.e. exponentiation.
+
+        :param float f:  exponent, converted into an exact fraction
+        """
+        if not self:
+            return self
+        f = exponent(f)
+        if f == 1:
+            return self
+        if type(f) is int:
+            key = (id(self), f)
+        else:
+            key = (id(self), f.numerator, f.denominator)
+        try:
+            return _unit_products[key]
+        except KeyError:
+            result = _unit_products[key] = \
+                intern_unit(tuple(exponent(e * f) for e in self))
+            return result
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, f):
+        """Division of a unit, i.e. extraction of a root.
+
+        :param float f:  root degree, converted into an exact fraction
+        """
+        if not self:
+            return self
+        return self * (1 / Fraction(exponent(f)))
+
+    __div__ = __truediv__
 
     def __str__(self):
+        baseunits = get_registry().baseunits
         unit = []
         for n, e in enumerate(self):
-            if not almost_equal(e, 0):
+            if e != 0:
                 s = baseunits[n]
-                if not almost_equal(e, 1):
+                if e != 1:
                     s += "^%g" % e
                 unit.append(s)
         return "[" + " ".join(unit) + "]"
 
+    def __repr__(self):
+        return "Unit(%r)" % (tuple(self),)
+
 
-class Value(np.ndarray):
+def exponent(x):
+    """Convert a number into an exact unit exponent.
+
+    :param x:  number to convert (int, float, Fraction, or 0-d array)
+    :return Union[int, Fraction]:  the number as an int, if integer, or as a
+                                   fraction with a limited denominator
+    """
+    if type(x) is int:
+        return x
+    if type(x) is Fraction or isinstance(x, Fraction):
+        return x.numerator if x.denominator == 1 else x
+    if isinstance(x, int) and not isinstance(x, bool):
+        return x
+    x = float(getattr(x, "nominal_value", x))
+    if x.is_integer():
+        return int(x)
+    f = Fraction(x).limit_denominator(10000000)
+    return f.numerator if f.denominator == 1 else f
+
+
+def intern_unit(exps):
+    """Return the interned unit with the given tuple of exact exponents.
+
+    :param tuple exps:  exponents (trailing zeros are removed)
+    :rtype Unit:
+    """
+    n = len(exps)
+    while n > 0 and exps[n - 1] == 0:
+        n -= 1
+    if n < len(exps):
+        exps = exps[:n]
+    try:
+        return _units_interned[exps]
+    except KeyError:
+        # Make sure integral fractions are stored as ints (equal hash, though)
+        exps = tuple(e.numerator if isinstance(e, Fraction) and e.denominator == 1
+                     else e for e in exps)
+        u = tuple.__new__(Unit, exps)
+        _units_interned[exps] = u
+        return u
+
+
+_units_interned = {}
+_unit_sums = {}
+_unit_differences = {}
+_unit_products = {}
+dimensionless = tuple.__new__(Unit, ())
+_units_interned[()] = dimensionless
+
+
+class Quantity(object):
+    """Common base class of Value and ScalarValue."""
+    __slots__ = ()
+
+
+# Value uses ABCMeta so that ScalarValue can be registered as a virtual subclass
+class Value(ABCMeta("ValueBase", (np.ndarray, Quantity), {})):
 
     def __new__(cls, value, unit=None, **kw):
         """
@@ -493,8 +933,14 @@ class Value(np.ndarray):
         :param absolute:
         :param original:
         :return:
+
+        When called as `Value(...)` with a scalar value (anything that is not
+        an array, a list, or a tuple), a ScalarValue is returned instead.
         """
+        if cls is Value and not isinstance(value, _array_types):
+            return ScalarValue(value, unit, **kw)
         obj = np.asanyarray(value).view(cls)
+        array = obj.view(np.ndarray)
         # add the new attributes to the instance
         if unit is None:
             unit = getattr(value, "unit", Unit())
@@ -503,12 +949,12 @@ class Value(np.ndarray):
         showunit = kw.get("showunit", getattr(value, "showunit", None))
         showprefix = kw.get("showprefix", getattr(value, "showprefix", None))
         if not isinstance(unit, Unit):
-            if isinstance(unit, np.ndarray):
+            if isinstance(unit, (np.ndarray, list, tuple)):
                 unit = Unit(unit)
             elif isinstance(unit, basestring):
                 if not re.match(r"^[ \t]*$", unit):
                     value, tree = unit_parser(unit)
-                    obj *= value.view(np.ndarray)
+                    array *= value.value
                     unit = value.unit
                     absolute = kw.get("absolute", value.absolute)
                     if original:
@@ -519,12 +965,25 @@ class Value(np.ndarray):
         obj.showprefix = showprefix
         return obj
 
+    def __reduce__(self):
+        # The units and the other attributes are not part of the array state
+        reconstruct, args, state = super(Value, self).__reduce__()
+        return reconstruct, args, (state, self.__dict__)
+
+    def __setstate__(self, state):
+        if len(state) == 2 and isinstance(state[1], dict):
+            super(Value, self).__setstate__(state[0])
+            self.__dict__.update(state[1])
+        else:
+            super(Value, self).__setstate__(state)
+
     def __array_finalize__(self, obj):
         if obj is None:
             return
         self.unit = getattr(obj, 'unit', Unit())
         self.absolute = getattr(obj, 'absolute', False)
         self.showunit = getattr(obj, 'showunit', None)
+        self.showprefix = getattr(obj, 'showprefix', None)
 
     @property
     def value(self):
@@ -534,16 +993,58 @@ class Value(np.ndarray):
     def value(self, x):
         np.copyto(self, x)
 
-    def __array_prepare__(self, array, context=None):
-        # FIXME: Implement using context = [ufunc, *args, 0?]
-        # noinspection PyArgumentList
-        results = super(Value, self).__array_prepare__(array, context)
-        return results
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """Apply a numpy ufunc to values, propagating the units.
+
+        The units of the arguments are checked once, according to the rule
+        of the ufunc in `ufunc_rules`, and the ufunc is then applied to the
+        plain arrays.  All ufunc methods (reduce, accumulate, outer, at...)
+        and the `out` and `where` arguments are supported.  Absolute values
+        are treated as relative ones.
+        """
+        if method == "at":
+            operands = inputs[:1] + inputs[2:]
+        elif method == "reduceat":
+            operands = inputs[:1]
+        else:
+            operands = inputs
+        out = kwargs.get("out", ())
+        result_units = ufunc_units(ufunc, method, operands, kwargs)
+        is_array = False
+        for x in inputs + out:
+            if isinstance(x, Quantity) and isinstance(x, np.ndarray):
+                is_array = True
+                break
+        inputs = tuple(x.view(np.ndarray) if isinstance(x, np.ndarray) else x.value
+                       if isinstance(x, Quantity) else x for x in inputs)
+        if out:
+            for o, u in zip(out, result_units):
+                if u is not None and bool(u) and not isinstance(o, Quantity):
+                    raise UnitCompatibilityError(u, dimensionless, ufunc.__name__)
+            kwargs["out"] = tuple(o.view(np.ndarray) if isinstance(o, Quantity) else o
+                                  for o in out)
+        results = getattr(ufunc, method)(*inputs, **kwargs)
+        if method == "at":
+            return None
+        if not isinstance(results, tuple):
+            results = (results,)
+        outputs = []
+        for n, (r, u) in enumerate(zip(results, result_units)):
+            if out and out[n] is not None:
+                r = out[n]
+                if isinstance(r, Quantity):
+                    r.unit = u if u is not None else dimensionless
+                    r.absolute = False
+                    r.showunit = None
+            elif u is not None:
+                r = Value(np.asarray(r) if is_array else r, u)
+            outputs.append(r)
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
 
     def check_units(self, y, where=None):
         global tolerant
         u0 = self.unit
-        if isinstance(y, Value):
+        if isinstance(y, Quantity):
             u1 = y.unit
             if u0 != u1 and (not tolerant or (np.any(self.value != 0) and
                                               np.any(y.value != 0))):
@@ -571,187 +1072,98 @@ class Value(np.ndarray):
                                when displaying the value
         :rtype Value:          New value with the `showunit` and `showprefix` set
         """
-        # We could also use functools.lru_cache instead of cachedat, but it would be
-        # probably not as efficient in our situation; also requires python > 3.5
-        global cachedat, sortunits, formats, user_ns
-        nunits = 0   # num. of units in us
-        nvalues = 0  # num. of value'd units in us
+        formats = get_registry().formats
         s = Value(self)
         s.showprefix = []
         # If us is just a single format, use it and return
         if len(us) == 1 and us[0] in formats:
             s.showunit = formats[us[0]]
             return s
-        # Filter all non-units parts of us, leaving only real units
-        oldus = us
-        us = []
-        for u in oldus:
-            if u[-1] == "*":
-                if u == "*":
-                    s.showprefix.extend(prefixes.keys())
-                else:
-                    if u[0:-1] not in prefixes:
-                        raise UnitParseError(u, "unknown prefix")
-                    s.showprefix.append(u[0:-1])
-            elif u == ".":
-                s.showprefix.append("")
-            elif u[0] in ("'", '"') and u[0] == u[-1]:
-                us.append(u)
-                nvalues += 1
-            else:
-                if u[0] == "*":
-                    s.showprefix.extend(prefixes.keys())
-                    u = u[1:]
-                iu = isunit(u)
-                if iu and iu[1] == "":
-                    s.showprefix.append(u)
-                else:
-                    nunits += 1
-                    us.append(u)
-        # Now us contains units or values and no naked prefixes
-        us = tuple(us)
-        oldus = us
+        cs = compile_system(us)
+        s.showprefix.extend(cs.showprefix)
+        if cs.inverse is not None:
+            s.showunit = cs.showunit(s.unit)
+            return s
+        us, vs = cs.trees, cs.values
         try:
-            m, newus, newvs = cachedat[us]
-        except KeyError:
-            # Split units and values
-            us = []  # list of units, as UnitTree's
-            vs = []  # list of values, w/o quotes
-            for u in oldus:
-                if u[0] in ("'", '"') and u[0] == u[-1]:
-                    us.append(UnitTree.simple(u))
-                    vs.append(user_ns[u[1:-1]])
-                else:
-                    up = unit_parser(u)
-                    us.append(up[1])
-                    vs.append(up[0])
+            if len(us) == 1 and not bool(self.unit) and \
+                    not bool(vs[0].unit):
+                s.showunit = us[0]
+                return s
+        except ValueError:
+            pass
+        # Check if we are requested a particular unit in a natural system
+        if cs.nunits == 1 and cs.nvalues > 0 and not isinstance(us[0], basestring):
+            tmp = Value(1.0, cs.names[0].replace('"', "'")).set_units([cs.names[0]])
+            out = (self / tmp).set_units(cs.names[1:])
+            out.showunit += tmp.showunit
+            out.unit += tmp.unit
+            out.value *= tmp.value
+            return out
+        # Deal with a pure number in the other cases: no transformation is done
+        if not bool(self.unit):
+            s.showunit = None
+            return s
+        # General simple case
+        index = cs.dimension_index()
+        res = None
+        for l in range(len(us)):
+            g = s.find_compatible(index, level=l + 1)
             try:
-                if len(us) == 1 and not bool(self.unit) and \
-                        not bool(vs[0].unit):
-                    s.showunit = us[0]
-                    return s
-            except ValueError:
+                res = next(g)
+                break
+            except StopIteration:
                 pass
-            maxrank = False
-            if len(us) == 0:
-                maxrank = True
-            elif len(us) <= len(baseunits):
-                m = np.array([v.unit for v in vs])
-                if abs(np.linalg.det(np.dot(m, m.T))) > 1e-7:
-                    maxrank = True
-            if maxrank:
-                newus = us
-                newvs = vs
-                us = [UnitTree.simple(u) for u in baseunits]
-                vs = [units[baseunits[n]] for n, _ in enumerate(baseunits)]
-                n = 0
-                while len(newus) < len(baseunits):
-                    m = np.array([v.unit for v in newvs + [vs[n]]])
-                    if abs(np.linalg.det(np.dot(m, m.T))) > 1e-7:
-                        newus.append(us[n])
-                        newvs.append(vs[n])
-                    n += 1
-                m = np.array([v.unit for v in newvs])
-                cachedat[tuple(oldus)] = (m, newus, newvs)
+        if res:
+            if sortunits:
+                s.showunit = UnitTree(sorted(res, key=lambda x: x[1] < 0))
             else:
-                # Check if we are requested a particular unit in a natural system
-                # This does not get to the cache, so we always get here!
-                if nunits == 1 and nvalues > 0 and not isinstance(us[0], basestring):
-                    tmp = Value(1.0, oldus[0].replace('"', "'")).set_units([oldus[0]])
-                    out = (self / tmp).set_units(oldus[1:])
-                    out.showunit += tmp.showunit
-                    out.unit += tmp.unit
-                    out.value *= tmp.value
-                    return out
-                # Deal with a pure number in the other cases: no transformation is done
-                if not bool(self.unit):
-                    s.showunit = None
-                    return s
-                # General simple case
-                newuvs = zip(us, vs)
-                uvs = ODict(newuvs)
-                res = None
-                for l in range(len(uvs)):
-                    g = s.find_compatible(uvs, level=l + 1)
-                    try:
-                        res = next(g)
-                        break
-                    except StopIteration:
-                        pass
-                if res:
-                    if sortunits:
-                        s.showunit = UnitTree(sorted(res, key=lambda x: x[1] < 0))
-                    else:
-                        s.showunit = res
-                else:
-                    s.showunit = None
-                # FIXME: remove_variable_units now has a different interface!
-                # return s.remove_variable_units()
-                return s
-        r = zip(newus, np.linalg.solve(m.T, np.array(s.unit)))
-        if sortunits:
-            r = sorted(r, key=lambda x: x[1] < 0)
-        s.showunit = sum((u*e for u, e in r if e != 0), UnitTree())
+                s.showunit = res
+        else:
+            s.showunit = None
         # FIXME: remove_variable_units now has a different interface!
         # return s.remove_variable_units()
         return s
 
     def find_compatible(self, d=None, level=1):
-        # Fixme: goes to Unit
-        import itertools
-        if d is None:
-            d = units
+        """Find the names in a dictionary compatible with the value.
+
+        :param d:          dictionary of quantities (by default, all units), or
+                           a DimensionIndex built from it
+        :param int level:  number of simple units to combine; 0 searches for
+                           aliases (same unit) and a negative level for products
+                           and ratios without exponents
+        :return:           generator of names (level 0) or of UnitTree's,
+                           ordered by complexity
+        """
+        if not isinstance(d, DimensionIndex):
+            d = dimension_index(d)
         if level == 0:
-            for k, v in d.items():
-                if isinstance(v, Value) and v.unit == self.unit:
-                    yield k
+            for k in d.aliases(self.unit):
+                yield k
         else:
-            ks = d.keys()
-            u0 = np.array(self.unit)
-            for c in itertools.combinations(ks, abs(level)):
-                js = []
-                mat = np.zeros(shape=(len(baseunits), abs(level)))
-                residuals = 1.0
-                for l, cu in enumerate(c):
-                    if isinstance(d[cu], tuple):
-                        u = d[cu][0].unit
-                    else:
-                        u = d[cu].unit
-                    js.append(cu)
-                    mat[:, l] = np.array(u)
-                try:
-                    if level > 0:
-                        x, residuals, rank, sv = np.linalg.lstsq(mat, u0)
-                    else:
-                        x = np.ones(abs(level), 1)
-                except ValueError:
-                    continue
-                if np.sum(residuals) < 1e-7 and min(map(abs, x)) > 1e-5:
-                    yield sum((u * e for u, e in zip(js, x) if e != 0), UnitTree())
+            for r in d.search(self.unit, level):
+                yield r
 
-    # noinspection PyShadowingNames
-    def show(self, latex=False, verbose=False):
-        global defaultsystem
-        tilde = ""
-        mytilde = r"\sim\!" if latex else "~"
+    def shown(self):
+        """Return the number and the unit used to show the value.
+
+        :return tuple:  the number, the unit (a UnitTree or a Unit), and a
+                        flag set if the value is shown as an absolute one
+                        (with a ~); None if the value is shown by a format
+        """
+        reg = get_registry()
+        absolute = False
         if self.showunit is not None:
             if callable(self.showunit):
-                return self.showunit(self, latex=latex, verbose=verbose)
-            if self.absolute is not False:
-                u0 = self.showunit.to_value()
-                if u0.absolute is not False:
-                    value = (self.value + self.absolute) / u0.value - u0.absolute
-                else:
-                    value = self.value / u0.value
-            else:
-                u0 = self.showunit.to_value()
-                if u0.absolute is not False:
-                    tilde = mytilde
-                    u0.absolute = False
-                value = self.value / u0.value
+                return None
+            c = converter(None, self.showunit)
+            if self.absolute is False and c.absolute:
+                absolute = True
+            value = c(self)
             unit = self.showunit
-        elif defaultsystem and self.unit:
-            return Value(self).set_units(defaultsystem.args).show(latex=latex, verbose=verbose)
+        elif reg.defaultsystem and self.unit:
+            return Value(self).set_units(reg.defaultsystem.args).shown()
         else:
             value = self.value
             unit = self.unit
@@ -763,12 +1175,13 @@ class Value(np.ndarray):
                     myunit = u
                     myexp = e
                     break
+            prefixes = reg.prefixes
             if myunit is not None:
-                fprefix = isunit(myunit)[0]
+                fprefix = reg.isunit(myunit)[0]
                 if fprefix:
                     value = value * prefixes[fprefix] ** myexp
             else:
-                myunit = "" if prefixonly else "*"
+                myunit = "" if reg.prefixonly else "*"
                 myexp = 1
                 fprefix = ""
                 unit = UnitTree.simple(myunit)
@@ -776,17 +1189,32 @@ class Value(np.ndarray):
             dexes = [(k, avalue / prefixes[k] ** myexp)
                      for k in self.showprefix
                      if prefixes[k] ** myexp <= avalue and
-                     (myunit != "" or k not in units)]
+                     (myunit != "" or k not in reg.units)]
             if not dexes:
                 dexes = [(k, -avalue / prefixes[k] ** myexp)
                          for k in self.showprefix
-                         if myunit != "" or k not in units]
+                         if myunit != "" or k not in reg.units]
             dex, best = min(dexes, key=lambda x: x[1])
             if dex:
                 value = value / prefixes[dex] ** myexp
             unit = UnitTree(((k, v) if k != myunit else
                              (dex + myunit[len(fprefix):], v)
                              for k, v in unit))
+        return value, unit, absolute
+
+    # noinspection PyShadowingNames
+    def show(self, latex=False, verbose=False):
+        if self.showunit is not None and callable(self.showunit):
+            # Formats defined by scripts need not accept verbose
+            if verbose:
+                return self.showunit(self, latex=latex, verbose=verbose)
+            return self.showunit(self, latex=latex)
+        reg = get_registry()
+        if self.showunit is None and reg.defaultsystem and self.unit:
+            return Value(self).set_units(reg.defaultsystem.args).show(latex=latex,
+                                                                      verbose=verbose)
+        value, unit, absolute = self.shown()
+        tilde = (r"\sim\!" if latex else "~") if absolute else ""
         u = unit.show(latex=latex, verbose=verbose)
         if u:
             u = "[" + u + "]"
@@ -833,7 +1261,7 @@ class Value(np.ndarray):
     # Standard binary operators
 
     def __add__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         unit = self.check_units(y)
         if self.absolute is not False and y.absolute is not False:
@@ -842,7 +1270,7 @@ class Value(np.ndarray):
                      absolute=self.absolute or y.absolute)
 
     def __sub__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         unit = self.check_units(y)
         offset = (self.absolute or 0.0) - (y.absolute or 0.0)
@@ -855,7 +1283,7 @@ class Value(np.ndarray):
             return Value(self.value - y.value + offset, unit)
 
     def __mul__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         absolute = False
         if self.absolute is not None and not bool(y.unit):
@@ -865,7 +1293,7 @@ class Value(np.ndarray):
         return Value(self.value * y.value, self.unit + y.unit, absolute=absolute)
 
     def __div__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         absolute = False
         if self.absolute is not None and not bool(y.unit):
@@ -873,17 +1301,17 @@ class Value(np.ndarray):
         return Value(self.value / y.value, self.unit - y.unit, absolute=absolute)
 
     def __truediv__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(self.value / y.value, self.unit - y.unit)
 
     def __floordiv__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(self.value // y.value, self.unit - y.unit)
 
     def __divmod__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         unit = self.unit - y.unit
         if hasattr(np, "divmod"):
@@ -895,9 +1323,11 @@ class Value(np.ndarray):
         return Value(d, unit), Value(m, unit)
 
     def __pow__(self, y, modulo=None):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         yvalue = y.check_pure()
+        if np.ndim(yvalue) > 0:
+            return np.power(self, yvalue)
         if y == 1:
             return self
         return Value(np.power(self.value, yvalue, modulo), self.unit * yvalue)
@@ -914,7 +1344,7 @@ class Value(np.ndarray):
     def __or__(self, y):
         if isinstance(y, System):
             return y.__ror__(self)
-        elif not isinstance(y, Value):
+        elif not isinstance(y, Quantity):
             y = Value(y)
         return self.value | y.value
 
@@ -924,37 +1354,37 @@ class Value(np.ndarray):
     # Comparison operators
 
     def __lt__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value < y.value
 
     def __le__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value <= y.value
 
     def __gt__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value > y.value
 
     def __ge__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value >= y.value
 
     def __eq__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value == y.value
 
     def __ne__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         self.check_units(y)
         return self.value != y.value
@@ -971,7 +1401,7 @@ class Value(np.ndarray):
     __radd__ = __add__
 
     def __rsub__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         unit = self.check_units(y)
         offset = (y.absolute or 0.0) - (self.absolute or 0.0)
@@ -986,24 +1416,24 @@ class Value(np.ndarray):
     __rmul__ = __mul__
 
     def __rdiv__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(y.value / self.value, y.unit - self.unit)
 
     __rtruediv__ = __rdiv__
 
     def __rfloordiv__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(y.value // self.value, y.unit - self.unit)
 
     def __rmod__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(y.value % self.value, y.unit - self.unit)
 
     def __rdivmod__(self, y):
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         unit = y.unit - self.unit
         if hasattr(np, "divmod"):
@@ -1016,7 +1446,7 @@ class Value(np.ndarray):
 
     def __rpow__(self, y, **kwargs):
         value = self.check_pure()
-        if not isinstance(y, Value):
+        if not isinstance(y, Quantity):
             y = Value(y)
         return Value(np.power(y.value, value), y.unit * value)
 
@@ -1080,9 +1510,242 @@ class Value(np.ndarray):
         return hex(np.asscalar(self.check_pure()))
 
 
+class ScalarValue(Quantity):
+    """A scalar quantity with units.
+
+    This is a lightweight version of Value for scalar quantities: instead of
+    being an array, it stores the numerical value (a Python number, a numpy
+    scalar, an mpf, a ufloat...) in a slot.  Instances are created
+    automatically by Value when its argument is a scalar, and are registered
+    as a virtual subclass of Value, so that isinstance(x, Value) is true for
+    them; all operators are shared with Value.
+    """
+    __slots__ = ("value", "unit", "absolute", "showunit", "showprefix")
+
+    def __init__(self, value, unit=None, **kw):
+        """Build a new scalar value: see Value for the arguments."""
+        if isinstance(value, _number_types):
+            if unit is None:
+                unit = dimensionless
+            absolute = kw.get("absolute", False)
+            showunit = kw.get("showunit", None)
+            showprefix = kw.get("showprefix", None)
+        else:
+            if unit is None:
+                unit = getattr(value, "unit", dimensionless)
+            absolute = kw.get("absolute", getattr(value, "absolute", False))
+            showunit = kw.get("showunit", getattr(value, "showunit", None))
+            showprefix = kw.get("showprefix", getattr(value, "showprefix", None))
+            if isinstance(value, ScalarValue):
+                value = value.value
+        if unit.__class__ is not Unit:
+            if isinstance(unit, (np.ndarray, list, tuple)):
+                unit = Unit(unit)
+            elif isinstance(unit, basestring):
+                if not re.match(r"^[ \t]*$", unit):
+                    v, tree = unit_parser(unit)
+                    value = value * v.value
+                    unit = v.unit
+                    absolute = kw.get("absolute", v.absolute)
+                    if kw.get("original", False):
+                        showunit = tree
+                else:
+                    unit = dimensionless
+        self.value = value
+        self.unit = unit
+        self.absolute = absolute
+        self.showunit = showunit
+        self.showprefix = showprefix
+
+    def __getstate__(self):
+        return self.value, self.unit, self.absolute, self.showunit, self.showprefix
+
+    def __setstate__(self, state):
+        self.value, self.unit, self.absolute, self.showunit, self.showprefix = state
+
+    def __reduce__(self):
+        return type(self), (self.value, self.unit), self.__getstate__()
+
+    def __copy__(self):
+        result = object.__new__(type(self))
+        result.value = self.value
+        result.unit = self.unit
+        result.absolute = self.absolute
+        result.showunit = self.showunit
+        result.showprefix = self.showprefix
+        return result
+
+    def __pow__(self, y, modulo=None):
+        if not isinstance(y, Quantity):
+            y = Value(y)
+        yvalue = y.check_pure()
+        if np.ndim(yvalue) > 0:
+            # An array of exponents (possibly with uncertainties)
+            if self.unit:
+                raise UnitError("The exponent of a value with units must be a "
+                                "scalar in __pow__")
+            return Value(self.value ** yvalue)
+        if yvalue == 1:
+            return self
+        if modulo is None:
+            return ScalarValue(self.value ** yvalue, self.unit * yvalue)
+        return ScalarValue(pow(self.value, yvalue, modulo), self.unit * yvalue)
+
+    def __rpow__(self, y, **kwargs):
+        value = self.check_pure()
+        if not isinstance(y, Quantity):
+            y = Value(y)
+        return Value(y.value ** value, y.unit * value)
+
+    def __complex__(self):
+        return complex(self.check_pure())
+
+    def __oct__(self):
+        return oct(self.check_pure())
+
+    def __hex__(self):
+        return hex(self.check_pure())
+
+
+# All other methods are shared with Value
+for _name in ("__array_ufunc__", "check_units", "check_pure", "set_units",
+              "find_compatible", "shown", "show",
+              "__repr__", "__str__", "_repr_pretty_", "_repr_latex_", "__coerce__",
+              "__add__", "__sub__", "__mul__", "__div__", "__truediv__",
+              "__floordiv__", "__divmod__", "__round__", "__and__", "__or__",
+              "__xor__", "__lt__", "__le__", "__gt__", "__ge__", "__eq__", "__ne__",
+              "__bool__", "__nonzero__", "__radd__", "__rsub__", "__rmul__",
+              "__rdiv__", "__rtruediv__", "__rfloordiv__", "__rmod__",
+              "__rdivmod__", "__rand__", "__ror__", "__rxor__", "__pos__",
+              "__neg__", "__abs__", "__invert__", "__int__", "__long__",
+              "__index__", "__trunc__", "__float__", "_mpmath_"):
+    setattr(ScalarValue, _name, Value.__dict__[_name])
+ScalarValue.__hash__ = None
+Value.register(ScalarValue)
+
+
+# Unit rules for numpy ufuncs, used by Value.__array_ufunc__:
+#   same           the arguments must have the same unit, which is the result unit
+#   compare        the arguments must have the same unit; the result is a pure number
+#   passthrough    the result has the unit of the first argument
+#   test           the result is a pure number, whatever the unit of the argument
+#   multiply       the result unit is the sum of the argument units
+#   divide         the result unit is the difference of the argument units
+#   power          the exponent must be a pure number, and multiplies the unit
+#   divmod         as compare for the quotient and as same for the remainder
+#   exponent       the unit of the argument is multiplied by ufunc_exponents
+# All other ufuncs only accept pure numbers.
+ufunc_rules = {}
+for _rule, _names in [("same", "add subtract maximum minimum fmax fmin clip hypot "
+                               "remainder mod fmod nextafter"),
+                      ("compare", "less less_equal greater greater_equal equal "
+                                  "not_equal arctan2"),
+                      ("passthrough", "negative positive absolute fabs conjugate "
+                                      "rint floor ceil trunc spacing copysign ldexp modf"),
+                      ("test", "isnan isinf isfinite isnat signbit sign"),
+                      ("multiply", "multiply matmul"),
+                      ("divide", "divide true_divide floor_divide"),
+                      ("power", "power float_power"),
+                      ("divmod", "divmod"),
+                      ("exponent", "sqrt square cbrt reciprocal")]:
+    for _name in _names.split():
+        ufunc_rules[_name] = _rule
+ufunc_exponents = {"sqrt": Fraction(1, 2), "square": 2, "cbrt": Fraction(1, 3),
+                   "reciprocal": -1}
+
+
+def ufunc_units(ufunc, method, operands, kwargs):
+    """Check the units of the operands of a ufunc and compute the result units.
+
+    :param np.ufunc ufunc:  the ufunc
+    :param str method:      the ufunc method ("__call__", "reduce", ...)
+    :param tuple operands:  the arguments of the ufunc, excluding indices
+    :param dict kwargs:     the keyword arguments of the ufunc
+    :return list:           the unit of each output, None for pure numbers
+    """
+    global tolerant
+    rule = ufunc_rules.get(ufunc.__name__, "dimensionless")
+    where = ufunc.__name__ if method == "__call__" else \
+        "%s.%s" % (ufunc.__name__, method)
+    units = [x.unit if isinstance(x, Quantity) else dimensionless for x in operands]
+    if method in ("reduce", "accumulate", "reduceat"):
+        if rule in ("same", "passthrough") or (rule == "multiply" and not units[0]):
+            return [units[0]]
+        if rule == "multiply" and method == "reduce" and \
+                kwargs.get("where", True) is True:
+            shape = np.shape(getattr(operands[0], "value", operands[0]))
+            axis = kwargs.get("axis", 0)
+            if axis is None:
+                axis = range(len(shape))
+            elif not isinstance(axis, tuple):
+                axis = (axis,)
+            return [units[0] * int(np.prod([shape[a] for a in axis]))]
+        if units[0]:
+            raise UnitCompatibilityError(units[0], dimensionless, where)
+        return [None]
+    if rule in ("same", "compare", "divmod"):
+        unit, ref = units[0], operands[0]
+        for u, x in zip(units[1:], operands[1:]):
+            if u != unit:
+                if tolerant and not np.any(getattr(ref, "value", ref) != 0):
+                    unit, ref = u, x
+                elif not tolerant or np.any(getattr(x, "value", x) != 0):
+                    raise UnitCompatibilityError(unit, u, where)
+        if rule == "same":
+            return [unit]
+        elif rule == "compare":
+            return [None]
+        else:
+            return [None, unit]
+    elif rule == "passthrough":
+        return [units[0]] * ufunc.nout
+    elif rule == "test":
+        return [None] * ufunc.nout
+    elif rule == "multiply":
+        return [units[0] + units[1]]
+    elif rule == "divide":
+        return [units[0] - units[1]]
+    elif rule == "power":
+        if units[1]:
+            raise UnitCompatibilityError(units[1], dimensionless, where)
+        if not units[0]:
+            return [units[0]]
+        e = np.unique(getattr(operands[1], "value", operands[1]))
+        if len(e) != 1:
+            raise UnitError("Exponents of a value with units must all be equal in %s"
+                            % where)
+        return [units[0] * exponent(e[0])]
+    elif rule == "exponent":
+        return [units[0] * ufunc_exponents[ufunc.__name__]]
+    for u in units:
+        if u:
+            raise UnitCompatibilityError(u, dimensionless, where)
+    return [None] * ufunc.nout
+
+
+class DocScalarValue(ScalarValue):
+    """A scalar value that can hold a documentation string and a source."""
+
+    def __getstate__(self):
+        return ScalarValue.__getstate__(self), self.__dict__
+
+    def __setstate__(self, state):
+        ScalarValue.__setstate__(self, state[0])
+        self.__dict__.update(state[1])
+
+    def __copy__(self):
+        result = object.__new__(type(self))
+        result.__setstate__(self.__getstate__())
+        return result
+
+
+_array_types = (np.ndarray, list, tuple)
+_number_types = (float, int, complex, np.number)
+
+
 class System(object):
     def __init__(self, *args):
-        global systems
+        systems = get_registry().systems
         self.args = []
         self.repr = []
         self.doc = ""
@@ -1126,7 +1789,7 @@ class System(object):
             result = expr.__class__(x | self for x in expr)
         elif isinstance(expr, dict):
             result = expr.__class__([(k, v | self) for k, v in expr.items()])
-        elif isinstance(expr, Value):
+        elif isinstance(expr, Quantity):
             result = expr.set_units(self.args)
         else:
             result = Value(expr).set_units(self.args)
@@ -1149,6 +1812,450 @@ class System(object):
                             % y.__class__.__name__)
 
 
+class CompiledSystem(object):
+    """A tuple of display units compiled for repeated conversions.
+
+    The arguments of a System are analysed once: naked prefixes are moved
+    to `showprefix`, units are parsed, and quoted (natural) units are
+    resolved in the user namespace.  If the units are independent, they
+    are completed with base units to form a basis, and the inverse of the
+    basis matrix is stored: the exponents of a unit in the system are then
+    obtained with a single matrix-vector product, and the resulting
+    UnitTree's are memoized by unit.
+
+    A compiled system remains valid until the unit registry changes (see
+    bump_generation) or one of the quoted values is rebound in the user
+    namespace.
+    """
+    def __init__(self, us):
+        reg = get_registry()
+        prefixes, baseunits = reg.prefixes, reg.baseunits
+        self.args = us
+        self.generation = reg.generation
+        self.showprefix = []
+        self.depends = {}
+        self.nunits = 0   # num. of units in us
+        self.nvalues = 0  # num. of value'd units in us
+        self.inverse = None
+        self.index = None
+        self.memo = {}
+        # Filter all non-units parts of us, leaving only real units
+        names = []
+        for u in us:
+            if u[-1] == "*":
+                if u == "*":
+                    self.showprefix.extend(prefixes.keys())
+                else:
+                    if u[0:-1] not in prefixes:
+                        raise UnitParseError(u, "unknown prefix")
+                    self.showprefix.append(u[0:-1])
+            elif u == ".":
+                self.showprefix.append("")
+            elif u[0] in ("'", '"') and u[0] == u[-1]:
+                names.append(u)
+                self.nvalues += 1
+            else:
+                if u[0] == "*":
+                    self.showprefix.extend(prefixes.keys())
+                    u = u[1:]
+                iu = reg.isunit(u)
+                if iu and iu[1] == "":
+                    self.showprefix.append(u)
+                else:
+                    self.nunits += 1
+                    names.append(u)
+        self.names = tuple(names)
+        # Split units (as UnitTree's) and values
+        self.trees = []
+        self.values = []
+        for u in names:
+            if u[0] in ("'", '"') and u[0] == u[-1]:
+                v = reg.user_ns[u[1:-1]]
+                self.depends[u[1:-1]] = v
+                self.trees.append(UnitTree.simple(u))
+                self.values.append(v)
+            else:
+                if "'" in u or '"' in u:
+                    # Depends on the user namespace in ways we do not track
+                    self.depends = None
+                up = unit_parser(u)
+                self.trees.append(up[1])
+                self.values.append(up[0])
+        if len(self.trees) > len(baseunits):
+            return
+        if self.trees:
+            m = np.array([v.unit.vector() for v in self.values])
+            if abs(np.linalg.det(np.dot(m, m.T))) <= 1e-7:
+                return
+        # Complete the basis with base units
+        newus = list(self.trees)
+        newvs = list(self.values)
+        n = 0
+        while len(newus) < len(baseunits):
+            m = np.array([v.unit.vector() for v in newvs + [reg.units[baseunits[n]]]])
+            if abs(np.linalg.det(np.dot(m, m.T))) > 1e-7:
+                newus.append(UnitTree.simple(baseunits[n]))
+                newvs.append(reg.units[baseunits[n]])
+            n += 1
+        self.basis = newus
+        self.inverse = np.linalg.inv(np.array([v.unit.vector() for v in newvs]).T)
+
+    def dimension_index(self):
+        """Return the DimensionIndex of the units of the system.
+
+        :rtype DimensionIndex:
+        """
+        if self.index is None:
+            self.index = DimensionIndex(ODict(zip(self.trees, self.values)))
+        return self.index
+
+    def valid(self, reg=None):
+        """Check if the compiled system is still up to date.
+
+        :param UnitRegistry reg:  the registry [current registry]
+        :rtype bool:
+        """
+        if reg is None:
+            reg = get_registry()
+        if self.depends is None or self.generation != reg.generation:
+            return False
+        for k, v in self.depends.items():
+            if reg.user_ns.get(k) is not v:
+                return False
+        return True
+
+    def exponents(self, unit):
+        """Return the exponents of a unit (or of a matrix of unit vectors) in the basis.
+
+        :param unit:       a Unit, or a 2D array with one unit vector per column
+        :rtype np.ndarray:
+        """
+        if isinstance(unit, Unit):
+            unit = unit.vector()
+        return np.dot(self.inverse, unit)
+
+    def showunit(self, unit):
+        """Return the UnitTree used to display a given unit in the system.
+
+        :param Unit unit:  the unit to convert
+        :rtype UnitTree:
+        """
+        global sortunits
+        key = (unit, sortunits)
+        try:
+            return self.memo[key]
+        except KeyError:
+            pass
+        r = zip(self.basis, map(exponent, self.exponents(unit)))
+        if sortunits:
+            r = sorted(r, key=lambda x: x[1] < 0)
+        result = sum((u*e for u, e in r if e != 0), UnitTree())
+        self.memo[key] = result
+        return result
+
+
+class DimensionIndex(object):
+    """Index of a dictionary of quantities by dimension.
+
+    Names are grouped by unit, for alias searches, and by direction, i.e.
+    by the primitive integer vector parallel to their dimension vector.
+    Each name is then stored with its scale along the direction, so that
+    all names compatible with a unit up to an exponent are found with a
+    single lookup.
+
+    Combinations of several names are searched on directions rather than
+    on names, with a depth-first search that keeps an orthonormal basis of
+    the directions selected so far: branches with dependent directions or
+    that already span the target are pruned, and the last direction is
+    selected for all candidates at once, as the ones whose component
+    orthogonal to the current basis is parallel to the residual.
+    """
+    eps = 1e-7
+
+    def __init__(self, d):
+        self.units = {}
+        self.directions = ODict()
+        for k, v in d.items():
+            if isinstance(v, tuple):
+                v = v[0]
+            if not isinstance(v, Quantity):
+                continue
+            self.units.setdefault(v.unit, []).append(k)
+            direction, scale = self.direction(v.unit)
+            if direction is not None:
+                self.directions.setdefault(direction, []).append((k, scale))
+        self.keys = list(self.directions.keys())
+        n = max([len(u) for u in self.keys] + [len(get_registry().baseunits)])
+        self.matrix = np.array([u + (0,) * (n - len(u)) for u in self.keys],
+                               dtype=float).reshape(len(self.keys), n)
+
+    @staticmethod
+    def direction(unit):
+        """Split a unit into a primitive integer direction and a scale.
+
+        :param Unit unit:  the unit to split
+        :return:           a tuple (direction, scale) such that unit is
+                           scale * direction, or (None, 0) for pure numbers
+        """
+        exps = [Fraction(e) for e in unit]
+        if not any(exps):
+            return None, 0
+        den = 1
+        for e in exps:
+            den = den * e.denominator // gcd(den, e.denominator)
+        ints = [int(e * den) for e in exps]
+        num = 0
+        for i in ints:
+            num = gcd(num, abs(i))
+        if [i for i in ints if i != 0][0] < 0:
+            num = -num
+        return tuple(i // num for i in ints), Fraction(num, den)
+
+    def aliases(self, unit):
+        """Return all names with exactly the given unit.
+
+        :param Unit unit:  the unit to search
+        :rtype list:
+        """
+        return list(self.units.get(unit, []))
+
+    def combinations(self, unit, level):
+        """Find the combinations of directions that reproduce a unit.
+
+        :param Unit unit:  the unit to reproduce
+        :param int level:  number of directions to combine
+        :return:           a list of tuples (directions, coefficients)
+        """
+        eps = self.eps
+        nd, n = self.matrix.shape
+        if nd < level:
+            return []
+        target = np.zeros(n)
+        target[:len(unit)] = unit
+        if np.dot(target, target) < eps:
+            return []
+        if level == 1:
+            direction, scale = self.direction(unit)
+            if direction in self.directions:
+                return [((direction,), (scale,))]
+            return []
+        matrix = self.matrix
+        found = []
+
+        def recurse(start, chosen, basis, residual):
+            remaining = level - len(chosen)
+            rn = np.sqrt(np.dot(residual, residual))
+            if rn < eps:
+                return
+            if remaining == 1:
+                cand = matrix[start:]
+                if basis:
+                    b = np.array(basis)
+                    cand = cand - np.dot(np.dot(cand, b.T), b)
+                along = np.dot(cand, residual) / rn
+                perp = np.sum(cand * cand, axis=1) - along * along
+                for i in np.nonzero((np.abs(along) > eps) & (perp < eps))[0]:
+                    found.append(chosen + [start + i])
+                return
+            for c in range(start, nd - remaining + 1):
+                w = matrix[c]
+                for b in basis:
+                    w = w - np.dot(w, b) * b
+                wn = np.sqrt(np.dot(w, w))
+                if wn < eps:
+                    continue
+                w = w / wn
+                recurse(c + 1, chosen + [c], basis + [w],
+                        residual - np.dot(residual, w) * w)
+
+        recurse(0, [], [], target)
+        result = []
+        for idx in found:
+            x = np.linalg.lstsq(matrix[idx].T, target, rcond=None)[0]
+            if min(abs(x)) > 1e-5:
+                result.append((tuple(self.keys[i] for i in idx),
+                               tuple(exponent(e) for e in x)))
+        return result
+
+    def search(self, unit, level):
+        """Find the combinations of names that reproduce a unit.
+
+        :param Unit unit:  the unit to reproduce
+        :param int level:  number of names to combine; if negative, only
+                           exponents +1 and -1 are accepted
+        :return:           a list of UnitTree's, ordered by complexity
+        """
+        result = []
+        for directions, coeffs in self.combinations(unit, abs(level)):
+            terms = []
+            for d, c in zip(directions, coeffs):
+                term = []
+                for k, scale in self.directions[d]:
+                    e = exponent(Fraction(c) / scale)
+                    if level < 0 and e not in (1, -1):
+                        continue
+                    f = Fraction(e)
+                    term.append((UnitTree.simple(k, e) if isinstance(k, basestring)
+                                 else k * e, abs(f.numerator) + f.denominator - 1))
+                terms.append(term)
+            for combination in itertools.product(*terms):
+                result.append((sum(c for _, c in combination),
+                               UnitTree(itertools.chain.from_iterable(
+                                   t for t, _ in combination))))
+        result.sort(key=lambda x: x[0])
+        return [tree for _, tree in result]
+
+
+def dimension_index(d=None):
+    """Return a DimensionIndex for a dictionary of quantities.
+
+    The index of the unit dictionary is cached until the registry changes.
+
+    :param dict d:  dictionary of quantities [units of the current registry]
+    :rtype DimensionIndex:
+    """
+    reg = get_registry()
+    units = reg.units
+    if d is None or d is units:
+        cache = reg.dimension_index_cache
+        if cache is None or cache[0] != reg.generation or \
+           cache[1] is not units or cache[2] != len(units):
+            cache = (reg.generation, units, len(units), DimensionIndex(units))
+            reg.dimension_index_cache = cache
+        return cache[3]
+    return DimensionIndex(d)
+
+
+def compile_system(us):
+    """Return the compiled version of a tuple of display units.
+
+    Compiled systems are cached in the `cachedat` dictionary of the current
+    registry and rebuilt only when they are no longer valid.
+
+    :param tuple(str) us:  Tuple of units or prefixes (the args of a System)
+    :rtype CompiledSystem:
+    """
+    reg = get_registry()
+    cachedat = reg.cachedat
+    us = tuple(us)
+    cs = cachedat.get(us)
+    if cs is None or not cs.valid(reg):
+        cs = CompiledSystem(us)
+        if cs.depends is not None:
+            cachedat[us] = cs
+    return cs
+
+
+class Converter(object):
+    """A compiled conversion between two units.
+
+    The source and target units are parsed once and their dimensions are
+    checked.  If either unit is absolute (see the tuple form of newunit),
+    the conversion is affine, and converts absolute values: units without
+    an offset are then taken as absolute scales with zero offset.  Calling
+    the converter on a number or an array performs a single multiply-add,
+    optionally on an output buffer.
+
+    Values can be converted too: their magnitude is always expressed in
+    base units, so that the source unit is not used, and their own offset
+    is used for absolute values, as in Value.show.
+    """
+    def __init__(self, src, dst):
+        """Build a converter: use the cached `converter` function instead.
+
+        :param src:  source unit, as a string or a UnitTree; None for the
+                     base units with the same dimension as the target
+        :param dst:  target unit, as a string or a UnitTree
+        """
+        self.src = src
+        self.dst = dst
+        d = self.unit_value(dst)
+        if src is None:
+            s = Value(1.0, d.unit)
+        else:
+            s = self.unit_value(src)
+        if s.unit != d.unit:
+            raise UnitCompatibilityError(s.unit, d.unit, "converter")
+        self.unit = d.unit
+        self.absolute = s.absolute is not False or d.absolute is not False
+        self.divisor = d.value
+        self.dst_offset = d.absolute
+        self.scale = s.value / d.value
+        if self.absolute:
+            self.offset = ((s.absolute or 0.0) - (d.absolute or 0.0)) / d.value
+        else:
+            self.offset = 0.0
+
+    @staticmethod
+    def unit_value(u):
+        if isinstance(u, UnitTree):
+            return u.to_value()
+        return unit_parser(u)[0]
+
+    def __repr__(self):
+        return "Converter(%r, %r)" % (self.src, self.dst)
+
+    def __call__(self, x, out=None):
+        """Convert a number, an array, or a Value.
+
+        :param x:         quantity to convert, expressed in the source unit if
+                          a number or an array
+        :param out:       optional array where the result is stored
+        :return:          the converted number or array (a plain one)
+        """
+        if isinstance(x, Quantity):
+            if x.unit != self.unit:
+                raise UnitCompatibilityError(x.unit, self.unit, "converter")
+            value = x.value
+            if x.absolute is not False and self.dst_offset is not False:
+                offset = x.absolute - self.dst_offset
+            else:
+                offset = 0.0
+            if out is None and np.ndim(value) == 0:
+                return (value + offset) / self.divisor if offset else \
+                    value / self.divisor
+            out = np.add(value, offset, out=out)
+            return np.divide(out, self.divisor, out=out)
+        if out is None and np.ndim(x) == 0:
+            return x * self.scale + self.offset if self.offset else x * self.scale
+        out = np.multiply(x, self.scale, out=out)
+        if self.offset:
+            np.add(out, self.offset, out=out)
+        return out
+
+
+def has_quotes(u):
+    """Check if a unit, as a string or a UnitTree, refers to quoted variables."""
+    if isinstance(u, UnitTree):
+        return any(has_quotes(k) for k, _ in u)
+    return u is not None and ("'" in u or '"' in u)
+
+
+def converter(src, dst):
+    """Return a converter between two units.
+
+    Converters are cached until the unit registry changes, unless they
+    depend on quoted variables.  Converters from base units to a UnitTree
+    are memoized in the tree (see `UnitTree.converter`), also when the
+    tree contains quoted variables.
+
+    :param src:  source unit, as a string or a UnitTree; None for the base
+                 units with the same dimension as the target
+    :param dst:  target unit, as a string or a UnitTree
+    :rtype Converter:
+    """
+    if src is None and isinstance(dst, UnitTree):
+        return dst.converter()
+    reg = get_registry()
+    key = (src, dst, reg.generation)
+    c = reg.converter_cache.get(key)
+    if c is None:
+        c = Converter(src, dst)
+        if not (has_quotes(src) or has_quotes(dst)):
+            reg.converter_cache.put(key, c)
+    return c
+
+
 ######################################################################
 # Currency symbols
 
@@ -1204,8 +2311,9 @@ currency_symbols = {
 
 
 ######################################################################
-# Unit Lexer
+# Unit parser
 
+# Keywords of verbose units
 reserved = {
     'square': 'SQUARE',
     'cubic': 'CUBIC',
@@ -1218,430 +2326,743 @@ reserved = {
     'over': 'OVER'
 }
 
-# List of token names.   This is always required
-tokens = (
-    'UNIT',
-    'NUMERAL',
-    'ORDINAL',
-    'FLOAT',
-    'NUMDIV',
-    'UNITDIV',
-    'POW',
-    'DOT',
-    'LPAREN',
-    'RPAREN',
-    'QUOTE'
-    ) + tuple(reserved.values())
-
-# Regular expression rules for simple tokens
-t_NUMDIV = r'/(?=[ \t]*\d)'
-t_UNITDIV = r'/(?=[ \t]*\D)'
-t_POW = r'\^'
-t_DOT = r'\.'
-t_LPAREN = r'\('
-t_RPAREN = r'\)'
-t_QUOTE = r"\'"
-
 # The way units are defined here, they can contain dashes in their name, but not digits
 unit_regex = u"([^\\W\\d]+(-[^\\W\\d]+)*|°\\w*|\\$|" + \
              u"|".join([re.escape(_v_) for _v_ in currency_symbols.values()]) + u")"
 
+# Tokens, in order of precedence: a slash is a NUMDIV if followed by a number
+token_re = re.compile(u"(?P<WORD>" + unit_regex + u")|"
+                      u"(?P<ORDINAL>(?P<number>[-+]?\\d+)(?:st|nd|rd|th))|"
+                      u"(?P<FLOAT>[-+]?\\d+\\.\\d+)|"
+                      u"(?P<NUMERAL>[-+]?\\d+)|"
+                      u"(?P<NUMDIV>/(?=[ \\t]*\\d))|"
+                      u"(?P<UNITDIV>/)|"
+                      u"(?P<POW>\\^)|"
+                      u"(?P<DOT>\\.)|"
+                      u"(?P<LPAREN>\\()|"
+                      u"(?P<RPAREN>\\))|"
+                      u"(?P<QUOTE>')|"
+                      u"(?P<IGNORE>[ *\\t\\n]+)", re.UNICODE)
+
+# Tokens that can start a factor of a product
+factor_tokens = frozenset(("UNIT", "QUOTE", "LPAREN", "SQUARE", "CUBIC"))
+
+
+class UnitParser(object):
+    """A recursive descent parser for units.
+
+    Units are written either in the standard form, such as 'kg m/s^2', or in
+    the verbose one, such as 'kilograms meters per second squared'.  The
+    form is decided after the tokenization: a unit is standard if all its
+    words are standard unit names, and verbose otherwise (in which case
+    keywords such as 'per' and ordinals such as 'third' are recognized).
+
+    The grammar is
+
+        expression  : [INVERSE] product {(UNITDIV | PER) product}
+        product     : factor {[DOT] factor}
+        factor      : (SQUARE | CUBIC) product
+                    | primary {POW exponent | POW LPAREN exponent RPAREN |
+                               SQUARED | CUBED | TO THE verbose_exponent}
+        primary     : unit [NUMERAL | FLOAT] | LPAREN expression RPAREN
+        unit        : UNIT | QUOTE UNIT QUOTE
+
+    Products bind tighter than divisions, so that 'm/s kg' is m s^-1 kg^-1.
+    The parser keeps no state between calls, and can be shared by threads.
+    """
+    def __init__(self, registry):
+        """Create a parser for the units of a registry.
+
+        :param UnitRegistry registry:  the registry
+        """
+        self.registry = registry
 
-# A unit, or also a keyword in verbose mode
-@lex.TOKEN(unit_regex)
-def t_UNIT(t):
-    if t.lexer.verbose:
-        if t.value in reserved:
-            t.type = reserved.get(t.value)
+    def tokenize(self, unit):
+        """Split a unit into tokens and decide its form.
+
+        :param str unit:  the unit to parse
+        :return (list, bool):  list of tokens (type, text, value), and a flag
+                               set for verbose units
+        """
+        tokens = []
+        pos = 0
+        quoted = False
+        verbose = False
+        isunit = self.registry.isunit
+        while pos < len(unit):
+            m = token_re.match(unit, pos)
+            if m is None:
+                raise UnitParseError(unit[pos], "illegal character")
+            pos = m.end()
+            kind = m.lastgroup
+            text = m.group()
+            if kind == "WORD":
+                if quoted:
+                    tokens.append(("UNIT", text, None))
+                else:
+                    iu = isunit(text)
+                    verbose = verbose or not iu
+                    tokens.append(("WORD", text, iu))
+            elif kind == "ORDINAL":
+                verbose = True
+                tokens.append(("ORDINAL", text, float(int(m.group("number")))))
+            elif kind == "FLOAT":
+                tokens.append(("FLOAT", text, float(text)))
+            elif kind == "NUMERAL":
+                tokens.append(("NUMERAL", text, float(int(text))))
+            elif kind == "QUOTE":
+                quoted = not quoted
+                tokens.append(("QUOTE", text, None))
+            elif kind != "IGNORE":
+                tokens.append((kind, text, None))
+        if verbose:
+            tokens = [self.verbose_word(text) if kind == "WORD" else (kind, text, value)
+                      for kind, text, value in tokens]
         else:
-            try:
-                v = cardinal_to_number(t.value)
-                t.type = 'NUMBER'
-                t.value = v
-            except ValueError:
-                try:
-                    v = ordinal_to_number(t.value, fraction=True)
-                    t.type = 'ORDINAL'
-                    t.value = v
-                except ValueError:
-                    pass
-    return t
-
-
-def t_ORDINAL(t):
-    r"""(?P<number>[-+]?\d+)(?P<suffix>st|nd|rd|th)"""
-    if t.lexer.verbose:
+            tokens = [("UNIT", text, value) if kind == "WORD" else (kind, text, value)
+                      for kind, text, value in tokens]
+        return tokens, verbose
+
+    def verbose_word(self, text):
+        """Return the token of a word in a verbose unit."""
+        if text in reserved:
+            return reserved[text], text, None
+        try:
+            cardinal_to_number(text)
+        except ValueError:
+            pass
+        else:
+            raise UnitParseError(text, "numbers must be written with digits")
         try:
-            t.value = Fraction(int(t.lexer.lexmatch.group("number")), 1) * 1.0
-            return t
+            return "ORDINAL", text, ordinal_to_number(text, fraction=True)
         except ValueError:
-            raise UnitParseError(t.value, "number conversion failed", t.lineno)
-    else:
-        raise UnitParseError(t.value, "ordinals not allowed in this context", t.lineno)
+            pass
+        iu = self.registry.isunit(text, True)
+        if not iu:
+            raise UnitParseError(text, "unrecognized unit")
+        return "UNIT", text, iu
 
+    def parse(self, unit):
+        """Parse a unit.
 
-def t_FLOAT(t):
-    r"""[-+]?\d+\.\d+"""
-    try:
-        t.value = float(t.value)
-    except ValueError:
-        raise UnitParseError(t.value, "number conversion failed", t.lineno)
-    return t
+        :param str unit:  the unit to parse
+        :return (Value, UnitTree):  the value and the tree of the unit
+        """
+        tokens, verbose = self.tokenize(unit)
+        state = ParserState(self.registry, tokens, verbose)
+        res = state.expression()
+        if state.pos < len(tokens):
+            state.error()
+        return res
+
+
+class ParserState(object):
+    """The state of a UnitParser during the parse of a unit."""
+    def __init__(self, registry, tokens, verbose):
+        self.registry = registry
+        self.tokens = tokens
+        self.verbose = verbose
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def next(self, *kinds):
+        """Return the current token, which must be of one of the given kinds."""
+        if self.peek() not in kinds:
+            self.error()
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def error(self):
+        text = self.tokens[self.pos][1] if self.pos < len(self.tokens) else ""
+        raise UnitParseError(text, "syntax error")
+
+    def expression(self):
+        if self.peek() == "INVERSE":
+            self.pos += 1
+            a, t = self.product()
+            a, t = 1 / a, -t
+        else:
+            a, t = self.product()
+        while self.peek() in ("UNITDIV", "PER"):
+            self.pos += 1
+            b, u = self.product()
+            a, t = a / b, t - u
+        return a, t
+
+    def product(self):
+        # Products are right associative, as they were in the LALR grammar
+        factors = [self.factor()]
+        while True:
+            kind = self.peek()
+            if kind == "DOT":
+                self.pos += 1
+                factors.append(self.factor())
+            elif kind in factor_tokens:
+                factors.append(self.factor())
+            else:
+                break
+        a, t = factors.pop()
+        while factors:
+            b, u = factors.pop()
+            a, t = b * a, u + t
+        return a, t
+
+    def factor(self):
+        kind = self.peek()
+        if kind in ("SQUARE", "CUBIC"):
+            self.pos += 1
+            n = 2 if kind == "SQUARE" else 3
+            a, t = self.product()
+            return a ** n, t * n
+        if kind == "LPAREN":
+            self.pos += 1
+            a, t = self.expression()
+            self.next("RPAREN")
+        else:
+            a, t = self.unit()
+            if self.peek() in ("NUMERAL", "FLOAT"):
+                n = self.next("NUMERAL", "FLOAT")[2]
+                a, t = a ** n, t * n
+        while True:
+            kind = self.peek()
+            if kind == "POW":
+                self.pos += 1
+                if self.peek() == "LPAREN":
+                    self.pos += 1
+                    n = self.exponent()
+                    self.next("RPAREN")
+                else:
+                    n = self.exponent()
+            elif kind == "SQUARED":
+                self.pos += 1
+                n = 2
+            elif kind == "CUBED":
+                self.pos += 1
+                n = 3
+            elif kind == "TO":
+                self.pos += 1
+                self.next("THE")
+                n = self.verbose_exponent()
+            else:
+                return a, t
+            a, t = a ** n, t * n
+
+    def exponent(self):
+        kind, _, n = self.next("NUMERAL", "FLOAT")
+        if kind == "NUMERAL" and self.peek() == "NUMDIV":
+            self.pos += 1
+            n = n / self.next("NUMERAL")[2]
+        return n
+
+    def verbose_exponent(self):
+        kind, _, n = self.next("NUMERAL", "ORDINAL")
+        if kind == "ORDINAL":
+            return n
+        kind = self.peek()
+        if kind == "ORDINAL":
+            return n / self.next("ORDINAL")[2]
+        if kind == "NUMDIV":
+            self.pos += 1
+            return n / self.next("NUMERAL", "ORDINAL")[2]
+        self.next("OVER")
+        return n / self.next("NUMERAL")[2]
+
+    def unit(self):
+        reg = self.registry
+        if self.peek() == "QUOTE":
+            self.pos += 1
+            name = self.next("UNIT")[1]
+            self.next("QUOTE")
+            if name not in reg.user_ns:
+                raise UnitParseError(name, "unrecognized special unit")
+            return reg.user_ns[name], UnitTree.simple("'" + name + "'")
+        _, text, (k, u) = self.next("UNIT")
+        k1 = reg.prefixes[k] if k else 1
+        u1 = reg.units[u] if u else 1
+        return k1 * u1, UnitTree.simple(text if self.verbose else k + u)
 
 
-# A regular expression for numbers and ordinals
-def t_NUMERAL(t):
-    r"""([-+]?\d+)"""
-    try:
-        t.value = Fraction(int(t.value), 1) * 1.0
-    except ValueError:
-        raise UnitParseError(t.value, "number conversion failed", t.lineno)
-    return t
+######################################################################
+# General use functions
 
+def newbaseunit(name, doc=""):
+    get_registry().newbaseunit(name, doc)
 
-# Define a rule so we can track line numbers
-def t_newline(t):
-    r"""\n+"""
-    t.lineno += len(t.value)
 
+def newbasecurrency(name, doc=""):
+    get_registry().newbasecurrency(name, doc)
 
-# A string containing ignored characters (spaces and tabs)
-t_ignore = " *\t"
 
+def newprefix(name, value, doc="", source=""):
+    get_registry().newprefix(name, value, doc, source)
 
-# Error handling rule
-def t_error(t):
-    raise UnitParseError(t.value[0], "illegal character", t.lineno)
 
+def delprefix(name):
+    get_registry().delprefix(name)
 
-# Build the lexer
-unitlex = lex.lex(reflags=re.UNICODE)
-unitlex.verbose = False
 
+def newunit(name, value, doc="", source=""):
+    get_registry().newunit(name, value, doc, source)
 
-######################################################################
-# Unit Parser
 
-def p_expression(p):
-    """expression : expression1
-                  | INVERSE expression1
-                  | expression UNITDIV expression1
-                  | expression PER expression1
-    """
-    if len(p) == 2:
-        p[0] = p[1]
-    elif len(p) == 3:
-        a = p[2][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        p[0] = (1 / a, -p[2][1])
-    else:
-        a = p[1][0]
-        b = p[3][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        if isinstance(b, tuple):
-            b = b[1]
-        p[0] = (a / b, p[1][1] - p[3][1])
-
-
-def p_expression1(p):
-    """expression1 : expression1 POW exponent
-                   | expression1 POW LPAREN exponent RPAREN
-                   | unit_exp
-                   | expression1 expression1
-                   | expression1 DOT expression1
-                   | unit
-    """
-    if len(p) == 2:
-        p[0] = p[1]
-    elif len(p) == 3:
-        a = p[1][0]
-        b = p[2][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        if isinstance(b, tuple):
-            b = b[1]
-        p[0] = (a * b, p[1][1] + p[2][1])
-        return
-    elif len(p) == 4 and p[2] == '.':
-        a = p[1][0]
-        b = p[3][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        if isinstance(b, tuple):
-            b = b[1]
-        p[0] = (a * b, p[1][1] + p[3][1])
-    elif len(p) == 4 and p[2] == '^':
-        a = p[1][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        p[0] = (a ** p[3], p[1][1] * p[3])
-    else:
-        a = p[1][0]
-        if isinstance(a, tuple):
-            a = a[1]
-        p[0] = (a ** p[4], p[1][1] * p[4])
-
-
-def p_expression1_verbose(p):
-    """expression1 : SQUARE expression1
-                   | expression1 SQUARED
-                   | CUBIC expression1
-                   | expression1 CUBED
-                   | expression1 TO THE verbose_exponent
-    """
-    if len(p) == 3:
-        if p[1] == 'square':
-            x = p[2]
-            n = 2
-        elif p[2] == 'squared':
-            x = p[1]
-            n = 2
-        elif p[1] == 'cubic':
-            x = p[2]
-            n = 3
-        else:   # must be p[2] == 'cubed'
-            x = p[1]
-            n = 3
-    else:
-        x = p[1]
-        n = p[4]
-    a = x[0]
-    if isinstance(a, tuple):
-        a = a[1]
-    p[0] = (a ** n, x[1] * n)
-
-
-def p_expression_group(p):
-    """expression1 : LPAREN expression RPAREN"""
-    p[0] = p[2]
-
-
-def p_exponent(p):
-    """exponent : NUMERAL NUMDIV NUMERAL
-                | NUMERAL
-                | FLOAT
-    """
-    if len(p) == 4:
-        # p[0] = Fraction(p[1], p[3])
-        p[0] = p[1] / p[3]
-    else:
-        p[0] = p[1]
-
-
-def p_verbose_exponent(p):
-    """verbose_exponent : ORDINAL
-                        | NUMERAL ORDINAL
-                        | NUMERAL NUMDIV NUMERAL
-                        | NUMERAL NUMDIV ORDINAL
-                        | NUMERAL OVER NUMERAL
-    """
-    if len(p) == 4:
-        # p[0] = Fraction(p[1], p[3])
-        p[0] = p[1] / p[3]
-    elif len(p) == 3:
-        # p[0] = Fraction(p[1], p[2])
-        p[0] = p[1] / p[2]
-    else:
-        p[0] = p[1]
-
-
-def p_unit_exp(p):
-    """unit_exp : unit NUMERAL
-                | unit FLOAT"""
-    a = p[1][0]
-    if isinstance(a, tuple):
-        a = a[1]
-    p[0] = (a ** p[2], p[1][1] * p[2])
-
-
-def p_unit(p):
-    """unit : UNIT
-            | QUOTE UNIT QUOTE
-    """
-    global prefixonly, user_ns
-    if p[1] == "'":
-        variables = user_ns
-        if p[2] in variables:
-            p[0] = (variables[p[2]], UnitTree.simple("'" + p[2] + "'"))
-        else:
-            raise UnitParseError(p[2], "unrecognized special unit")
-        return
-    ku = isunit(p[1], p.parser.verbose)
-    if ku:
-        k, u = ku
-        if k:
-            k1 = prefixes[k]
-        else:
-            k1 = 1
-        if u:
-            u1 = units[u]
-        else:
-            u1 = 1
-        if p.parser.verbose:
-            new_name = p[1]
-        else:
-            new_name = k + u
-        p[0] = (k1 * u1, UnitTree.simple(new_name))
-    else:
-        raise UnitParseError(p[1], "unrecognized unit")
+def delunit(name):
+    get_registry().delunit(name)
+
 
+def newsystem(name, value, doc=""):
+    get_registry().newsystem(name, value, doc)
 
-def p_error(p):
-    value = getattr(p, "value", "")
-    while 1:
-        tok = unityacc.token()             # Get the next token
-        if not tok:
-            break
-    unityacc.restart()
-    raise UnitParseError(value, "syntax error")
 
+def delsystem(name):
+    get_registry().delsystem(name)
 
-unityacc = yacc.yacc(write_tables=0, debug=0)
-unityacc.verbose = False
 
+# noinspection PyShadowingNames
+def isunit(fullname, verbose=False):
+    return get_registry().isunit(fullname, verbose)
 
-######################################################################
-# General use functions
 
-def newbaseunit(name, doc=""):
-    global baseunits, units, cachedat
-    if name in baseunits:
-        raise ValueError("Base unit %s already defined" % name)
-    baseunits.append(name)
-    n_bases = len(baseunits)
-    u = np.zeros(n_bases)
-    u[-1] = 1
-    v = Value(1.0, Unit(u))
-    v.__doc__ = doc
-    units[name] = v
-    verbose_name = extract_name(doc) if doc else name
-    verbose_units[verbose_name] = name
-    verbose_units[plural(verbose_name)] = name
-    # Fix all other units
-    for k, u in units.items():
-        uu = u.unit
-        units[k].unit = Unit(np.hstack((uu, np.zeros(n_bases - len(uu)))))
-    for k, u in prefixes.items():
-        uu = u.unit
-        prefixes[k].unit = Unit(np.hstack((uu, np.zeros(n_bases - len(uu)))))
-    cachedat = {}
+isunit_re = re.compile('^' + unit_regex + '$', re.UNICODE)
 
 
-def newbasecurrency(name, doc=""):
-    global cachedat
-    from . import currencies
-    currencies.basecurrency = name
-    newbaseunit(name, doc)
+class NameIndex(object):
+    """Character tries used to split a name into a prefix and a unit.
 
+    The index mirrors the keys of a prefix dictionary and of a unit
+    dictionary (either the standard or the verbose ones).  Prefixes are
+    stored in a forward trie, units in a trie of reversed names: a single
+    backward walk marks all positions where a unit can start, and a single
+    forward walk finds all prefixes ending there, so that a name is split
+    in O(len(name)) steps.  Each prefix keeps its insertion number, so
+    that among several possible splits the one using the first defined
+    prefix is returned, as a sequential scan of the prefix dictionary
+    would do.
 
-def newprefix(name, value, doc="", source=""):
-    global prefixes, verbose_prefixes, cachedat
-    v = Value(value)
-    v.check_pure()
-    v.unit = Unit()                     # Just in case tolerant is True...
-    v.__doc__ = doc
-    if source:
-        v.__source__ = source
-    prefixes[name] = v
-    verbose_prefixes[extract_name(doc) if doc else name] = name
-    cachedat = {}
+    The index is kept up to date incrementally by newbaseunit, newprefix,
+    delprefix, newunit, and delunit; it is rebuilt if the dictionaries it
+    mirrors have been replaced or resized directly.
+    """
+    def __init__(self):
+        self.prefixes = None
+        self.units = None
+        self.prefix_trie = {}
+        self.unit_trie = {}
+        self.nprefixes = 0
+        self.nunits = 0
+        self.counter = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _insert(trie, key, value):
+        node = trie
+        for c in key:
+            node = node.setdefault(c, {})
+        if "" in node:
+            return False
+        node[""] = value
+        return True
+
+    @staticmethod
+    def _remove(trie, key):
+        path = [trie]
+        for c in key:
+            node = path[-1].get(c)
+            if node is None:
+                return False
+            path.append(node)
+        if "" not in path[-1]:
+            return False
+        del path[-1][""]
+        # Prune the branches left empty
+        for n in range(len(key), 0, -1):
+            if path[n]:
+                break
+            del path[n - 1][key[n - 1]]
+        return True
+
+    def sync(self, prefixes, units):
+        """Rebuild the index if it does not mirror the given dictionaries.
+
+        :param dict prefixes: the prefix dictionary
+        :param dict units:    the unit dictionary
+        """
+        if self.prefixes is prefixes and self.units is units and \
+           self.nprefixes == len(prefixes) and self.nunits == len(units):
+            return
+        with self.lock:
+            prefix_trie = {}
+            unit_trie = {}
+            for n, k in enumerate(list(prefixes.keys())):
+                self._insert(prefix_trie, k, n)
+            for k in list(units.keys()):
+                self._insert(unit_trie, k[::-1], True)
+            self.prefix_trie, self.unit_trie = prefix_trie, unit_trie
+            self.counter = len(prefixes)
+            self.prefixes, self.units = prefixes, units
+            self.nprefixes, self.nunits = len(prefixes), len(units)
+
+    def add_prefix(self, name):
+        if self._insert(self.prefix_trie, name, self.counter):
+            self.counter += 1
+            self.nprefixes += 1
+
+    def remove_prefix(self, name):
+        if self._remove(self.prefix_trie, name):
+            self.nprefixes -= 1
+
+    def add_unit(self, name):
+        if self._insert(self.unit_trie, name[::-1], True):
+            self.nunits += 1
+
+    def remove_unit(self, name):
+        if self._remove(self.unit_trie, name[::-1]):
+            self.nunits -= 1
+
+    def split(self, name):
+        """Split a name into a prefix and a unit.
+
+        :param str name: the name to split
+        :return:         a tuple (prefix, unit), or None if no split exists
+        """
+        starts = set()
+        node = self.unit_trie
+        for n in range(len(name) - 1, -1, -1):
+            node = node.get(name[n])
+            if node is None:
+                break
+            if "" in node:
+                starts.add(n)
+        best = best_order = None
+        node = self.prefix_trie
+        n = 0
+        while node is not None:
+            if n in starts and "" in node:
+                order = node[""]
+                if best_order is None or order < best_order:
+                    best, best_order = n, order
+            if n == len(name):
+                break
+            node = node.get(name[n])
+            n += 1
+        if best is None:
+            return None
+        return name[:best], name[best:]
 
 
-def delprefix(name):
-    global prefixes
-    del prefixes[name]
-    for k, v in verbose_prefixes.items():
-        if v == name:
-            del verbose_prefixes[k]
+######################################################################
+# Unit registries
 
+def get_registry():
+    """Return the registry used by the current thread.
 
-def newunit(name, value, doc="", source=""):
-    global units, verbose_units, cachedat
-    if not isinstance(value, (int, float, Value, tuple, mpnumeric)):
-        raise ValueError("The unit %s must be a simple value or a tuple" % name)
-    if isinstance(value, tuple):
-        if len(value) != 2:
-            raise ValueError("The absolute unit `%s` is not a 2-tuple" % name)
-        z, v = Value(value[0]), Value(value[1])
-        v.check_units(z)
-        v.absolute = z.value
-    else:
-        v = Value(value)
-    if name == "m" or v.unit == units["m"].unit:
-        space_units.append(name)
-    v = v & Doc(doc)
-    if source:
-        v.__source__ = source
-    units[name] = v
-    verbose_units[extract_name(doc) if doc else name] = name
-    verbose_name = extract_name(doc) if doc else name
-    verbose_units[verbose_name] = name
-    verbose_units[plural(verbose_name)] = name
-    cachedat = {}
+    :rtype UnitRegistry:  the registry activated by a `with` statement, or
+                          the default one
+    """
+    return _active.registry
 
 
-def delunit(name):
-    global units
-    del units[name]
-    for k, v in verbose_units.items():
-        if v == name:
-            del verbose_units[k]
+class ActiveRegistry(threading.local):
+    """The registry used by each thread, with the registries it replaced."""
+    def __init__(self):
+        self.registry = default_registry
+        self.stack = []
 
 
-def newsystem(name, value, doc=""):
-    global systems, cachedat
-    v = System(*value)
-    v.__doc__ = doc
-    systems[name] = v
-    cachedat = {}
+class UnitRegistry(object):
+    """A set of units, prefixes, and systems, with its own parsers and caches.
 
+    The functions of this module use the registry of the current thread:
+    this is the default registry, whose tables are the module variables,
+    unless another registry has been activated with a `with` statement:
 
-def delsystem(name):
-    global systems
-    del systems[name]
+    >>> registry = UnitRegistry()
+    >>> with registry:
+    ...     newbaseunit("m")
+    ...     x = Value(3.0, "m")
 
+    Values and units do not belong to a registry, but their unit names are
+    interpreted in the registry where they are used.  Lookups, parsing,
+    and conversions take no locks: the parser keeps no state between
+    calls, and the caches never block readers.
+    Changes to the registry are serialized, but they are not atomic with
+    respect to lookups: a registry should be fully defined before it is
+    shared among threads.
+    """
+    # Attributes holding the state of a registry
+    tables = ("baseunits", "basecurrency", "units", "verbose_units",
+              "space_units", "prefixes", "verbose_prefixes", "systems",
+              "formats", "defaultsystem", "user_ns", "prefixonly", "cachedat",
+              "generation", "parse_cache", "dimension_index_cache",
+              "converter_cache", "name_index", "verbose_name_index")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.parser = UnitParser(self)
+        self.baseunits = []
+        self.basecurrency = None
+        self.units = ODict()
+        self.verbose_units = ODict()
+        self.space_units = ["m"]
+        self.prefixes = ODict()
+        self.verbose_prefixes = ODict()
+        self.systems = ODict()
+        self.formats = ODict()
+        self.defaultsystem = None
+        self.user_ns = {}
+        self.prefixonly = True
+        self.cachedat = {}
+        self.generation = 0
+        self.parse_cache = LRUCache(1024)
+        self.dimension_index_cache = None
+        self.converter_cache = LRUCache(256)
+        self.name_index = NameIndex()
+        self.verbose_name_index = NameIndex()
+        self.newprefix('', Value(1.0))
+
+    def __enter__(self):
+        _active.stack.append(_active.registry)
+        _active.registry = self
+        return self
 
-isunit_re = re.compile('^' + unit_regex + '$', re.UNICODE)
+    def __exit__(self, exc_type, exc_value, tb):
+        _active.registry = _active.stack.pop()
 
+    def parse(self, unit):
+        """General parser for units.
 
-# noinspection PyShadowingNames
-def isunit(fullname, verbose=False):
-    global prefixonly
-    match = isunit_re.match(fullname)
-    if match:
-        name = match.group(0)
-    else:
-        name = fullname
-    if verbose:
-        if name in verbose_units:
-            return "", verbose_units[name]
-        elif prefixonly and name in verbose_prefixes:
-            return verbose_prefixes[name], ""
-        elif name[-1] == "*" and not name[0:-1] in verbose_prefixes:
-            return verbose_prefixes[name[0:-1]], ""
+        :param str unit: the string to parse
+        :return (Value, UnitTree): the full result of the parsing
+
+        Both simple units, such as 'm/s^2', and verbose ones, such as
+        'meter per second squared', are accepted: see `UnitParser`.
+
+        Results are memoized in `parse_cache`, keyed by the registry
+        generation; units with special (quoted) parts depend on user
+        variables and are never cached.  The returned objects are shared,
+        and must not be modified.
+        """
+        if "'" in unit:
+            return self.parse_unit(unit)
+        key = (unit, self.prefixonly, self.generation)
+        res = self.parse_cache.get(key)
+        if res is None:
+            res = self.parse_unit(unit)
+            self.parse_cache.put(key, res)
+        return res
+
+    def parse_unit(self, unit):
+        """Parse a unit without using the cache: see `parse`."""
+        with self:
+            return self.parser.parse(unit)
+
+    def parse_cache_info(self):
+        """Return the statistics of the unit parser cache.
+
+        :return dict:  a dictionary with hits, misses, size, maxsize, and the
+                       current registry generation
+        """
+        info = self.parse_cache.info()
+        info["generation"] = self.generation
+        return info
+
+    def bump_generation(self):
+        """Signal a change in the registry, invalidating the parser cache.
+
+        Must be called every time units or prefixes are added, removed, or
+        modified.
+        """
+        with self.lock:
+            self.generation += 1
+            self.parse_cache.clear()
+
+    def newbaseunit(self, name, doc=""):
+        with self.lock:
+            if name in self.baseunits:
+                raise ValueError("Base unit %s already defined" % name)
+            self.baseunits.append(name)
+            # Units do not store trailing zero exponents, so other units need no fix
+            v = Value(1.0, Unit((0,) * (len(self.baseunits) - 1) + (1,)))
+            self.units[name] = v & Doc(doc)
+            verbose_name = extract_name(doc) if doc else name
+            self.verbose_units[verbose_name] = name
+            self.verbose_units[plural(verbose_name)] = name
+            self.name_index.add_unit(name)
+            self.verbose_name_index.add_unit(verbose_name)
+            self.verbose_name_index.add_unit(plural(verbose_name))
+            self.bump_generation()
+
+    def newbasecurrency(self, name, doc=""):
+        with self.lock:
+            self.newbaseunit(name, doc)
+            self.basecurrency = name
+
+    def newprefix(self, name, value, doc="", source=""):
+        with self.lock:
+            v = Value(value)
+            v.check_pure()
+            v.unit = Unit()                     # Just in case tolerant is True...
+            self.prefixes[name] = v & Doc(doc, source)
+            verbose_name = extract_name(doc) if doc else name
+            self.verbose_prefixes[verbose_name] = name
+            self.name_index.add_prefix(name)
+            self.verbose_name_index.add_prefix(verbose_name)
+            self.bump_generation()
+
+    def delprefix(self, name):
+        with self.lock:
+            del self.prefixes[name]
+            self.name_index.remove_prefix(name)
+            for k, v in list(self.verbose_prefixes.items()):
+                if v == name:
+                    del self.verbose_prefixes[k]
+                    self.verbose_name_index.remove_prefix(k)
+            self.bump_generation()
+
+    def newunit(self, name, value, doc="", source=""):
+        if not isinstance(value, (int, float, Value, tuple, mpnumeric)):
+            raise ValueError("The unit %s must be a simple value or a tuple" % name)
+        with self.lock:
+            if isinstance(value, tuple):
+                if len(value) != 2:
+                    raise ValueError("The absolute unit `%s` is not a 2-tuple" % name)
+                z, v = Value(value[0]), Value(value[1])
+                v.check_units(z)
+                v.absolute = z.value
+            else:
+                v = Value(value)
+            if name == "m" or v.unit == self.units["m"].unit:
+                self.space_units.append(name)
+            self.units[name] = v & Doc(doc, source)
+            verbose_name = extract_name(doc) if doc else name
+            self.verbose_units[verbose_name] = name
+            self.verbose_units[plural(verbose_name)] = name
+            self.name_index.add_unit(name)
+            self.verbose_name_index.add_unit(verbose_name)
+            self.verbose_name_index.add_unit(plural(verbose_name))
+            self.bump_generation()
+
+    def delunit(self, name):
+        with self.lock:
+            del self.units[name]
+            self.name_index.remove_unit(name)
+            for k, v in list(self.verbose_units.items()):
+                if v == name:
+                    del self.verbose_units[k]
+                    self.verbose_name_index.remove_unit(k)
+            self.bump_generation()
+
+    def newsystem(self, name, value, doc=""):
+        with self.lock, self:
+            v = System(*value)
+            v.__doc__ = doc
+            self.systems[name] = v
+
+    def delsystem(self, name):
+        with self.lock:
+            del self.systems[name]
+
+    # noinspection PyShadowingNames
+    def isunit(self, fullname, verbose=False):
+        match = isunit_re.match(fullname)
+        if match:
+            name = match.group(0)
         else:
-            ks = [k for k in verbose_prefixes.keys()
-                  if k == name[:len(k)]]
-            for k in ks:
-                u = name[len(k):]
-                if u in verbose_units:
-                    return verbose_prefixes[k], verbose_units[u]
-    else:
-        if name in units:
-            return "", name
-        elif prefixonly and name in prefixes:
-            return name, ""
-        elif name[-1] == "*" and not name[0:-1] in prefixes:
-            return name[0:-1], ""
+            name = fullname
+        if verbose:
+            verbose_units, verbose_prefixes = self.verbose_units, self.verbose_prefixes
+            if name in verbose_units:
+                return "", verbose_units[name]
+            elif self.prefixonly and name in verbose_prefixes:
+                return verbose_prefixes[name], ""
+            elif name[-1] == "*" and not name[0:-1] in verbose_prefixes:
+                return verbose_prefixes[name[0:-1]], ""
+            else:
+                self.verbose_name_index.sync(verbose_prefixes, verbose_units)
+                res = self.verbose_name_index.split(name)
+                if res:
+                    return verbose_prefixes[res[0]], verbose_units[res[1]]
         else:
-            ks = [k for k in prefixes.keys() if k == name[:len(k)]]
-            for k in ks:
-                u = name[len(k):]
-                if u in units:
-                    return k, u
-    return False
+            units, prefixes = self.units, self.prefixes
+            if name in units:
+                return "", name
+            elif self.prefixonly and name in prefixes:
+                return name, ""
+            elif name[-1] == "*" and not name[0:-1] in prefixes:
+                return name[0:-1], ""
+            else:
+                self.name_index.sync(prefixes, units)
+                res = self.name_index.split(name)
+                if res:
+                    return res
+        return False
+
+    def load_variables(self, namespace):
+        namespace['Doc'] = Doc
+        namespace['Unit'] = Unit
+        namespace['Value'] = Value
+        namespace['System'] = System
+        namespace['UnitError'] = UnitError
+        namespace['baseunits'] = self.baseunits
+        namespace['units'] = self.units
+        namespace['prefixes'] = self.prefixes
+        namespace['systems'] = self.systems
+        namespace['formats'] = self.formats
+        namespace['defaultsystem'] = self.defaultsystem
+        namespace['verbose'] = lambda x: x.show(verbose=True)
+        # TODO: remove next line
+        namespace['parser'] = unit_parser
+        self.user_ns = namespace
+
+    def save_variables(self, namespace):
+        with self.lock:
+            self.baseunits = namespace['baseunits']
+            self.units = namespace['units']
+            self.prefixes = namespace['prefixes']
+            self.systems = namespace['systems']
+            self.formats = namespace['formats']
+            self.defaultsystem = namespace['defaultsystem']
+            self.user_ns = namespace
+            self.bump_generation()
+
+    def reset(self):
+        with self.lock:
+            self.baseunits = []
+            self.basecurrency = None
+            self.units = ODict()
+            self.space_units = ["m"]
+            self.prefixes = ODict()
+            self.systems = ODict()
+            self.formats = ODict()
+            self.defaultsystem = None
+            self.cachedat = {}
+            self.bump_generation()
+            self.newprefix('', Value(1.0))
+
+
+class ModuleRegistry(UnitRegistry):
+    """The default registry, whose state is kept in the variables of this module.
+
+    The module variables (units, prefixes, systems...) are used directly by
+    the other modules of imks and by the scripts; this registry reads and
+    writes them, so that the two views are always consistent.
+    """
+    # noinspection PyMissingConstructor
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.parser = UnitParser(self)
+
+
+def module_variable(name, variables=globals()):
+    return property(lambda self: variables[name],
+                    lambda self, value: variables.__setitem__(name, value))
+
+
+for _name in UnitRegistry.tables:
+    setattr(ModuleRegistry, _name, module_variable(_name))
 
 
 ######################################################################
@@ -1674,6 +3095,7 @@ sortunits = True
 showerrors = 2
 
 baseunits = []
+basecurrency = None
 units = ODict()
 verbose_units = ODict()
 space_units = ["m"]
@@ -1682,50 +3104,26 @@ verbose_prefixes = ODict()
 systems = ODict()
 formats = ODict()
 defaultsystem = None
+user_ns = {}
 cachedat = {}
+generation = 0
+parse_cache = LRUCache(1024)
+dimension_index_cache = None
+converter_cache = LRUCache(256)
+name_index = NameIndex()
+verbose_name_index = NameIndex()
+default_registry = ModuleRegistry()
+_active = ActiveRegistry()
 newprefix('', Value(1.0))
-user_ns = {}
 
 
 def load_variables(namespace):
-    global baseunits, units, prefixes, systems, formats, defaultsystem, user_ns
-    namespace['Doc'] = Doc
-    namespace['Unit'] = Unit
-    namespace['Value'] = Value
-    namespace['System'] = System
-    namespace['UnitError'] = UnitError
-    namespace['baseunits'] = baseunits
-    namespace['units'] = units
-    namespace['prefixes'] = prefixes
-    namespace['systems'] = systems
-    namespace['formats'] = formats
-    namespace['defaultsystem'] = defaultsystem
-    namespace['verbose'] = lambda x: x.show(verbose=True)
-    # TODO: remove next line
-    namespace['parser'] = unit_parser
-    user_ns = namespace
+    get_registry().load_variables(namespace)
 
 
 def save_variables(namespace):
-    global baseunits, units, prefixes, systems, formats, defaultsystem, user_ns
-    baseunits = namespace['baseunits']
-    units = namespace['units']
-    prefixes = namespace['prefixes']
-    systems = namespace['systems']
-    formats = namespace['formats']
-    defaultsystem = namespace['defaultsystem']
-    user_ns = namespace
+    get_registry().save_variables(namespace)
 
 
 def reset():
-    global baseunits, units, space_units, prefixes, systems, formats, defaultsystem, \
-      cachedat
-    baseunits = []
-    units = ODict()
-    space_units = ["m"]
-    prefixes = ODict()
-    systems = ODict()
-    formats = ODict()
-    defaultsystem = None
-    cachedat = {}
-    newprefix('', Value(1.0))
+    get_registry().reset()
@@ -2,8 +2,6 @@ import mpmath
 from .units import Value
 from .uparse import uparse
 
-_round = round
-
 
 def mpdoc(f):
     """Decorator to copy the mpmath __doc__ string."""
@@ -233,36 +231,47 @@ def ufloat(s):
 ######################################################################
 # Load and unload functions
 
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        purifiers = ['sign', 'arg', 'isinf', 'isnan', 'isnormal', 'isfinite', 'isint']
+        unitiers = ['fabs', 'ceils', 'floor', 'frac', 'nint', 're', 'im', 'conj']
+        _exports = {}
+        for name in dir(mpmath):
+            if hasattr(mpmath.mp, name) or name == 'mp':
+                if name in globs:
+                    _exports[name] = globs[name]
+                elif name in purifiers:
+                    _exports[name] = purifier(name)
+                elif name in unitiers:
+                    _exports[name] = unitier(name)
+                else:
+                    _exports[name] = getattr(mpmath, name)
+        _exports["fp"] = mpmath.fp
+        _exports["fraction"] = fraction
+        _exports["round"] = _exports["nint"]
+        _exports["ufloat"] = ufloat
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
+    mpmath.fp.pretty = True
+
+
 def load(namespace):
     """Load all mpmath defined functions, using when appropriate modified versions."""
-    names = dir(mpmath)
-    globs = globals()
-    purifiers = ['sign', 'arg', 'isinf', 'isnan', 'isnormal', 'isfinite', 'isint']
-    unitiers = ['fabs', 'ceils', 'floor', 'frac', 'nint', 're', 'im', 'conj']
-    for name in names:
-        if hasattr(mpmath.mp, name) or name == 'mp':
-            if name in globs:
-                namespace[name] = globs[name]
-            elif name in purifiers:
-                namespace[name] = purifier(name)
-            elif name in unitiers:
-                namespace[name] = unitier(name)
-            else:
-                namespace[name] = getattr(mpmath, name)
-    namespace["fp"] = mpmath.fp
-    namespace["fraction"] = fraction
-    namespace["round"] = namespace["nint"]
-    namespace["ufloat"] = ufloat
-    namespace["fp"].pretty = True
+    activate()
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all mpmath defined functions."""
-    names = dir(mpmath) + ["fraction", "fp", "ufloat", "nint", "frac"]
-    for name in names:
-        if hasattr(mpmath.mp, name):
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
-    namespace["round"] = _round
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
@@ -137,25 +137,29 @@ def ufloat(s):
 ######################################################################
 # Load and unload functions
 
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        _exports = dict((name, globs.get(name, getattr(math, name)))
+                        for name in dir(math) if name[0] != '_')
+        _exports["round"] = round
+        _exports["fraction"] = fraction
+        _exports["ufloat"] = ufloat
+    return _exports
+
+
 def load(namespace):
     """Load all math defined functions, using when appropriate modified versions."""
-    names = dir(math)
-    globs = globals()
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, getattr(math, name))
-    namespace["round"] = round
-    namespace["fraction"] = fraction
-    namespace["ufloat"] = ufloat
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all math defined functions."""
-    names = dir(math) + ["fraction", "ufloat", "round"]
-    for name in names:
-        if name[0] != '_':
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
-    namespace["round"] = _round
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
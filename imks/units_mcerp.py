@@ -108,41 +108,54 @@ def ufloat_repr_latex(self):
 ######################################################################
 # Load and unload functions
 
-def load(namespace):
-    """Load all math defined functions, using when appropriate modified versions."""
-    globs = globals()
-    names = ["Beta", "Bradford", "Burr", "ChiSquared", "Chi2", "Erf",
-             "Erlang", "Exponential", "Exp", "ExtValueMax", "EVMax",
-             "ExtValueMin", "EVMin", "Fisher", "F", "Gamma", "LogNormal",
-             "LogN", "Normal", "N", "Pareto", "Pareto2", "PERT",
-             "StudentT", "Triangular", "Tri", "Uniform", "Weibull", "Weib",
-             "Bernoulli", "Bern", "Binomial", "B", "Geometric", "G",
-             "Hypergeometric", "H", "Poisson", "Pois"]
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, mconvert(getattr(mcerp, name)))
-    names = dir(umath)
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, mconvert(getattr(umath, name)))
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        names = ["Beta", "Bradford", "Burr", "ChiSquared", "Chi2", "Erf",
+                 "Erlang", "Exponential", "Exp", "ExtValueMax", "EVMax",
+                 "ExtValueMin", "EVMin", "Fisher", "F", "Gamma", "LogNormal",
+                 "LogN", "Normal", "N", "Pareto", "Pareto2", "PERT",
+                 "StudentT", "Triangular", "Tri", "Uniform", "Weibull", "Weib",
+                 "Bernoulli", "Bern", "Binomial", "B", "Geometric", "G",
+                 "Hypergeometric", "H", "Poisson", "Pois"]
+        _exports = {}
+        for name in names:
+            _exports[name] = globs[name] if name in globs else \
+                mconvert(getattr(mcerp, name))
+        for name in dir(umath):
+            if name[0] != '_':
+                _exports[name] = globs[name] if name in globs else \
+                    mconvert(getattr(umath, name))
+        _exports["fraction"] = fraction
+        _exports["ufloat"] = ufloat
+        _exports["pi"] = math.pi
+        _exports["e"] = math.e
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
     mcerp.UncertainVariable.__repr__ = mcerp.UncertainFunction.__repr__ = \
         ufloat_repr
     mcerp.UncertainVariable.__str__ = mcerp.UncertainFunction.__str__ = \
         ufloat_repr
     mcerp.UncertainVariable._repr_latex_ = \
         mcerp.UncertainFunction._repr_latex_ = ufloat_repr_latex
-    namespace["fraction"] = fraction
-    namespace["ufloat"] = ufloat
-    namespace["pi"] = math.pi
-    namespace["e"] = math.e
+
+
+def load(namespace):
+    """Load all math defined functions, using when appropriate modified versions."""
+    activate()
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all math defined functions."""
-    names = dir(mcerp) + dir(umath) + ["fraction", "ufloat", "pi", "e"]
-    for name in names:
-        if name[0] != '_':
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
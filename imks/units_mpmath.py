@@ -2,8 +2,6 @@ import mpmath
 from .units import Value
 from .uparse import uparse
 
-_round = round
-
 
 def mpdoc(f):
     """Decorator to copy the mpmath __doc__ string."""
@@ -287,42 +285,60 @@ def new_mpf_str(s):
                   min_fixed=min_fixed, max_fixed=max_fixed)
 
 
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        purifiers = ['sign', 'arg', 'isinf', 'isnan', 'isnormal', 'isfinite', 'isint']
+        unitiers = ['fabs', 'ceils', 'floor', 'frac', 'nint', 're', 'im', 'conj']
+        _exports = {}
+        for name in dir(mpmath):
+            if hasattr(mpmath.mp, name) or name == 'mp':
+                if name in globs:
+                    _exports[name] = globs[name]
+                elif name in purifiers:
+                    _exports[name] = purifier(name)
+                elif name in unitiers:
+                    _exports[name] = unitier(name)
+                else:
+                    _exports[name] = getattr(mpmath, name)
+        _exports["ufloat"] = ufloat
+        _exports["round"] = _exports["nint"]
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
+    global old_mpf_str
+    if old_mpf_str is None:
+        x = mpmath.mpf(1)
+        old_mpf_str = x.__class__.__str__
+        x.__class__.__str__ = new_mpf_str
+    mpmath.mp.pretty = True
+
+
+def deactivate():
+    """Restore the global state changed by `activate`."""
+    global old_mpf_str
+    if old_mpf_str is not None:
+        x = mpmath.mpf(1)
+        x.__class__.__str__ = old_mpf_str
+        old_mpf_str = None
+
+
 def load(namespace):
     """Load all mpmath defined functions, using when appropriate modified versions."""
-    global old_mpf_str
-    names = dir(mpmath)
-    globs = globals()
-    purifiers = ['sign', 'arg', 'isinf', 'isnan', 'isnormal', 'isfinite', 'isint']
-    unitiers = ['fabs', 'ceils', 'floor', 'frac', 'nint', 're', 'im', 'conj']
-    for name in names:
-        if hasattr(mpmath.mp, name) or name == 'mp':
-            if name in globs:
-                namespace[name] = globs[name]
-            elif name in purifiers:
-                namespace[name] = purifier(name)
-            elif name in unitiers:
-                namespace[name] = unitier(name)
-            else:
-                namespace[name] = getattr(mpmath, name)
-    x = mpmath.mpf(1)
-    old_mpf_str = x.__class__.__str__
-    x.__class__.__str__ = new_mpf_str
-    namespace["ufloat"] = ufloat
-    namespace["round"] = namespace["nint"]
-    namespace["mp"].pretty = True
+    activate()
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all mpmath defined functions."""
-    global old_mpf_str
-    names = dir(mpmath) + ["ufloat"]
-    x = mpmath.mpf(1)
-    x.__class__.__str__ = old_mpf_str
-    old_mpf_str = None
-    for name in names:
-        if hasattr(mpmath.mp, name):
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
-    namespace["round"] = _round
+    deactivate()
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
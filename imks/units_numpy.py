@@ -1,5 +1,5 @@
 import numpy
-from .units import Value
+from .units import Value, ScalarValue
 from .uparse import uparse
 
 
@@ -9,22 +9,6 @@ def numdoc(f):
     return f
 
 
-@numdoc
-def fabs(x):
-    if isinstance(x, Value):
-        return Value(numpy.fabs(x.value), x.unit)
-    else:
-        return numpy.fabs(x)
-
-
-@numdoc
-def sign(x):
-    if isinstance(x, Value):
-        return numpy.sign(x.value)
-    else:
-        return numpy.sign(x)
-
-
 @numdoc
 def real(x):
     if isinstance(x, Value):
@@ -41,45 +25,6 @@ def imag(x):
         return numpy.imag(x)
 
 
-@numdoc
-def conj(x):
-    if isinstance(x, Value):
-        return Value(numpy.conj(x.value), x.unit)
-    else:
-        return numpy.conj(x)
-
-
-# Powers and logarithms
-
-@numdoc
-def sqrt(x, **kwargs):
-    if isinstance(x, Value):
-        return Value(numpy.sqrt(x.value, **kwargs), x.unit / 2)
-    else:
-        return numpy.sqrt(x, **kwargs)
-
-
-@numdoc
-def square(x, **kwargs):
-    if isinstance(x, Value):
-        return Value(numpy.square(x.value, **kwargs), x.unit * 2)
-    else:
-        return numpy.square(x, **kwargs)
-
-
-# Trigonometric functions
-
-@numdoc
-def arctan2(y, x):
-    if isinstance(x, Value) or isinstance(y, Value):
-        x1 = Value(x)
-        y1 = Value(y)
-        x1.check_units(y1)
-        return numpy.arctan2(y1.value, x1.value)
-    else:
-        return numpy.arctan2(y, x)
-        
-
 def ufloat(s):
     """Convert a number in the format 12.2+/-0.3 into a Normal distribution."""
     v, u = uparse(s)
@@ -93,36 +38,46 @@ def value_getattr(self, attr):
     globs = globals()
     f = globs.get(attr, getattr(numpy, attr, None))
     if type(f) == numpy.ufunc:
-        if callable(f) and type(self) == Value: 
-            return lambda: f(self.check_pure(attr))
-        else:
-            return f
+        # Units are handled by Value.__array_ufunc__
+        return lambda: f(self)
     elif f is not None:
         return lambda: f(self)
     else:
         raise AttributeError
 
 
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        _exports = {}
+        for name in dir(numpy):
+            f = getattr(numpy, name)
+            if type(f) == numpy.ufunc:
+                _exports[name] = globs.get(name, f)
+        _exports["numpy"] = numpy
+        _exports["ufloat"] = ufloat
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
+    setattr(Value, "__getattr__", value_getattr)
+    setattr(ScalarValue, "__getattr__", value_getattr)
+
+
 def load(namespace):
     """Load all numpy defined functions, using when appropriate modified versions."""
-    names = dir(numpy)
-    globs = globals()
-    setattr(Value, "__getattr__", value_getattr)
-    for name in names:
-        f = getattr(numpy, name)
-        if type(f) == numpy.ufunc:
-            namespace[name] = globs.get(name, f)
-    namespace["numpy"] = numpy
-    namespace["ufloat"] = ufloat
+    activate()
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all numpy defined functions."""
-    names = dir(numpy) + ["numpy", "ufloat"]
-    for name in names:
-        f = getattr(numpy, name)
-        if type(f) == numpy.ufunc:
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
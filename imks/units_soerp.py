@@ -119,36 +119,49 @@ def ufloat_repr_latex(self):
 ######################################################################
 # Load and unload functions
 
-def load(namespace):
-    """Load all math defined functions, using when appropriate modified versions."""
-    globs = globals()
-    names = ["Beta", "Chi2", "Exp", "F", "Gamma", "LogN", "N", "T", "Tri",
-             "Weib"]
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, mconvert(getattr(soerp, name)))
-    names = dir(umath)
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, mconvert(getattr(umath, name)))
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        names = ["Beta", "Chi2", "Exp", "F", "Gamma", "LogN", "N", "T", "Tri",
+                 "Weib"]
+        _exports = {}
+        for name in names:
+            _exports[name] = globs[name] if name in globs else \
+                mconvert(getattr(soerp, name))
+        for name in dir(umath):
+            if name[0] != '_':
+                _exports[name] = globs[name] if name in globs else \
+                    mconvert(getattr(umath, name))
+        _exports["fraction"] = fraction
+        _exports["ufloat"] = ufloat
+        _exports["pi"] = math.pi
+        _exports["e"] = math.e
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
     soerp.UncertainVariable.__repr__ = soerp.UncertainFunction.__repr__ = \
         ufloat_repr
     soerp.UncertainVariable.__str__ = soerp.UncertainFunction.__str__ = \
         ufloat_repr
     soerp.UncertainVariable._repr_latex_ = \
         soerp.UncertainFunction._repr_latex_ = ufloat_repr_latex
-    namespace["fraction"] = fraction
-    namespace["ufloat"] = ufloat
-    namespace["pi"] = math.pi
-    namespace["e"] = math.e
+
+
+def load(namespace):
+    """Load all math defined functions, using when appropriate modified versions."""
+    activate()
+    namespace.update(exports())
 
 
 def unload(namespace):
     """Unload all math defined functions."""
-    names = dir(soerp) + dir(umath) + ["fraction", "float", "pi", "e"]
-    for name in names:
-        if name[0] != '_':
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""A vectorized engine for linear error propagation on arrays.
+
+The umath engine stores each number with uncertainty as an AffineScalarFunc
+of the uncertainties package, so that an array of them is an object array
+whose operations run element by element in Python.  This engine stores an
+array with uncertainty as a UArray: the nominal values, as a float array,
+and the first-order sensitivities to the independent sources of error, as a
+(number of values x number of sources) matrix.  The sensitivities are scaled
+by the standard deviations of the sources, so that the covariance matrix of
+the values is J J^T.  Operations are applied by numpy ufuncs to the nominal
+values and by a single matrix operation to the sensitivities; correlations
+are preserved, since the sources are shared: x - x is exactly zero.
+
+The matrix is dense for small arrays and, if scipy is available, a CSR
+sparse matrix when it would have more than `max_dense` entries: a UArray of
+n independent values, created by uarray, has a diagonal n x n matrix.
+
+> %imks -c uarray
+> x = uarray([1, 2, 3], [0.1, 0.1, 0.2]) * 1[m]
+> x - x.mean() --> ([-1.00+/-0.10 0.00+/-0.10 1.00+/-0.14])[m]
+
+Quantities with units are shown as arrays with errors, but cannot be indexed;
+the functions nominal_values, std_devs, covariance_matrix, and
+correlation_matrix extract their statistics.
+"""
+
+from __future__ import absolute_import, division, print_function
+import math
+import warnings
+import numpy as np
+import uncertainties
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from .units import Value, ScalarValue, Quantity
+from .units_math import fraction
+from .units_umath import ufloat_repr
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+# Maximum number of entries of a dense sensitivity matrix (if scipy is present)
+max_dense = 1 << 20
+
+# The last source of error created
+_last_source = 0
+
+
+def new_sources(n):
+    """Return the identifiers of n new independent sources of error."""
+    global _last_source
+    sources = np.arange(_last_source + 1, _last_source + n + 1)
+    _last_source += n
+    return sources
+
+
+def use_sparse(rows, cols):
+    """Check if a matrix of the given size should be sparse."""
+    return sparse is not None and rows * cols > max_dense
+
+
+def compact(jacobian):
+    """Convert a sparse matrix to a dense one, if it is small enough."""
+    if sparse is not None and sparse.issparse(jacobian) and \
+            not use_sparse(*jacobian.shape):
+        return jacobian.toarray()
+    return jacobian
+
+
+def scale_rows(jacobian, factors):
+    """Multiply each row of a matrix by the corresponding factor."""
+    if sparse is not None and sparse.issparse(jacobian):
+        result = jacobian.tocsr(copy=True)
+        result.data *= np.repeat(factors, np.diff(result.indptr))
+        return result
+    return jacobian * factors[:, np.newaxis]
+
+
+def expand_columns(jacobian, positions, ncols):
+    """Move the columns of a matrix to the given positions of a wider one."""
+    rows = jacobian.shape[0]
+    if sparse is not None and (sparse.issparse(jacobian) or
+                               use_sparse(rows, ncols)):
+        # The positions are increasing, so that the indices stay sorted
+        csr = sparse.csr_matrix(jacobian)
+        return sparse.csr_matrix((csr.data, positions[csr.indices], csr.indptr),
+                                 shape=(rows, ncols))
+    result = np.zeros((rows, ncols))
+    result[:, positions] = jacobian
+    return result
+
+
+def add_matrices(a, b):
+    """Add two matrices with the same shape, dense or sparse."""
+    if sparse is not None and (sparse.issparse(a) or sparse.issparse(b)):
+        if not use_sparse(*a.shape):
+            return compact(a) + compact(b)
+        return sparse.csr_matrix(a) + sparse.csr_matrix(b)
+    return a + b
+
+
+class UArray(NDArrayOperatorsMixin):
+    """An array of numbers with correlated uncertainties.
+
+    :ivar np.ndarray nominal:  the nominal values (an array, possibly 0-d)
+    :ivar jacobian:            the sensitivities of the values (flattened)
+                               to the sources, scaled by their standard
+                               deviations: a dense or a sparse matrix
+    :ivar np.ndarray sources:  the identifiers of the sources, sorted
+    """
+    __slots__ = ("nominal", "jacobian", "sources")
+
+    def __init__(self, nominal, jacobian, sources):
+        self.nominal = np.asarray(nominal, dtype=float)
+        self.jacobian = jacobian
+        self.sources = sources
+
+    @classmethod
+    def independent(cls, nominal, std_dev):
+        """Build an array of independent values.
+
+        :param nominal:  the nominal values
+        :param std_dev:  their standard deviations (broadcast to the shape
+                         of the nominal values)
+        :return UArray:  the new array, with a source for each value
+        """
+        nominal = np.array(nominal, dtype=float)
+        std_dev = np.broadcast_to(np.asarray(std_dev, dtype=float),
+                                  nominal.shape).ravel()
+        n = nominal.size
+        if use_sparse(n, n):
+            jacobian = sparse.diags(std_dev, format="csr")
+        else:
+            jacobian = np.diag(std_dev)
+        return cls(nominal, jacobian, new_sources(n))
+
+    def __getstate__(self):
+        return self.nominal, self.jacobian, self.sources
+
+    def __setstate__(self, state):
+        self.nominal, self.jacobian, self.sources = state
+
+    @property
+    def shape(self):
+        return self.nominal.shape
+
+    @property
+    def ndim(self):
+        return self.nominal.ndim
+
+    @property
+    def size(self):
+        return self.nominal.size
+
+    def __len__(self):
+        return len(self.nominal)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def __getitem__(self, key):
+        rows = np.arange(self.size).reshape(self.shape)[key]
+        return UArray(self.nominal[key], compact(self.jacobian[np.ravel(rows)]),
+                      self.sources)
+
+    def rows(self, shape):
+        """Return the sensitivities of the array broadcast to a shape."""
+        if self.shape == shape:
+            return self.jacobian
+        rows = np.broadcast_to(np.arange(self.size).reshape(self.shape), shape)
+        return self.jacobian[rows.ravel()]
+
+    @property
+    def nominal_value(self):
+        """The nominal values (a float for a 0-d array)."""
+        return self.nominal[()] if self.ndim == 0 else self.nominal
+
+    @property
+    def std_dev(self):
+        """The standard deviations (a float for a 0-d array)."""
+        j = self.jacobian
+        if sparse is not None and sparse.issparse(j):
+            var = np.asarray(j.multiply(j).sum(axis=1)).ravel()
+        else:
+            var = np.einsum("ij,ij->i", j, j)
+        std = np.sqrt(var).reshape(self.shape)
+        return std[()] if self.ndim == 0 else std
+
+    nominal_values = nominal_value
+    std_devs = std_dev
+
+    def covariance_matrix(self):
+        """Return the covariance matrix of the flattened values."""
+        c = self.jacobian.dot(self.jacobian.T)
+        return c.toarray() if sparse is not None and sparse.issparse(c) else c
+
+    def correlation_matrix(self):
+        """Return the correlation matrix of the flattened values."""
+        std = np.ravel(self.std_dev)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.covariance_matrix() / np.outer(std, std)
+
+    def sum(self, axis=None, **kwargs):
+        """Sum the values, over all of them or along an axis."""
+        nominal = self.nominal.sum(axis=axis)
+        j = self.jacobian
+        if axis is None:
+            if sparse is not None and sparse.issparse(j):
+                return UArray(nominal, np.asarray(j.sum(axis=0)), self.sources)
+            return UArray(nominal, j.sum(axis=0, keepdims=True), self.sources)
+        if sparse is not None and sparse.issparse(j):
+            groups = np.arange(nominal.size).reshape(nominal.shape)
+            groups = np.broadcast_to(np.expand_dims(groups, axis), self.shape)
+            matrix = sparse.csr_matrix((np.ones(self.size),
+                                        (groups.ravel(), np.arange(self.size))),
+                                       shape=(nominal.size, self.size))
+            return UArray(nominal, compact(matrix.dot(j)), self.sources)
+        j = j.reshape(self.shape + (-1,)).sum(axis=axis)
+        return UArray(nominal, j.reshape(nominal.size, -1), self.sources)
+
+    def mean(self, axis=None, **kwargs):
+        """Average the values, over all of them or along an axis."""
+        n = self.size if axis is None else self.shape[axis]
+        return self.sum(axis=axis) / n
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if any(isinstance(x, Quantity) for x in inputs):
+            # Units are handled first by Value.__array_ufunc__
+            return NotImplemented
+        out = kwargs.get("out", ())
+        if method == "reduce" and ufunc is np.add and not out:
+            return inputs[0].sum(axis=kwargs.get("axis", 0))
+        if method != "__call__" or any(not isinstance(o, UArray) for o in out):
+            return NotImplemented
+        nominals = [x.nominal if isinstance(x, UArray) else np.asarray(x)
+                    for x in inputs]
+        result = ufunc(*nominals)
+        if ufunc.__name__ in nominal_ufuncs:
+            return NotImplemented if out else result
+        derivatives = ufunc_derivatives.get(ufunc.__name__)
+        if derivatives is None:
+            return NotImplemented
+        if len(inputs) == 1:
+            terms = [(inputs[0], derivatives(nominals[0], result))]
+        else:
+            terms = list(zip(inputs, derivatives(nominals[0], nominals[1],
+                                                 result)))
+        result = propagate(result, [(x, d) for x, d in terms
+                                    if isinstance(x, UArray)])
+        if out:
+            # The output array is replaced, as its sources may change
+            out[0].__setstate__(result.__getstate__())
+            return out[0]
+        return result
+
+    def __bool__(self):
+        return bool(self.nominal)
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        std = self.std_dev
+        with warnings.catch_warnings():
+            # Exact results (with zero uncertainty) are shown as 0.0+/-0
+            warnings.simplefilter("ignore")
+            if self.ndim == 0:
+                return element_str(self.nominal[()], std)
+            index = np.arange(self.size).reshape(self.shape)
+            return np.array2string(index, separator=" ", formatter={
+                "int": lambda n: element_str(self.nominal.flat[n], std.flat[n])})
+
+    __repr__ = __str__
+
+    def _repr_latex_(self):
+        s = "${" + str(self).replace("+/-", "} \\pm {") + "}$"
+        return s.replace("e", r"} \times 10^{")
+
+
+def element_str(nominal, std_dev):
+    """Format a single number with uncertainty, as the umath engine."""
+    return ufloat_repr(uncertainties.ufloat(nominal, std_dev))
+
+
+def merge_sources(a, b):
+    """Return the union of two sorted arrays of sources."""
+    sources = np.concatenate((a, b))
+    sources.sort(kind="mergesort")
+    keep = np.empty(len(sources), dtype=bool)
+    keep[0] = True
+    np.not_equal(sources[1:], sources[:-1], out=keep[1:])
+    return sources[keep]
+
+
+def propagate(result, terms):
+    """Build the UArray of a result from its derivatives.
+
+    :param np.ndarray result:  the nominal values of the result
+    :param list terms:         a list of tuples (UArray, derivative), one for
+                               each argument with uncertainty
+    :return UArray:            the result
+    """
+    shape = np.shape(result)
+    size = int(np.prod(shape))
+    sources = terms[0][0].sources
+    for x, _ in terms[1:]:
+        if x.sources is not sources and not np.array_equal(x.sources, sources):
+            sources = merge_sources(sources, x.sources)
+    jacobian = None
+    for x, d in terms:
+        j = x.rows(shape)
+        if len(x.sources) != len(sources):
+            j = expand_columns(j, np.searchsorted(sources, x.sources),
+                               len(sources))
+        d = np.broadcast_to(d, shape).ravel() if np.ndim(d) else \
+            np.full(size, float(d))
+        j = scale_rows(j, d)
+        jacobian = j if jacobian is None else add_matrices(jacobian, j)
+    return UArray(result, compact(jacobian), sources)
+
+
+def safe_log(x):
+    """The logarithm of the positive numbers, 0 for the others."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(x > 0, np.log(np.where(x > 0, x, 1.0)), 0.0)
+
+
+def minmax_derivatives(x, y, r):
+    chosen = (r == x)
+    return chosen.astype(float), 1.0 - chosen
+
+
+# Derivatives of the ufuncs, as functions of the arguments and of the result
+ufunc_derivatives = {
+    "negative": lambda x, r: -1.0,
+    "positive": lambda x, r: 1.0,
+    "absolute": lambda x, r: np.sign(x),
+    "fabs": lambda x, r: np.sign(x),
+    "sqrt": lambda x, r: 0.5 / r,
+    "square": lambda x, r: 2 * x,
+    "cbrt": lambda x, r: 1 / (3 * r * r),
+    "reciprocal": lambda x, r: -r * r,
+    "exp": lambda x, r: r,
+    "exp2": lambda x, r: r * math.log(2),
+    "expm1": lambda x, r: r + 1,
+    "log": lambda x, r: 1 / x,
+    "log2": lambda x, r: 1 / (x * math.log(2)),
+    "log10": lambda x, r: 1 / (x * math.log(10)),
+    "log1p": lambda x, r: 1 / (1 + x),
+    "sin": lambda x, r: np.cos(x),
+    "cos": lambda x, r: -np.sin(x),
+    "tan": lambda x, r: 1 + r * r,
+    "arcsin": lambda x, r: 1 / np.sqrt(1 - x * x),
+    "arccos": lambda x, r: -1 / np.sqrt(1 - x * x),
+    "arctan": lambda x, r: 1 / (1 + x * x),
+    "sinh": lambda x, r: np.cosh(x),
+    "cosh": lambda x, r: np.sinh(x),
+    "tanh": lambda x, r: 1 - r * r,
+    "arcsinh": lambda x, r: 1 / np.sqrt(x * x + 1),
+    "arccosh": lambda x, r: 1 / np.sqrt(x * x - 1),
+    "arctanh": lambda x, r: 1 / (1 - x * x),
+    "deg2rad": lambda x, r: math.pi / 180,
+    "radians": lambda x, r: math.pi / 180,
+    "rad2deg": lambda x, r: 180 / math.pi,
+    "degrees": lambda x, r: 180 / math.pi,
+    "floor": lambda x, r: 0.0,
+    "ceil": lambda x, r: 0.0,
+    "trunc": lambda x, r: 0.0,
+    "rint": lambda x, r: 0.0,
+    "add": lambda x, y, r: (1.0, 1.0),
+    "subtract": lambda x, y, r: (1.0, -1.0),
+    "multiply": lambda x, y, r: (y, x),
+    "divide": lambda x, y, r: (1 / y, -r / y),
+    "true_divide": lambda x, y, r: (1 / y, -r / y),
+    "power": lambda x, y, r: (y * x ** (y - 1), r * safe_log(x)),
+    "float_power": lambda x, y, r: (y * x ** (y - 1), r * safe_log(x)),
+    "arctan2": lambda y, x, r: (x / (x * x + y * y), -y / (x * x + y * y)),
+    "hypot": lambda x, y, r: (x / r, y / r),
+    "maximum": minmax_derivatives,
+    "minimum": minmax_derivatives,
+    "fmax": minmax_derivatives,
+    "fmin": minmax_derivatives,
+}
+
+# Ufuncs applied to the nominal values only, returning plain arrays
+nominal_ufuncs = frozenset(("less", "less_equal", "greater", "greater_equal",
+                            "equal", "not_equal", "isnan", "isinf", "isfinite",
+                            "signbit", "sign"))
+
+
+######################################################################
+# Functions of the engine
+
+def uarray(nominal, std_dev):
+    """Build an array of independent numbers with uncertainty.
+
+    :param nominal:  the nominal values, a list, an array, or a Value array
+    :param std_dev:  the standard deviations, with the same unit
+    """
+    if isinstance(nominal, Quantity) or isinstance(std_dev, Quantity):
+        x, s = Value(nominal), Value(std_dev)
+        unit = x.check_units(s)
+        return Value(UArray.independent(x.value, s.value), unit,
+                     absolute=x.absolute)
+    return UArray.independent(nominal, std_dev)
+
+
+def ufloat(s):
+    """Convert a number in the format 12.2+/-0.3 into a quantity with error."""
+    if s.find("+/-") >= 0 or s.find("(") >= 0 or s.find(u"±") >= 0:
+        x = uncertainties.ufloat_fromstr(s)
+        return UArray.independent(x.nominal_value, x.std_dev)
+    else:
+        return float(s)
+
+
+def nominal_values(x):
+    """Return the nominal values of an array with uncertainty."""
+    if isinstance(x, Quantity):
+        return Value(nominal_values(x.value), x.unit, absolute=x.absolute)
+    return x.nominal_value if isinstance(x, UArray) else x
+
+
+def std_devs(x):
+    """Return the standard deviations of an array with uncertainty."""
+    if isinstance(x, Quantity):
+        return Value(std_devs(x.value), x.unit)
+    return x.std_dev if isinstance(x, UArray) else np.zeros(np.shape(x))
+
+
+def covariance_matrix(x):
+    """Return the covariance matrix of the values of an array."""
+    if isinstance(x, Quantity):
+        return Value(covariance_matrix(x.value), x.unit * 2)
+    return x.covariance_matrix()
+
+
+def correlation_matrix(x):
+    """Return the correlation matrix of the values of an array."""
+    if isinstance(x, Quantity):
+        x = x.value
+    return x.correlation_matrix()
+
+
+def log(x, base=None):
+    """Return the logarithm of x, in the given base (natural by default)."""
+    if base is None:
+        return np.log(x)
+    return np.log(x) / math.log(base)
+
+
+def value_getattr(self, attr):
+    """Give access to the reductions of a UArray with units, as x.sum()."""
+    if attr in ("sum", "mean") and isinstance(self.value, UArray):
+        f = getattr(self.value, attr)
+        return lambda *args, **kwargs: Value(f(*args, **kwargs), self.unit)
+    raise AttributeError(attr)
+
+
+######################################################################
+# Load and unload functions
+
+# Functions of the math module and the ufuncs implementing them
+math_ufuncs = {"acos": "arccos", "acosh": "arccosh", "asin": "arcsin",
+               "asinh": "arcsinh", "atan": "arctan", "atan2": "arctan2",
+               "atanh": "arctanh", "ceil": "ceil", "cos": "cos", "cosh": "cosh",
+               "degrees": "degrees", "exp": "exp", "expm1": "expm1",
+               "fabs": "fabs", "floor": "floor", "hypot": "hypot",
+               "isfinite": "isfinite", "isinf": "isinf", "isnan": "isnan",
+               "log10": "log10", "log1p": "log1p", "log2": "log2",
+               "pow": "power", "radians": "radians", "sin": "sin",
+               "sinh": "sinh", "sqrt": "sqrt", "tan": "tan", "tanh": "tanh",
+               "trunc": "trunc"}
+
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        _exports = dict((name, getattr(np, f)) for name, f in math_ufuncs.items())
+        for f in (log, fraction, ufloat, uarray, nominal_values, std_devs,
+                  covariance_matrix, correlation_matrix):
+            _exports[f.__name__] = f
+        _exports["pi"] = math.pi
+        _exports["e"] = math.e
+    return _exports
+
+
+# The __getattr__ of ScalarValue replaced by `activate` (False if none)
+old_getattr = None
+
+
+def activate():
+    """Set the global state used by the engine."""
+    global old_getattr
+    if old_getattr is None:
+        old_getattr = ScalarValue.__dict__.get("__getattr__", False)
+        ScalarValue.__getattr__ = value_getattr
+
+
+def deactivate():
+    """Restore the global state changed by `activate`."""
+    global old_getattr
+    if old_getattr is not None:
+        if old_getattr is False:
+            del ScalarValue.__getattr__
+        else:
+            ScalarValue.__getattr__ = old_getattr
+        old_getattr = None
+
+
+def load(namespace):
+    """Load all the functions of the engine."""
+    activate()
+    namespace.update(exports())
+
+
+def unload(namespace):
+    """Unload all the functions of the engine."""
+    deactivate()
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
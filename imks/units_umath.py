@@ -68,7 +68,7 @@ def fmod(x, y):
     if isinstance(x, Value) or isinstance(y, Value):
         x1 = Value(x)
         y1 = Value(y)
-        return Value(umath.fmod(x1.value, y1.value), x1.units - y1.units)
+        return Value(umath.fmod(x1.value, y1.value), x1.unit - y1.unit)
     else:
         return umath.fmod(x, y)
 
@@ -174,29 +174,41 @@ def ufloat_repr_latex(self):
 ######################################################################
 # Load and unload functions
 
-def load(namespace):
-    """Load all math defined functions, using when appropriate modified versions."""
-    global AffineScalarFunc
-    names = dir(umath)
-    globs = globals()
-    for name in names:
-        if name[0] != '_':
-            namespace[name] = globs.get(name, mconvert(getattr(umath, name)))
-    namespace["fraction"] = fraction
-    namespace["ufloat"] = ufloat
-    namespace["pi"] = math.pi
-    namespace["e"] = math.e
+_exports = None
+
+
+def exports():
+    """Return the functions of the engine, built at the first call."""
+    global _exports
+    if _exports is None:
+        globs = globals()
+        _exports = {}
+        for name in dir(umath):
+            if name[0] != '_':
+                _exports[name] = globs[name] if name in globs else \
+                    mconvert(getattr(umath, name))
+        _exports["fraction"] = fraction
+        _exports["ufloat"] = ufloat
+        _exports["pi"] = math.pi
+        _exports["e"] = math.e
+    return _exports
+
+
+def activate():
+    """Set the global state used by the engine."""
     AffineScalarFunc.__repr__ = ufloat_repr
     AffineScalarFunc.__str__ = ufloat_repr
     AffineScalarFunc._repr_latex_ = ufloat_repr_latex
 
 
+def load(namespace):
+    """Load all math defined functions, using when appropriate modified versions."""
+    activate()
+    namespace.update(exports())
+
+
 def unload(namespace):
     """Unload all math defined functions."""
-    names = dir(umath) + ["fraction", "ufloat", "pi", "e"]
-    for name in names:
-        if name[0] != '_':
-            try:
-                del namespace[name]
-            except KeyError:
-                pass
+    for name, f in exports().items():
+        if namespace.get(name) is f:
+            del namespace[name]
@@ -42,7 +42,6 @@ setup(name='imks',
       license='MIT',
       packages=['imks'],
       install_requires=[
-          'ply',
           'unidecode',
           'lxml',
           # next two lines should be
@@ -55,8 +54,10 @@ setup(name='imks',
         'numpy': ['numpy'],
         'mpmath': ['mpmath'],
         'uncertainties':  ['uncertainties'],
+        'uarray': ['numpy', 'uncertainties', 'scipy'],
         'soerp': ['soerp'],
-        'mcerp': ['mcerp']
+        'mcerp': ['mcerp'],
+        'benchmarks': ['ply']
       },
       tests_require=['nose'],
       test_suite='nose.collector',